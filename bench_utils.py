@@ -0,0 +1,618 @@
+import argparse
+import gzip
+import json
+import platform
+import random
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import instrument_utils as instrument
+
+# Stages of the knowledge graph pipeline which can be benchmarked, in order
+STAGES = ('scrape', 'clean', 'coref', 'extract', 'merge', 'prune', 'graph', 'layout')
+# Stages which need a Spacy pipeline (and model) to run
+NLP_STAGES = ('coref', 'extract')
+
+_VERBS = ['acquired', 'produces', 'develops', 'markets', 'founded', 'owns', 'licensed', 'sued',
+          'partnered with', 'invested in', 'manufactures', 'discovered']
+_FILLERS = ['the company', 'a new drug', 'its subsidiary', 'the market', 'several products',
+            'the government', 'a patent', 'the research team', 'the brand', 'its shareholders']
+_NAME_PARTS = ['Bayer', 'Monsanto', 'Aspirin', 'Pharma', 'Agro', 'Bio', 'Chem', 'Health', 'Crop',
+               'Science', 'Labs', 'Group', 'Holdings', 'Therapeutics', 'Genetics']
+
+
+class FakePage:
+    """Page of a `FakeWikiAPI`, with the attributes of a `wikipediaapi.WikipediaPage`
+    """
+    def __init__(self, title, data=None):
+        self.title = title
+        self._data = data
+
+    def exists(self):
+        return self._data is not None
+
+    @property
+    def text(self):
+        return self._data['text']
+
+    @property
+    def fullurl(self):
+        return self._data.get('link', 'https://en.wikipedia.org/wiki/' + self.title.replace(' ', '_'))
+
+    @property
+    def categories(self):
+        return {cat: None for cat in self._data.get('categories', [])}
+
+    @property
+    def links(self):
+        return {link: None for link in self._data.get('links', [])}
+
+    @property
+    def lastrevid(self):
+        return self._data.get('revid')
+
+
+class FakeWikiAPI:
+    """Local stand-in for Wikipedia, serving pages from memory
+
+    Pages are served as `wikipediaapi.Wikipedia` does (see `page`), or through
+    the MediaWiki query API (see `query`), locally over HTTP (see `serve`).
+
+    Parameters
+    ----------
+    pages : list
+        Pages as dicts with entries ('page', 'text') and optionally
+        ('link', 'categories', 'links', 'revid'), e.g. from `synthetic_corpus` or `load_fixture`
+    latency : float, optional
+        Simulated network latency (in seconds) per page request
+    """
+    # Limits of the MediaWiki API: titles per query, and categories/links per query with 'max'
+    MAX_TITLES = 50
+    MAX_LIMIT = 500
+
+    def __init__(self, pages, latency=0.0):
+        self.pages = {page['page']: page for page in pages}
+        self.latency = latency
+        self.n_requests = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def page(self, title):
+        self.n_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return FakePage(title, self.pages.get(title))
+
+    def query(self, params):
+        """Method to answer a MediaWiki API query (action=query, formatversion=2)
+
+        Supports the extracts, info, categories and links props of up to `MAX_TITLES` titles,
+        with the limits of the real API: full-text extracts (without 'exintro') are only
+        returned for one page per request, and categories and links for at most 'cllimit'
+        and 'pllimit' (up to `MAX_LIMIT`) entries per request across all pages. Other
+        entries are returned by following the continuation of the response.
+
+        Parameters
+        ----------
+        params : dict
+            Query string parameters of the request
+
+        Returns
+        -------
+        response : dict
+            JSON response of the API
+        """
+        with self._lock:
+            self.n_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        titles = params['titles'].split('|')
+        if len(titles) > self.MAX_TITLES:
+            return {'error': {'code': 'toomanyvalues', 'info': 'Too many values for parameter "titles"'}}
+        props = [prop for prop in params.get('prop', '').split('|') if prop]
+        # Props completed in previous requests of a continuation are skipped
+        done = set(params.get('continue', '').partition('||')[2].split('|'))
+
+        pages = [{'pageid': i + 1, 'ns': 0, 'title': title} if title in self.pages
+                 else {'ns': 0, 'title': title, 'missing': True} for i, title in enumerate(titles)]
+        found = [page for page in pages if not page.get('missing')]
+        cont = {}
+        if 'info' in props and 'info' not in done:
+            for page in found:
+                data = self.pages[page['title']]
+                page['lastrevid'] = data.get('revid', 0)
+                if 'url' in params.get('inprop', ''):
+                    page['fullurl'] = FakePage(page['title'], data).fullurl
+        if 'extracts' in props and 'extracts' not in done:
+            start = int(params.get('excontinue', 0))
+            limit = min(20, int(params.get('exlimit', 20))) if 'exintro' in params else 1
+            for page in found[start:start+limit]:
+                page['extract'] = self.pages[page['title']]['text']
+            if start + limit < len(found):
+                cont['excontinue'] = start + limit
+        for prop, prefix, key, ns in (('categories', 'cl', 'categories', 14), ('links', 'pl', 'links', 0)):
+            if prop not in props or prop in done:
+                continue
+            entries = [(page, title) for page in found for title in self.pages[page['title']].get(key, [])]
+            start = int(params.get(prefix + 'continue', 0))
+            limit = params.get(prefix + 'limit', '10')
+            limit = self.MAX_LIMIT if limit == 'max' else min(self.MAX_LIMIT, int(limit))
+            for page, title in entries[start:start+limit]:
+                page.setdefault(key, []).append({'ns': ns, 'title': title})
+            if start + limit < len(entries):
+                cont[prefix + 'continue'] = start + limit
+
+        response = {'batchcomplete': not cont, 'query': {'pages': pages}}
+        if cont:
+            prefixes = {'extracts': 'ex', 'categories': 'cl', 'links': 'pl'}
+            complete = [prop for prop in props if prefixes.get(prop, '-') + 'continue' not in cont]
+            response['continue'] = dict(cont, **{'continue': '||' + '|'.join(complete)})
+        return response
+
+    def serve(self, host='127.0.0.1', port=0):
+        """Method to serve `query` as a MediaWiki API endpoint over HTTP, from a background thread
+
+        Returns
+        -------
+        url : str
+            URL of the endpoint, e.g. for `api_url` of `scraper_utils.wiki_scrape_async`
+        """
+        import http.server
+        import socketserver
+        from urllib.parse import parse_qsl, urlsplit
+
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                try:
+                    status, body = 200, api.query(dict(parse_qsl(urlsplit(self.path).query)))
+                except Exception as e:
+                    status, body = 500, {'error': {'code': 'internal', 'info': repr(e)}}
+                body = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+
+        self._httpd = Server((host, port), Handler)
+        threading.Thread(target=self._httpd.serve_forever, name='fake-wiki-api', daemon=True).start()
+        host, port = self._httpd.server_address[:2]
+        return 'http://{}:{}/w/api.php'.format(host, port)
+
+    def stop(self):
+        """Method to stop serving (see `serve`)
+        """
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+def synthetic_corpus(n_pages=50, n_sentences=40, entity_density=0.5, n_entities=200, n_links=10, seed=0):
+    """Method to generate a synthetic corpus of Wikipedia-like articles
+
+    Sentences are built from (subject, verb, object) templates, where subjects and objects
+    are domain-specific entities with probability `entity_density` (otherwise generic
+    noun phrases), with Wikipedia markup handled by `kg_utils.clean_text`
+    (reference numbers, parenthesis, new-lines between paragraphs).
+    The first page links to all other pages, so that a crawl of depth 1 from it reaches
+    the whole corpus.
+
+    Parameters
+    ----------
+    n_pages : int, optional
+        Number of articles
+    n_sentences : int, optional
+        Number of sentences per article
+    entity_density : float, optional
+        Probability for each subject/object of being a domain-specific entity
+    n_entities : int, optional
+        Number of distinct domain-specific entities
+    n_links : int, optional
+        Number of links from each article (besides the first) to other articles
+    seed : int, optional
+        Random seed
+
+    Returns
+    -------
+    pages : list
+        Pages as dicts with entries ('page', 'text', 'link', 'categories', 'links', 'revid')
+    entities : list
+        Domain-specific entities, to be used as `global_ents_list`
+    """
+    rng = random.Random(seed)
+    entities = sorted(set(' '.join(rng.sample(_NAME_PARTS, rng.randint(1, 3))) + ' ' + str(i)
+                          for i in range(n_entities)))
+    titles = ['Synthetic Article {}'.format(i) for i in range(n_pages)]
+
+    def phrase():
+        return rng.choice(entities) if rng.random() < entity_density else rng.choice(_FILLERS)
+
+    pages = []
+    for i, title in enumerate(titles):
+        sentences = []
+        for j in range(n_sentences):
+            sentence = '{} {} {}'.format(phrase(), rng.choice(_VERBS), phrase())
+            if rng.random() < 0.3:
+                sentence += ' in {}'.format(rng.randint(1850, 2020))
+            if rng.random() < 0.2:
+                sentence += ' (see also {})'.format(rng.choice(entities))
+            sentence = sentence[0].upper() + sentence[1:] + '.'
+            if rng.random() < 0.3:
+                sentence += '[{}]'.format(rng.randint(1, 99))
+            # Paragraphs of about 5 sentences
+            sentences.append(sentence + ('\n' if j % 5 == 4 else ' '))
+        links = titles[1:] if i == 0 else rng.sample(titles, min(n_links, n_pages))
+        pages.append({
+            'page': title,
+            'text': ''.join(sentences).strip(),
+            'link': 'https://en.wikipedia.org/wiki/' + title.replace(' ', '_'),
+            'categories': ['Category:Synthetic articles'],
+            'links': links,
+            'revid': i + 1,
+        })
+    return pages, entities
+
+
+def synthetic_triplets(n_triplets=100000, n_entities=5000, n_relations=200, seed=0):
+    """Method to generate random S-R-O triplets, with Zipf-distributed entity frequencies
+
+    Entity names include extensions of one another (e.g. 'bayer 1' and 'bayer 1 ag'),
+    so that `kg_utils.merge_duplicate_subjs` has duplicates to merge.
+
+    Returns
+    -------
+    triplets : pd.DataFrame
+        S-R-O triplets dataframe
+    """
+    rng = np.random.RandomState(seed)
+    names = np.array(['entity {}'.format(i) for i in range(n_entities)], dtype=object)
+    names[1::4] = names[0::4][:len(names[1::4])] + ' ag'
+    relations = np.array(['relation {}'.format(i) for i in range(n_relations)], dtype=object)
+    subjects = (rng.zipf(1.5, n_triplets) - 1) % n_entities
+    objects = (rng.zipf(1.5, n_triplets) - 1) % n_entities
+    return pd.DataFrame({'subject': names[subjects], 'relation': relations[rng.randint(0, n_relations, n_triplets)],
+                         'object': names[objects]})
+
+
+def save_fixture(pages, path, entities=None):
+    """Method to save pages (and optionally domain-specific entities) as a JSON fixture
+
+    Fixtures are gzip-compressed if `path` ends with '.gz'.
+    """
+    data = json.dumps({'pages': list(pages), 'entities': list(entities or [])})
+    if path.endswith('.gz'):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(data)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(data)
+
+
+def load_fixture(path):
+    """Method to load pages saved with `save_fixture` (or a JSON list of scraped pages)
+
+    Returns
+    -------
+    pages : list
+        Pages as dicts with entries ('page', 'text', ...)
+    entities : list
+        Domain-specific entities
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data, []
+    return data['pages'], data.get('entities', [])
+
+
+def rss_mb():
+    """Helper function to get the current resident set size of this process (in MB)
+
+    Read with psutil if installed, otherwise from /proc (Linux); None if unavailable.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _RSSSampler:
+    """Context manager sampling the RSS of this process from a background thread, for the peak of a stage
+
+    Unlike `ru_maxrss`, which is the peak over the lifetime of the process, the peak is only
+    taken over the samples of the stage (and at its start and end).
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start = self.peak = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        rss = rss_mb()
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start = rss_mb()
+        self.peak = self.start
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+
+def _measure(results, stage, func, n_items=None):
+    """Helper function to time a stage, recording its throughput and its own peak RSS
+
+    The peak RSS of the stage (peak_rss_mb) is sampled while it runs, and reported along 
+    with its increase over the RSS at the start of the stage (peak_rss_delta_mb). Memory of 
+    worker processes (e.g. of multi-process extraction) is not included.
+    """
+    with _RSSSampler() as rss:
+        start = time.perf_counter()
+        output = func()
+        seconds = time.perf_counter() - start
+    results[stage] = {'seconds': seconds, 'peak_rss_mb': rss.peak,
+                      'peak_rss_delta_mb': rss.peak - rss.start if rss.peak is not None else None}
+    if n_items is not None:
+        results[stage]['items'] = n_items
+        results[stage]['items_per_sec'] = n_items / seconds if seconds > 0 else float('inf')
+    return output
+
+
+def run_benchmark(pages, global_ents_list, stages=STAGES, nlp=None, n_process=1, batch_size=32,
+                  n_triplets=100000, layout_iterations=30, verbose=True):
+    """Method to benchmark each stage of the knowledge graph pipeline on a corpus
+
+    Parameters
+    ----------
+    pages : list
+        Pages as dicts with entries ('page', 'text', ...), see `synthetic_corpus` and `load_fixture`
+    global_ents_list : list
+        Domain-specific entities
+    stages : tuple, optional
+        Stages to run, among `STAGES`
+    nlp : spacy.language.Language, optional
+        Spacy pipeline for the coref/extract stages, defaults to `model_utils.get_nlp()`
+    n_process : int, optional
+        Number of worker processes for extraction
+    batch_size : int, optional
+        Number of documents buffered per `nlp.pipe` batch
+    n_triplets : int, optional
+        Number of synthetic triplets used by the merge/prune/graph stages
+        when the extract stage is not run
+    layout_iterations : int, optional
+        Number of iterations of the layout stage
+    verbose : bool, optional
+        Flag for printing results of each stage
+
+    Returns
+    -------
+    results : dict
+        Timing (seconds), throughput (items and items_per_sec, where items are documents
+        for scrape/clean/coref/extract and triplets otherwise), peak RSS during the stage (peak_rss_mb)
+        and its increase over the RSS at the start of the stage (peak_rss_delta_mb)
+        of each stage run, with 'triplets_per_sec' for the extract stage, and the number of 
+        aggregated edges (see `graph_utils.aggregated_graph`) for the graph stage
+    """
+    from kg_utils import (clean_text, extract_triplets_corpus, merge_duplicate_subjs, prune_infreq_subjects,
+                          prune_infreq_objects, prune_self_loops, resolve_docs)
+    from graph_utils import GraphIndex, aggregated_graph, force_layout
+    from scraper_utils import wiki_scrape
+
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError("Unknown stages: {}".format(sorted(unknown)))
+    if nlp is None and any(stage in NLP_STAGES for stage in stages):
+        from model_utils import get_nlp
+        nlp = get_nlp()
+
+    results = {}
+    wiki_data = pd.DataFrame(pages)
+    n_docs = len(wiki_data)
+
+    if 'scrape' in stages:
+        wiki_api = FakeWikiAPI(pages)
+        _measure(results, 'scrape', lambda: wiki_scrape(pages[0]['page'], verbose=False, wiki_api=wiki_api),
+                 n_docs)
+    if 'clean' in stages:
+        texts = _measure(results, 'clean', lambda: [clean_text(text) for text in wiki_data.text], n_docs)
+    else:
+        texts = [clean_text(text) for text in wiki_data.text]
+    if 'coref' in stages:
+        _measure(results, 'coref', lambda: [len(doc) for doc in resolve_docs(texts, batch_size, nlp)], n_docs)
+
+    if 'extract' in stages:
+        triplets = _measure(results, 'extract', lambda: extract_triplets_corpus(
+            wiki_data, global_ents_list, n_process=n_process, batch_size=batch_size, nlp=nlp), n_docs)
+        results['extract']['triplets'] = len(triplets)
+        results['extract']['triplets_per_sec'] = len(triplets) / results['extract']['seconds']
+    else:
+        triplets = synthetic_triplets(n_triplets)
+
+    if 'merge' in stages:
+        triplets = _measure(results, 'merge', lambda: merge_duplicate_subjs(triplets.copy()), len(triplets))
+    if 'prune' in stages:
+        n_triplets = len(triplets)
+        triplets = _measure(results, 'prune', lambda: prune_self_loops(
+            prune_infreq_objects(prune_infreq_subjects(triplets))), n_triplets)
+    if 'graph' in stages:
+        k_graph = _measure(results, 'graph', lambda: aggregated_graph(triplets), len(triplets))
+        results['graph']['edges'] = k_graph.number_of_edges()
+    if 'layout' in stages:
+        index = GraphIndex(triplets)
+        _measure(results, 'layout', lambda: force_layout(index, iterations=layout_iterations), len(triplets))
+        results['layout']['nodes'] = index.n_nodes
+
+    if verbose:
+        for stage, result in results.items():
+            print("{:>8}: {:8.3f}s {:>12} {:>10} {:>12}".format(
+                stage, result['seconds'],
+                "{:.1f}/s".format(result['items_per_sec']) if 'items_per_sec' in result else "",
+                "{:.1f} MB".format(result['peak_rss_mb']) if result['peak_rss_mb'] is not None else "",
+                "(+{:.1f} MB)".format(result['peak_rss_delta_mb']) if result['peak_rss_delta_mb'] is not None else ""))
+    return results
+
+
+def scaling_curve(sizes, stages=STAGES, corpus_kwargs=None, verbose=True, **kwargs):
+    """Method to benchmark the pipeline on synthetic corpora of increasing size
+
+    Parameters
+    ----------
+    sizes : list
+        Numbers of pages of each synthetic corpus; synthetic triplets for the
+        merge/prune/graph stages (without extract stage) are scaled accordingly
+    stages : tuple, optional
+        Stages to run, among `STAGES`
+    corpus_kwargs : dict, optional
+        Options passed to `synthetic_corpus`
+    **kwargs
+        Options passed to `run_benchmark`
+
+    Returns
+    -------
+    curve : list
+        Results of `run_benchmark` for each size, with entry 'n_pages'
+    """
+    curve = []
+    for n_pages in sizes:
+        pages, entities = synthetic_corpus(n_pages, **(corpus_kwargs or {}))
+        if verbose:
+            print("\n{} pages:".format(n_pages))
+        results = run_benchmark(pages, entities, stages, n_triplets=n_pages * 1000, verbose=verbose, **kwargs)
+        curve.append({'n_pages': n_pages, 'stages': results})
+    return curve
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Method to compare benchmark results with baseline results
+
+    A stage regresses when it is more than `tolerance` (relative) slower than in the baseline.
+
+    Returns
+    -------
+    regressions : list
+        List of (stage, baseline seconds, seconds, ratio) tuples for stages which regressed
+    """
+    regressions = []
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+        base = baseline[stage]['seconds']
+        ratio = result['seconds'] / base if base > 0 else float('inf')
+        if ratio > 1 + tolerance:
+            regressions.append((stage, base, result['seconds'], ratio))
+    return regressions
+
+
+def environment():
+    """Helper function to describe the environment results were obtained in
+    """
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'numpy': np.__version__, 'pandas': pd.__version__,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the knowledge graph pipeline")
+    parser.add_argument('--fixture', help="JSON fixture of pages to benchmark on (see save_fixture), "
+                                          "e.g. tests/fixtures/bench_pages.json")
+    parser.add_argument('--save-fixture', help="Path for saving the synthetic corpus as a fixture")
+    parser.add_argument('--pages', type=int, default=50, help="Number of synthetic pages")
+    parser.add_argument('--sentences', type=int, default=40, help="Number of sentences per synthetic page")
+    parser.add_argument('--entity-density', type=float, default=0.5,
+                        help="Probability of subjects/objects being domain-specific entities")
+    parser.add_argument('--stages', default=','.join(STAGES), help="Comma-separated stages to run")
+    parser.add_argument('--skip-nlp', action='store_true', help="Skip stages which need a Spacy model")
+    parser.add_argument('--n-process', type=int, default=1, help="Number of extraction worker processes")
+    parser.add_argument('--batch-size', type=int, default=32, help="nlp.pipe batch size")
+    parser.add_argument('--triplets', type=int, default=100000,
+                        help="Number of synthetic triplets when the extract stage is not run")
+    parser.add_argument('--sizes', help="Comma-separated numbers of pages, for a scaling curve")
+    parser.add_argument('--output', help="Path of JSON results")
+    parser.add_argument('--baseline', help="Path of JSON baseline results to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Relative slowdown counted as regression")
+    parser.add_argument('--metrics', help="Path for also recording instrumentation metrics (counters and "
+                                          "timers), as Prometheus text if ending with '.prom', else JSON lines")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        sink = (instrument.PrometheusSink(args.metrics) if args.metrics.endswith('.prom') 
+                else instrument.JSONLinesSink(args.metrics))
+        instrument.enable(sink)
+
+    stages = tuple(stage for stage in args.stages.split(',') if stage)
+    if args.skip_nlp:
+        stages = tuple(stage for stage in stages if stage not in NLP_STAGES)
+    corpus_kwargs = {'n_sentences': args.sentences, 'entity_density': args.entity_density}
+    report = {'environment': environment(), 'args': vars(args)}
+
+    if args.sizes:
+        sizes = [int(size) for size in args.sizes.split(',')]
+        report['scaling'] = scaling_curve(sizes, stages, corpus_kwargs, n_process=args.n_process,
+                                          batch_size=args.batch_size)
+        # Largest corpus is compared with the baseline
+        report['stages'] = report['scaling'][-1]['stages']
+    else:
+        if args.fixture:
+            pages, entities = load_fixture(args.fixture)
+        else:
+            pages, entities = synthetic_corpus(args.pages, **corpus_kwargs)
+        if args.save_fixture:
+            save_fixture(pages, args.save_fixture, entities)
+        report['stages'] = run_benchmark(pages, entities, stages, n_process=args.n_process,
+                                         batch_size=args.batch_size, n_triplets=args.triplets)
+
+    if args.metrics:
+        report['metrics'] = instrument.snapshot()
+        instrument.flush()
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report['stages'], baseline['stages'], args.tolerance)
+        report['regressions'] = [dict(zip(('stage', 'baseline_seconds', 'seconds', 'ratio'), regression))
+                                 for regression in regressions]
+        for stage, base, seconds, ratio in regressions:
+            print("Regression in {}: {:.3f}s -> {:.3f}s ({:.2f}x)".format(stage, base, seconds, ratio))
+        status = 1 if regressions else 0
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Maximum number of variables per SQLite query (the default limit of older SQLite versions)
+_MAX_VARIABLES = 999
+
+
+class SentenceCache:
+    """Two-tier memoization cache of extraction features
+
+    Entries are kept in an in-memory LRU of at most `max_items` entries,
+    backed (optionally) by a SQLite database of zlib-compressed JSON, whose
+    least recently used entries are evicted to keep it under `max_bytes`.
+    Keys are hashes of the (coreference-resolved) text of a window of sentences 
+    along with the model and extraction parameters (see `SentenceCache.key` and 
+    `kg_utils._text_features`), so that any change to them invalidates cached entries.
+    Entries are looked up and stored in batches (see `get_many` and `put_many`), 
+    with one database transaction per batch.
+
+    The cache can be inherited by forked worker processes, or pickled: each process
+    re-opens its own database connection, and keeps its own counters.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path to SQLite database file, memory-only cache if None
+    max_items : int, optional
+        Maximum number of entries kept in memory
+    max_bytes : int, optional
+        Maximum total size of compressed entries on disk, unbounded if None
+    """
+    def __init__(self, path='sentence_cache.sqlite', max_items=10000, max_bytes=None):
+        self.path = path
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._size = 0
+
+    @staticmethod
+    def key(text, *params):
+        """Method to build the cache key of a text (e.g. a window of sentences) for given model/extraction parameters
+        """
+        return hashlib.sha1(json.dumps([text, params]).encode('utf-8')).hexdigest()
+
+    def _connect(self):
+        """Helper function to (re-)open the database connection in the current process
+        """
+        if self.path is None:
+            return None
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sentences (
+                    key TEXT PRIMARY KEY,
+                    accessed_at REAL,
+                    size INTEGER,
+                    data BLOB
+                )""")
+            self._conn.commit()
+            self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM sentences").fetchone()[0]
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        """Method to look up a cached entry, returning None if it is not cached
+        """
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """Method to look up cached entries, with one database query and transaction
+
+        Returns
+        -------
+        values : list
+            Cached entries, None for entries which are not cached
+        """
+        with self._lock:
+            values = [self._memory.get(key) for key in keys]
+            for key, value in zip(keys, values):
+                if value is not None:
+                    self._memory.move_to_end(key)
+            missing = [key for key, value in zip(keys, values) if value is None]
+            conn = self._connect()
+            rows = {}
+            if conn is not None and missing:
+                for i in range(0, len(missing), _MAX_VARIABLES):
+                    chunk = missing[i:i+_MAX_VARIABLES]
+                    rows.update(conn.execute("SELECT key, data FROM sentences WHERE key IN ({})".format(
+                        ",".join("?" * len(chunk))), chunk))
+                if rows:
+                    # Update access times of entries read from disk (for eviction) in one transaction
+                    now = time.time()
+                    conn.executemany("UPDATE sentences SET accessed_at=? WHERE key=?", 
+                                     [(now, key) for key in rows])
+                    conn.commit()
+            for i, key in enumerate(keys):
+                if values[i] is None and key in rows:
+                    values[i] = json.loads(zlib.decompress(rows[key]).decode('utf-8'))
+                    self._remember(key, values[i])
+                    self.disk_hits += 1
+            n_missing = sum(value is None for value in values)
+            self.hits += len(keys) - n_missing
+            self.misses += n_missing
+            return values
+
+    def put(self, key, value):
+        """Method to store a (JSON-serializable) entry in memory and on disk
+        """
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        """Method to store (key, JSON-serializable entry) pairs in memory and on disk, in one transaction
+        """
+        items = list(items)
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value)
+            conn = self._connect()
+            if conn is None or not items:
+                return
+            now = time.time()
+            rows = [(key, now, blob) for key, blob in 
+                    dict((key, zlib.compress(json.dumps(value).encode('utf-8'))) for key, value in items).items()]
+            for i in range(0, len(rows), _MAX_VARIABLES):
+                chunk = [key for key, _, _ in rows[i:i+_MAX_VARIABLES]]
+                self._size -= conn.execute("SELECT COALESCE(SUM(size), 0) FROM sentences WHERE key IN ({})".format(
+                    ",".join("?" * len(chunk))), chunk).fetchone()[0]
+            conn.executemany("INSERT OR REPLACE INTO sentences (key, accessed_at, size, data) VALUES (?, ?, ?, ?)",
+                             [(key, accessed_at, len(blob), blob) for key, accessed_at, blob in rows])
+            self._size += sum(len(blob) for _, _, blob in rows)
+            self._evict()
+            conn.commit()
+
+    def _remember(self, key, value):
+        """Helper function to add an entry to the in-memory LRU
+        """
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """Helper function to evict least recently used entries on disk above `max_bytes`
+        """
+        if self.max_bytes is None or self._size <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM sentences ORDER BY accessed_at")
+        evicted = []
+        for key, size in rows:
+            if self._size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM sentences WHERE key=?", evicted)
+
+    def stats(self):
+        """Method to get hit/miss counters of this process
+
+        Returns
+        -------
+        stats : dict
+            Number of hits (of which served from disk), misses, and hit rate
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0}
+
+    def clear(self):
+        """Method to drop all cached entries, and reset counters
+        """
+        with self._lock:
+            self._memory.clear()
+            conn = self._connect()
+            if conn is not None:
+                conn.execute("DELETE FROM sentences")
+                conn.commit()
+                self._size = 0
+            self.hits = self.disk_hits = self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return len(self._memory)
+            return conn.execute("SELECT COUNT(*) FROM sentences").fetchone()[0]
+
+    def __getstate__(self):
+        # Only settings are pickled (e.g. for workers started with 'spawn'): 
+        # the connection is re-opened, and entries in memory and counters are not shared
+        return {'path': self.path, 'max_items': self.max_items, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn, self._pid = None, None
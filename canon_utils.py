@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+
+from model_utils import get_nlp
+from store_utils import TripletStore
+
+
+def embed_strings(strings, nlp=None):
+    """Method to embed strings as the mean word vector of their words, in one batch
+
+    Each distinct word is looked up once in the vectors table of the pipeline
+    (e.g. of `en_core_web_lg`), and the vectors of all strings are computed
+    at once as sums over the rows of the word vectors matrix.
+
+    Parameters
+    ----------
+    strings : list
+        List of strings (e.g. unique entities or relations), with whitespace-separated words
+    nlp : spacy.language.Language, optional
+        Spacy pipeline with word vectors, defaults to `model_utils.get_nlp()`
+
+    Returns
+    -------
+    vectors : np.ndarray
+        Unit-normalized vectors of strings, of shape (len(strings), vector width),
+        with zero vectors for strings without any word vector
+    has_vector : np.ndarray
+        Boolean flags of strings with at least one word vector
+    """
+    if nlp is None:
+        nlp = get_nlp()
+    table = nlp.vocab.vectors
+    width = table.shape[1]
+
+    # (string, word) pairs, and rows of distinct words in the vectors table
+    words = [string.split() for string in strings]
+    lengths = np.fromiter((len(string_words) for string_words in words), dtype=np.int64, count=len(words))
+    word_codes, uniques = pd.factorize(np.fromiter(
+        (word for string_words in words for word in string_words), dtype=object, count=int(lengths.sum())))
+    if len(uniques) and width:
+        unique_rows = np.asarray(table.find(keys=[nlp.vocab.strings.add(word) for word in uniques]))
+    else:
+        unique_rows = np.full(len(uniques), -1)
+    rows = unique_rows[word_codes] if len(word_codes) else np.zeros(0, dtype=np.int64)
+    string_ids = np.repeat(np.arange(len(strings)), lengths)
+
+    # Sum the vectors of the words of each string
+    found = rows >= 0
+    vectors = np.zeros((len(strings), width), dtype=np.float32)
+    np.add.at(vectors, string_ids[found], np.asarray(table.data)[rows[found]])
+    norms = np.linalg.norm(vectors, axis=1)
+    has_vector = norms > 0
+    vectors[has_vector] /= norms[has_vector, None]
+    return vectors, has_vector
+
+
+def similar_pairs(vectors, threshold=0.8, n_planes=10, n_tables=16, max_block_size=500, seed=0):
+    """Method to find pairs of similar vectors with locality-sensitive hashing
+
+    Vectors are hashed by the signs of their projections on `n_planes` random
+    hyperplanes, so that vectors with a small angle between them likely share
+    a bucket, and only vectors sharing a bucket in any of `n_tables` hash tables
+    are compared. This approximates all pairs with a cosine similarity of at
+    least `threshold` without comparing all pairs. With the default settings,
+    about 90% of pairs with a similarity just above 0.8 are found.
+
+    Parameters
+    ----------
+    vectors : np.ndarray
+        Unit-normalized vectors, of shape (n, width)
+    threshold : float, optional
+        Minimum cosine similarity of pairs
+    n_planes : int, optional
+        Number of hyperplanes (bits) per hash table: more planes give smaller buckets
+    n_tables : int, optional
+        Number of hash tables: more tables find more of the similar pairs
+    max_block_size : int, optional
+        Buckets with more vectors than this are split into blocks of this size
+    seed : int, optional
+        Seed of random hyperplanes
+
+    Returns
+    -------
+    pairs : np.ndarray
+        Array of shape (m, 2) of distinct index pairs (i < j) of similar vectors
+    """
+    n = len(vectors)
+    if n < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    rng = np.random.RandomState(seed)
+    powers = 1 << np.arange(n_planes, dtype=np.int64)
+    found = []
+    for _ in range(n_tables):
+        planes = rng.standard_normal((vectors.shape[1], n_planes)).astype(vectors.dtype)
+        keys = ((vectors @ planes) > 0) @ powers
+        order = np.argsort(keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for block in np.split(order, bounds):
+            for start in range(0, len(block), max_block_size):
+                members = block[start:start+max_block_size]
+                if len(members) < 2:
+                    continue
+                sims = vectors[members] @ vectors[members].T
+                a, b = np.nonzero(np.triu(sims >= threshold, k=1))
+                if len(a):
+                    found.append(np.stack([members[a], members[b]], axis=1))
+    if not found:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.sort(np.concatenate(found), axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def connected_components(n, pairs):
+    """Method to label the connected components of a graph given as index pairs
+
+    Labels are propagated along pairs with vectorized min-label updates and
+    pointer jumping (a vectorized union-find), until no label changes.
+
+    Returns
+    -------
+    labels : np.ndarray
+        Component label (smallest member index) of each of the `n` nodes
+    """
+    labels = np.arange(n)
+    if len(pairs) == 0:
+        return labels
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        smallest = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        np.minimum.at(updated, labels[a], smallest)
+        np.minimum.at(updated, labels[b], smallest)
+        # Pointer jumping, until all nodes point to the root of their tree
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def canonical_map(strings, counts, nlp=None, threshold=0.8, **kwargs):
+    """Method to cluster near-duplicate strings by word vector similarity
+
+    Strings are embedded (see `embed_strings`), pairs of strings with a cosine
+    similarity of at least `threshold` are found (see `similar_pairs`), and each
+    connected component of similar strings is represented by its most frequent
+    (then shortest) string, as in `kg_utils.merge_duplicate_subjs`.
+    Strings without word vectors are kept as is.
+
+    Parameters
+    ----------
+    strings : list
+        List of distinct strings
+    counts : np.ndarray
+        Frequency of each string
+    nlp : spacy.language.Language, optional
+        Spacy pipeline with word vectors, defaults to `model_utils.get_nlp()`
+    threshold : float, optional
+        Minimum cosine similarity of near-duplicates
+    **kwargs
+        LSH options passed to `similar_pairs`
+
+    Returns
+    -------
+    mapping : np.ndarray
+        Index of the representative string for each string
+    """
+    vectors, has_vector = embed_strings(strings, nlp)
+    candidates = np.flatnonzero(has_vector)
+    pairs = candidates[similar_pairs(vectors[candidates], threshold, **kwargs)]
+    labels = connected_components(len(strings), pairs)
+
+    # Most frequent, then shortest, then first in alphabetical order
+    counts = np.asarray(counts)
+    lengths = np.fromiter((len(string) for string in strings), dtype=np.int64, count=len(strings))
+    alphabetical = np.argsort(np.argsort(np.asarray(strings, dtype=object), kind='stable'), kind='stable')
+    order = np.lexsort((alphabetical, lengths, -counts, labels))
+    # First string of each component in this order is its representative
+    sorted_labels = labels[order]
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = sorted_labels[1:] != sorted_labels[:-1]
+    representative = np.zeros(len(strings), dtype=np.int64)
+    representative[sorted_labels[is_first]] = order[is_first]
+    return representative[labels]
+
+
+def canonicalize_triplets(triplets, nlp=None, entities=True, relations=True,
+                          entity_threshold=0.9, relation_threshold=0.8, **kwargs):
+    """Method to rewrite entities and relations of triplets to canonical near-duplicates
+
+    Distinct entities (subjects and objects) and distinct relations are clustered
+    separately by word vector similarity (see `canonical_map`), e.g. 'acquire',
+    'acquire stake' and 'buy' are all rewritten to the most frequent of them,
+    so that their triplets become parallel edges of the same relation.
+    Entities and relations are only embedded once per distinct string.
+
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore
+        S-R-O triplets dataframe
+    nlp : spacy.language.Language, optional
+        Spacy pipeline with word vectors (e.g. `en_core_web_lg`),
+        defaults to `model_utils.get_nlp()`
+    entities : bool, optional
+        Flag for canonicalizing subjects and objects
+    relations : bool, optional
+        Flag for canonicalizing relations
+    entity_threshold : float, optional
+        Minimum cosine similarity of near-duplicate entities
+    relation_threshold : float, optional
+        Minimum cosine similarity of near-duplicate relations
+    **kwargs
+        LSH options passed to `similar_pairs`
+
+    Returns
+    -------
+    triplets : pd.DataFrame or store_utils.TripletStore
+        Triplets with canonical entities and relations
+    """
+    if len(triplets) == 0:
+        return triplets
+    if nlp is None:
+        nlp = get_nlp()
+
+    if isinstance(triplets, TripletStore):
+        columns = {}
+        if entities:
+            counts = triplets.subject_counts() + triplets.object_counts()
+            used = np.flatnonzero(counts)
+            ids = np.arange(len(triplets.entities), dtype=np.int32)
+            ids[used] = used[canonical_map([triplets.entities[i] for i in used], counts[used], nlp,
+                                           entity_threshold, **kwargs)]
+            columns['subject'], columns['object'] = ids[triplets.subject], ids[triplets.object]
+        if relations:
+            counts = triplets.relation_counts()
+            used = np.flatnonzero(counts)
+            ids = np.arange(len(triplets.relations), dtype=np.int32)
+            ids[used] = used[canonical_map([triplets.relations[i] for i in used], counts[used], nlp,
+                                           relation_threshold, **kwargs)]
+            columns['relation'] = ids[triplets.relation]
+        return triplets.with_columns(**columns)
+
+    triplets = triplets.copy()
+    n = len(triplets)
+    if entities:
+        # Encode subjects and objects over a shared vocabulary
+        codes, uniques = pd.factorize(pd.concat([triplets.subject, triplets.object], ignore_index=True))
+        uniques = np.asarray(uniques, dtype=object)
+        mapping = canonical_map(list(uniques), np.bincount(codes, minlength=len(uniques)), nlp,
+                                entity_threshold, **kwargs)
+        triplets['subject'] = uniques[mapping][codes[:n]]
+        triplets['object'] = uniques[mapping][codes[n:]]
+    if relations:
+        codes, uniques = pd.factorize(triplets.relation)
+        uniques = np.asarray(uniques, dtype=object)
+        mapping = canonical_map(list(uniques), np.bincount(codes, minlength=len(uniques)), nlp,
+                                relation_threshold, **kwargs)
+        triplets['relation'] = uniques[mapping][codes]
+    return triplets
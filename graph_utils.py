@@ -0,0 +1,616 @@
+import collections
+import hashlib
+import html
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from store_utils import TripletStore
+
+# Most recently used layouts computed in this process, keyed by graph fingerprint and layout parameters
+_LAYOUTS = collections.OrderedDict()
+# Maximum number of layouts kept in memory (older ones are only kept in `cache_dir`)
+_MAX_LAYOUTS = 8
+
+
+class GraphIndex:
+    """Compressed index of a knowledge graph, for fast neighbourhood queries
+
+    Entities are mapped to contiguous ids, and the unique (subject, object)
+    edges are stored as CSR adjacency arrays in both directions (neighbours
+    of node `i` are `indices[indptr[i]:indptr[i+1]]`, sorted by id).
+    Relations (and source pages, if known) of all triplets are grouped by edge,
+    so that the relations between a subject and an object are found by binary
+    search, and repeated triplets are aggregated into weighted edges.
+    Build it once from the triplets and reuse it across queries.
+
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore
+        S-R-O triplets dataframe
+    """
+    def __init__(self, triplets):
+        if isinstance(triplets, TripletStore):
+            # Reuse the store's ids, remapped to the entities and relations still used by triplets
+            # (vocabularies are shared with the stores they were pruned or filtered from)
+            subjects, objects = triplets.subject, triplets.object
+            used = np.unique(np.concatenate([subjects, objects]))
+            src, dst = np.searchsorted(used, subjects), np.searchsorted(used, objects)
+            self.nodes = triplets.entities.index[used]
+            used_relations, rel = np.unique(triplets.relation, return_inverse=True)
+            self.relation_names = triplets.relations.index[used_relations]
+            page, self.page_names = triplets.page, triplets.pages.index
+        else:
+            codes, nodes = pd.factorize(
+                np.concatenate([triplets.subject.to_numpy(dtype=object), triplets.object.to_numpy(dtype=object)]))
+            src, dst = codes[:len(triplets)], codes[len(triplets):]
+            rel, relation_names = pd.factorize(triplets.relation.to_numpy(dtype=object))
+            self.nodes = pd.Index(nodes, dtype=object)
+            self.relation_names = pd.Index(relation_names, dtype=object)
+            page, self.page_names = None, None
+            if 'page' in triplets:
+                # Missing pages are coded as -1
+                page, page_names = pd.factorize(triplets.page.to_numpy(dtype=object))
+                self.page_names = pd.Index(page_names, dtype=object)
+        n = self.n_nodes = len(self.nodes)
+
+        # Sort triplets by edge (keeping their order within each edge), and find unique edges
+        keys = src.astype(np.int64) * n + dst
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+        edge_src = (keys[starts] // n).astype(np.int32)
+        edge_dst = (keys[starts] % n).astype(np.int32)
+        # Relations of edge `e` are `rel_codes[rel_indptr[e]:rel_indptr[e+1]]`
+        self.rel_codes = np.asarray(rel, dtype=np.int32)[order]
+        self.rel_indptr = np.r_[starts, len(keys)].astype(np.int64)
+        # Pages of triplets, grouped by edge as relations (None if unknown)
+        self.page_codes = np.asarray(page, dtype=np.int32)[order] if page is not None else None
+        self._distinct = {}
+
+        # Outgoing edges, sorted by subject then object: edge ids are positions in `out_indices`
+        self.out_indptr = np.r_[0, np.cumsum(np.bincount(edge_src, minlength=n))].astype(np.int64)
+        self.out_indices = edge_dst
+        # Incoming edges, sorted by object then subject, with their edge ids
+        in_order = np.argsort(edge_dst, kind='stable')
+        self.in_indptr = np.r_[0, np.cumsum(np.bincount(edge_dst, minlength=n))].astype(np.int64)
+        self.in_indices = edge_src[in_order]
+        self.in_edges = in_order.astype(np.int64)
+        self._fingerprint = None
+
+    def __len__(self):
+        return self.n_nodes
+
+    def __contains__(self, node):
+        return node in self.nodes
+
+    @property
+    def n_edges(self):
+        return len(self.out_indices)
+
+    @property
+    def edge_sources(self):
+        """Subject id of each edge, aligned with `out_indices`
+        """
+        return np.repeat(np.arange(self.n_nodes, dtype=np.int32), np.diff(self.out_indptr))
+
+    def degrees(self):
+        """Method to count unique neighbours (in or out) of each node, indexed by id
+        """
+        return np.diff(self.out_indptr) + np.diff(self.in_indptr)
+
+    def edge_weights(self):
+        """Method to count triplets of each edge, aligned with `out_indices`
+        """
+        return np.diff(self.rel_indptr)
+
+    def _distinct_per_edge(self, name):
+        """Helper function to group the distinct relations or pages of each edge (cached)
+
+        Returns
+        -------
+        indptr : np.ndarray
+            Values of edge `e` are `values[indptr[e]:indptr[e+1]]`
+        values : np.ndarray
+            Distinct codes of each edge, most frequent first (then in order of triplets);
+            missing values (code -1) are skipped
+        """
+        if name not in self._distinct:
+            codes = self.rel_codes if name == 'relation' else self.page_codes
+            edges = np.repeat(np.arange(self.n_edges, dtype=np.int64), self.edge_weights())
+            valid = codes >= 0
+            n_codes = int(codes.max()) + 1 if valid.any() else 1
+            keys, first, counts = np.unique(edges[valid] * n_codes + codes[valid],
+                                            return_index=True, return_counts=True)
+            key_edges = keys // n_codes
+            order = np.lexsort((first, -counts, key_edges))
+            indptr = np.r_[0, np.cumsum(np.bincount(key_edges, minlength=self.n_edges))].astype(np.int64)
+            self._distinct[name] = (indptr, (keys % n_codes)[order])
+        return self._distinct[name]
+
+    def edge_relations(self, edges=None):
+        """Method to get the distinct relations of edges (all edges, aligned with `out_indices`, if None)
+
+        Returns
+        -------
+        relations : list
+            List of relations of each edge, most frequent first
+        """
+        indptr, values = self._distinct_per_edge('relation')
+        names = self.relation_names
+        return [names[values[indptr[e]:indptr[e+1]]].tolist()
+                for e in (range(self.n_edges) if edges is None else edges)]
+
+    def edge_pages(self, edges=None):
+        """Method to get the distinct source pages of edges (all edges, aligned with `out_indices`, if None)
+
+        Returns
+        -------
+        pages : list
+            List of pages of each edge, most frequent first (empty lists if pages are unknown)
+        """
+        edges = range(self.n_edges) if edges is None else edges
+        if self.page_codes is None:
+            return [[] for _ in edges]
+        indptr, values = self._distinct_per_edge('page')
+        names = self.page_names
+        return [names[values[indptr[e]:indptr[e+1]]].tolist() for e in edges]
+
+    def edge_labels(self, edges=None, sep=', '):
+        """Method to join the distinct relations of edges, most frequent first (see `edge_relations`)
+        """
+        return [sep.join(relations) for relations in self.edge_relations(edges)]
+
+    def to_csr(self, weighted=True):
+        """Method to export the adjacency matrix as a `scipy.sparse.csr_matrix`, without copying indices
+
+        Rows and columns are node ids (see `nodes`), and entries are the number of triplets
+        of each edge if `weighted` is set, 1 otherwise.
+        """
+        from scipy.sparse import csr_matrix
+
+        data = self.edge_weights() if weighted else np.ones(self.n_edges, dtype=np.int64)
+        return csr_matrix((data, self.out_indices, self.out_indptr), shape=(self.n_nodes, self.n_nodes))
+
+    def fingerprint(self):
+        """Method to get a hash identifying the graph (its nodes and edges), e.g. for caching layouts
+        """
+        if self._fingerprint is None:
+            sha = hashlib.sha1()
+            sha.update('\x00'.join(str(node) for node in self.nodes).encode('utf-8'))
+            sha.update(self.out_indptr.tobytes())
+            sha.update(self.out_indices.tobytes())
+            self._fingerprint = sha.hexdigest()
+        return self._fingerprint
+
+    def node_id(self, node):
+        """Method to get the id of an entity, raising KeyError if it is not in the graph
+        """
+        return self.nodes.get_loc(node)
+
+    def successors(self, node):
+        """Method to get the objects of all triplets with a given subject
+        """
+        i = self.node_id(node)
+        return self.nodes[self.out_indices[self.out_indptr[i]:self.out_indptr[i+1]]].tolist()
+
+    def predecessors(self, node):
+        """Method to get the subjects of all triplets with a given object
+        """
+        i = self.node_id(node)
+        return self.nodes[self.in_indices[self.in_indptr[i]:self.in_indptr[i+1]]].tolist()
+
+    def _edge_id(self, i, j):
+        """Helper function to find the edge from node id `i` to node id `j`, or None
+        """
+        lo, hi = self.out_indptr[i], self.out_indptr[i+1]
+        e = lo + np.searchsorted(self.out_indices[lo:hi], j)
+        if e < hi and self.out_indices[e] == j:
+            return int(e)
+        return None
+
+    def relations(self, subject, object):
+        """Method to get the relations of all triplets between a subject and an object
+
+        Returns
+        -------
+        relations : list
+            Relations, in the order of triplets (empty if there are none)
+        """
+        if subject not in self.nodes or object not in self.nodes:
+            return []
+        e = self._edge_id(self.node_id(subject), self.node_id(object))
+        if e is None:
+            return []
+        return self.relation_names[self.rel_codes[self.rel_indptr[e]:self.rel_indptr[e+1]]].tolist()
+
+    def ego(self, node, n_hops=2, direction='out'):
+        """Method to find the entities within `n_hops` hops of a node, breadth-first
+
+        Only the neighbourhood is visited, so queries take time proportional
+        to its size rather than to the size of the graph.
+
+        Parameters
+        ----------
+        node : str
+            Node at the center of the neighbourhood
+        n_hops : int, optional
+            Maximum number of hops from node
+        direction : str, optional
+            Edges to follow: 'out' (from subjects to objects), 'in' (from objects
+            to subjects), or 'both'
+
+        Returns
+        -------
+        hops : dict
+            Mapping from each entity in the neighbourhood (including `node`)
+            to its number of hops from node, in breadth-first order
+        """
+        if direction not in ('out', 'in', 'both'):
+            raise ValueError("direction must be one of 'out', 'in', 'both', got {!r}".format(direction))
+        adjacency = []
+        if direction in ('out', 'both'):
+            adjacency.append((self.out_indptr, self.out_indices))
+        if direction in ('in', 'both'):
+            adjacency.append((self.in_indptr, self.in_indices))
+
+        start = self.node_id(node)
+        hops = {start: 0}
+        frontier = [start]
+        for hop in range(1, n_hops + 1):
+            next_frontier = []
+            for i in frontier:
+                for indptr, indices in adjacency:
+                    for j in indices[indptr[i]:indptr[i+1]].tolist():
+                        if j not in hops:
+                            hops[j] = hop
+                            next_frontier.append(j)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+
+        names = self.nodes[list(hops)]
+        return collections.OrderedDict(zip(names, hops.values()))
+
+    def subgraph_triplets(self, nodes):
+        """Method to get all triplets between a set of entities (e.g. from `ego`)
+
+        Returns
+        -------
+        triplets : pd.DataFrame
+            S-R-O triplets dataframe, grouped by (subject, object) edge
+        """
+        ids = set(self.node_id(node) for node in nodes)
+        rows = []
+        for i in sorted(ids):
+            lo, hi = self.out_indptr[i], self.out_indptr[i+1]
+            for e, j in enumerate(self.out_indices[lo:hi].tolist(), lo):
+                if j in ids:
+                    for r in self.rel_codes[self.rel_indptr[e]:self.rel_indptr[e+1]].tolist():
+                        rows.append((i, r, j))
+        if not rows:
+            return pd.DataFrame(columns=['subject', 'relation', 'object'])
+        subj, rel, obj = (np.array(col) for col in zip(*rows))
+        return pd.DataFrame({'subject': self.nodes[subj], 'relation': self.relation_names[rel],
+                             'object': self.nodes[obj]})
+
+
+def aggregate_edges(triplets, sep=', '):
+    """Method to aggregate triplets into unique (subject, object) edges
+    
+    Repeated triplets (e.g. the same fact extracted from many sentences) and 
+    triplets with different relations between the same entities are grouped 
+    into one edge, carrying its number of triplets, all its relations, and 
+    its source pages (if triplets have a 'page' column).
+    
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore or GraphIndex
+        S-R-O triplets dataframe
+    sep : str, optional
+        Separator of joined relations
+    
+    Returns
+    -------
+    edges : pd.DataFrame
+        Dataframe of edges with entries ('subject', 'object', 'weight', 'relation', 
+        'relations', 'pages'), where 'weight' is the number of triplets, 'relations' 
+        and 'pages' are lists of distinct values (most frequent first), 
+        and 'relation' joins the relations
+    """
+    index = triplets if isinstance(triplets, GraphIndex) else GraphIndex(triplets)
+    relations = index.edge_relations()
+    return pd.DataFrame({
+        'subject': index.nodes[index.edge_sources].to_numpy(dtype=object),
+        'object': index.nodes[index.out_indices].to_numpy(dtype=object),
+        'weight': index.edge_weights(),
+        'relation': [sep.join(edge_relations) for edge_relations in relations],
+        'relations': relations,
+        'pages': index.edge_pages(),
+    }, columns=['subject', 'object', 'weight', 'relation', 'relations', 'pages'])
+
+
+def aggregated_graph(triplets, sep=', '):
+    """Method to build a weighted networkx graph with one edge per (subject, object) pair
+    
+    Unlike a `nx.MultiDiGraph` of all triplets, repeated triplets do not create 
+    separate edges: edges are built in bulk from `aggregate_edges`, with attributes 
+    'weight' (number of triplets), 'relation' (joined relations), 'relations' and 'pages'.
+    
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore or GraphIndex
+        S-R-O triplets dataframe
+    sep : str, optional
+        Separator of joined relations
+    
+    Returns
+    -------
+    k_graph : nx.DiGraph
+        Knowledge graph with aggregated edges
+    """
+    import networkx as nx
+    
+    edges = aggregate_edges(triplets, sep)
+    k_graph = nx.DiGraph()
+    k_graph.add_edges_from(zip(edges.subject, edges.object, 
+                               edges[['weight', 'relation', 'relations', 'pages']].to_dict('records')))
+    return k_graph
+
+
+def force_layout(index, iterations=50, seed=0, cache_dir=None):
+    """Method to compute a force-directed layout of a large graph
+    
+    Fruchterman-Reingold layout with an approximate repulsion: nodes are binned into 
+    a single-level grid (of up to 16x16 cells), and each node is repelled by the centroid 
+    of each cell (weighted by its number of nodes) rather than by every other node. 
+    This is a grid-centroid approximation, not a Barnes-Hut quadtree or a multilevel 
+    layout: cells have a fixed size whatever their distance to the node, so nearby 
+    nodes in other cells are approximated as coarsely as far away ones. 
+    Each iteration takes O(n * cells + edges) time instead of O(n^2). 
+    The last `_MAX_LAYOUTS` layouts are cached by graph fingerprint in memory, 
+    and all of them optionally on disk.
+    
+    Parameters
+    ----------
+    index : GraphIndex
+        Index of graph to lay out
+    iterations : int, optional
+        Number of iterations
+    seed : int, optional
+        Seed of random initial positions
+    cache_dir : str, optional
+        Directory of cached layouts (as .npy files), no disk cache if None
+    
+    Returns
+    -------
+    pos : np.ndarray
+        Positions of nodes, of shape (n_nodes, 2), indexed by node id
+    """
+    key = '{}-{}-{}'.format(index.fingerprint(), iterations, seed)
+    if key in _LAYOUTS:
+        _LAYOUTS.move_to_end(key)
+        return _LAYOUTS[key]
+    path = os.path.join(cache_dir, 'layout-{}.npy'.format(key)) if cache_dir is not None else None
+    if path is not None and os.path.exists(path):
+        return _cache_layout(key, np.load(path))
+    
+    n = index.n_nodes
+    pos = np.random.RandomState(seed).rand(n, 2)
+    src, dst = index.edge_sources, index.out_indices
+    not_loop = src != dst
+    src, dst = src[not_loop], dst[not_loop]
+    
+    k = 1 / np.sqrt(max(n, 1))  # Optimal distance between nodes
+    n_grid = int(np.clip(np.sqrt(n) / 4, 1, 16))  # Grid of up to 16x16 cells
+    chunk = max(1, 2 ** 21 // (n_grid * n_grid))  # Nodes per vectorized block
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations if n > 1 else 0):
+        disp = np.zeros_like(pos)
+        
+        # Repulsion: bin nodes into grid cells, with their mass and centroid
+        low = pos.min(axis=0)
+        cell = np.minimum(((pos - low) / (pos.max(axis=0) - low + 1e-9) * n_grid).astype(np.int64), n_grid - 1)
+        cell = cell[:, 0] * n_grid + cell[:, 1]
+        mass = np.bincount(cell, minlength=n_grid * n_grid).astype(float)
+        occupied = np.flatnonzero(mass)
+        centroids = np.c_[np.bincount(cell, pos[:, 0], n_grid * n_grid)[occupied],
+                          np.bincount(cell, pos[:, 1], n_grid * n_grid)[occupied]] / mass[occupied, None]
+        mass = mass[occupied]
+        for start in range(0, n, chunk):
+            dx = pos[start:start+chunk, 0, None] - centroids[None, :, 0]
+            dy = pos[start:start+chunk, 1, None] - centroids[None, :, 1]
+            weight = mass * k * k / (dx * dx + dy * dy + 1e-9)
+            disp[start:start+chunk, 0] += (dx * weight).sum(axis=1)
+            disp[start:start+chunk, 1] += (dy * weight).sum(axis=1)
+        # Replace the pull of each node's own cell (which includes the node itself) 
+        # by that of the other nodes of the cell
+        own = np.searchsorted(occupied, cell)
+        delta = pos - centroids[own]
+        disp -= delta * (mass[own] * k * k / ((delta ** 2).sum(axis=1) + 1e-9))[:, None]
+        others = mass[own] > 1
+        rest = (centroids[own] * mass[own, None] - pos)[others] / (mass[own][others] - 1)[:, None]
+        delta = pos[others] - rest
+        disp[others] += delta * ((mass[own][others] - 1) * k * k / ((delta ** 2).sum(axis=1) + 1e-9))[:, None]
+        
+        # Attraction along edges
+        delta = pos[dst] - pos[src]
+        force = delta * np.sqrt((delta ** 2).sum(axis=1))[:, None] / k
+        for axis in range(2):
+            disp[:, axis] += (np.bincount(src, force[:, axis], minlength=n) 
+                              - np.bincount(dst, force[:, axis], minlength=n))
+        
+        # Move nodes, by at most the current temperature
+        length = np.sqrt((disp ** 2).sum(axis=1)) + 1e-9
+        pos += disp * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+    
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path, pos)
+    return _cache_layout(key, pos)
+
+
+def _cache_layout(key, pos):
+    """Helper function to keep a layout in memory, evicting the least recently used ones
+    """
+    _LAYOUTS[key] = pos
+    while len(_LAYOUTS) > _MAX_LAYOUTS:
+        _LAYOUTS.popitem(last=False)
+    return pos
+
+
+def export_graph(triplets, path, fmt=None, pos=None, max_labels=200):
+    """Method to export a knowledge graph for rendering in other tools
+    
+    Supported formats are GraphML and GEXF (e.g. for Gephi or Cytoscape), and a 
+    self-contained HTML page rendering the graph client-side on a canvas, with 
+    panning/zooming and labels of the highest degree nodes. Edges carry the 
+    relations between subject and object (joined), and their number of triplets.
+    
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore or GraphIndex
+        S-R-O triplets dataframe
+    path : str
+        Path of exported file
+    fmt : str, optional
+        One of 'graphml', 'gexf' or 'html', inferred from extension of path if None
+    pos : np.ndarray, optional
+        Positions of nodes (see `force_layout`), stored as node attributes;
+        computed for HTML export if None
+    max_labels : int, optional
+        Number of highest degree nodes labelled in HTML export
+    """
+    index = triplets if isinstance(triplets, GraphIndex) else GraphIndex(triplets)
+    fmt = (fmt or os.path.splitext(path)[1][1:]).lower()
+    if fmt not in ('graphml', 'gexf', 'html'):
+        raise ValueError("Unsupported export format: {!r}".format(fmt))
+    src, dst = index.edge_sources, index.out_indices
+    labels, weights = index.edge_labels(), index.edge_weights()
+    
+    if fmt == 'html':
+        if pos is None:
+            pos = force_layout(index)
+        degrees = index.degrees()
+        labelled = set(np.argsort(-degrees, kind='stable')[:max_labels].tolist())
+        data = {
+            'nodes': [[str(node), float(x), float(y), int(deg), i in labelled] 
+                      for i, (node, (x, y), deg) in enumerate(zip(index.nodes, pos.tolist(), degrees.tolist()))],
+            'edges': [[s, o, label, w] for s, o, label, w in zip(src.tolist(), dst.tolist(), labels, weights.tolist())],
+        }
+        # Escape closing tags, so that the data cannot end the script element
+        data = json.dumps(data).replace('</', '<\\/')
+        with open(path, 'w') as f:
+            f.write(_HTML_TEMPLATE.replace('{title}', html.escape(os.path.basename(path)))
+                                  .replace('{data}', data))
+        return
+    
+    import networkx as nx
+    k_graph = nx.DiGraph()
+    for i, node in enumerate(index.nodes):
+        attrs = {'x': float(pos[i, 0]), 'y': float(pos[i, 1])} if pos is not None else {}
+        k_graph.add_node(str(node), **attrs)
+    k_graph.add_edges_from(
+        (str(index.nodes[s]), str(index.nodes[o]), {'relation': label, 'weight': w}) 
+        for s, o, label, w in zip(src.tolist(), dst.tolist(), labels, weights.tolist()))
+    if fmt == 'graphml':
+        nx.write_graphml(k_graph, path)
+    else:
+        nx.write_gexf(k_graph, path)
+
+
+# Self-contained HTML viewer for `export_graph`: nodes are [label, x, y, degree, labelled], 
+# edges are [subject id, object id, relations, number of triplets]
+_HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+  html, body { margin: 0; height: 100%; overflow: hidden; font-family: sans-serif; }
+  canvas { display: block; }
+  #info { position: absolute; top: 8px; left: 8px; background: rgba(255,255,255,0.85); padding: 4px 8px; }
+</style>
+</head>
+<body>
+<div id="info">Drag to pan, scroll to zoom, hover a node for its relations</div>
+<canvas id="kg"></canvas>
+<script>
+var data = {data};
+var canvas = document.getElementById('kg'), ctx = canvas.getContext('2d');
+var nodes = data.nodes, edges = data.edges;
+var minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+nodes.forEach(function (n) {
+  minX = Math.min(minX, n[1]); maxX = Math.max(maxX, n[1]);
+  minY = Math.min(minY, n[2]); maxY = Math.max(maxY, n[2]);
+});
+var scale = 1, offsetX = 0, offsetY = 0, hover = -1;
+function resize() {
+  canvas.width = window.innerWidth; canvas.height = window.innerHeight;
+  scale = 0.9 * Math.min(canvas.width / (maxX - minX || 1), canvas.height / (maxY - minY || 1));
+  offsetX = (canvas.width - scale * (maxX - minX)) / 2 - scale * minX;
+  offsetY = (canvas.height - scale * (maxY - minY)) / 2 - scale * minY;
+  draw();
+}
+function sx(n) { return n[1] * scale + offsetX; }
+function sy(n) { return n[2] * scale + offsetY; }
+function draw() {
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  ctx.strokeStyle = 'rgba(200,0,0,0.25)';
+  ctx.beginPath();
+  edges.forEach(function (e) {
+    ctx.moveTo(sx(nodes[e[0]]), sy(nodes[e[0]]));
+    ctx.lineTo(sx(nodes[e[1]]), sy(nodes[e[1]]));
+  });
+  ctx.stroke();
+  ctx.fillStyle = 'white'; ctx.strokeStyle = 'black';
+  nodes.forEach(function (n) {
+    var r = 2 + Math.sqrt(n[3]);
+    ctx.beginPath(); ctx.arc(sx(n), sy(n), r, 0, 2 * Math.PI); ctx.fill(); ctx.stroke();
+  });
+  ctx.fillStyle = 'black';
+  nodes.forEach(function (n, i) {
+    if (n[4] || i === hover) { ctx.fillText(n[0], sx(n) + 4, sy(n) - 4); }
+  });
+  if (hover >= 0) {
+    ctx.fillStyle = 'red';
+    edges.forEach(function (e) {
+      if (e[0] === hover || e[1] === hover) {
+        var a = nodes[e[0]], b = nodes[e[1]];
+        ctx.fillText(e[2], (sx(a) + sx(b)) / 2, (sy(a) + sy(b)) / 2);
+      }
+    });
+  }
+}
+var dragging = null;
+canvas.addEventListener('mousedown', function (ev) { dragging = [ev.clientX, ev.clientY]; });
+window.addEventListener('mouseup', function () { dragging = null; });
+canvas.addEventListener('mousemove', function (ev) {
+  if (dragging) {
+    offsetX += ev.clientX - dragging[0]; offsetY += ev.clientY - dragging[1];
+    dragging = [ev.clientX, ev.clientY]; draw(); return;
+  }
+  var best = -1, bestDist = 64;
+  nodes.forEach(function (n, i) {
+    var d = Math.pow(sx(n) - ev.clientX, 2) + Math.pow(sy(n) - ev.clientY, 2);
+    if (d < bestDist) { best = i; bestDist = d; }
+  });
+  if (best !== hover) { hover = best; draw(); }
+});
+canvas.addEventListener('wheel', function (ev) {
+  ev.preventDefault();
+  var factor = ev.deltaY < 0 ? 1.2 : 1 / 1.2;
+  offsetX = ev.clientX - (ev.clientX - offsetX) * factor;
+  offsetY = ev.clientY - (ev.clientY - offsetY) * factor;
+  scale *= factor; draw();
+}, { passive: false });
+window.addEventListener('resize', resize);
+resize();
+</script>
+</body>
+</html>
+"""
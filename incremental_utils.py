@@ -0,0 +1,305 @@
+import bisect
+import collections
+import hashlib
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from kg_utils import EntityMatcher, apply_subject_merge_map, extract_triplets_stream
+from model_utils import get_nlp
+
+
+class IncrementalKG:
+    """Knowledge graph maintained incrementally as Wikipedia pages change
+
+    Triplets are persisted in a SQLite database, tagged with their source page
+    and the page revision they were extracted from. On each refresh, only new
+    or changed pages are re-extracted, and triplets of changed or removed pages
+    are retracted. Subject/object frequencies and the duplicate subject mapping
+    (see `kg_utils.merge_duplicate_subjs`) are maintained incrementally,
+    so a refresh costs O(changed pages) rather than O(corpus).
+
+    Parameters
+    ----------
+    path : str, optional
+        Path to SQLite database file
+    """
+    def __init__(self, path='kg_state.sqlite'):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (page TEXT PRIMARY KEY, revision TEXT);
+            CREATE TABLE IF NOT EXISTS triplets (
+                page TEXT, sent INTEGER, subject TEXT, relation TEXT, object TEXT
+            );
+            CREATE INDEX IF NOT EXISTS triplets_page ON triplets (page);
+            CREATE TABLE IF NOT EXISTS subj_counts (subject TEXT PRIMARY KEY, n INTEGER);
+            CREATE TABLE IF NOT EXISTS obj_counts (object TEXT PRIMARY KEY, n INTEGER);
+        """)
+        self._conn.commit()
+
+        # Maintained frequencies of (unmerged) subjects and objects
+        self.subj_counts = collections.Counter(dict(self._conn.execute("SELECT subject, n FROM subj_counts")))
+        self.obj_counts = collections.Counter(dict(self._conn.execute("SELECT object, n FROM obj_counts")))
+        # Sorted unique subjects, and mapping from extended subjects to (subject, extension)
+        self.subjects = sorted(self.subj_counts)
+        self.merge_map = {}
+        self._update_merge_map(self.subjects)
+        # Triplets dataframes built by `triplets`, per arguments, until the next change
+        self._triplets = {}
+
+    def revisions(self):
+        """Method to get the revision each stored page was extracted from
+
+        Returns
+        -------
+        revisions : dict
+            Mapping from page to revision
+        """
+        return dict(self._conn.execute("SELECT page, revision FROM pages"))
+
+    def refresh(self, pages, global_ents_list, remove_missing=True, batch_size=32, nlp=None):
+        """Method to update the knowledge graph with a new snapshot of pages
+
+        Parameters
+        ----------
+        pages : pd.DataFrame or iterable
+            Scraped pages, as a dataframe (see `scraper_utils.wiki_scrape`) or as
+            dicts (see `scraper_utils.wiki_crawl`), with entries ('page', 'text')
+            and optionally 'revid'; pages without a revision id are compared
+            by a hash of their text
+        global_ents_list : list or kg_utils.EntityMatcher
+            List of domain-specific entities which Spacy tools do not
+            recognize as Named entities or Nouns chunks
+        remove_missing : bool, optional
+            Flag for retracting triplets of stored pages absent from `pages`
+        batch_size : int, optional
+            Number of documents buffered per `nlp.pipe` batch
+        nlp : spacy.language.Language, optional
+            Spacy pipeline, defaults to `model_utils.get_nlp()`
+
+        Returns
+        -------
+        stats : dict
+            Number of new, changed, removed and unchanged pages,
+            and of added and retracted triplets
+        """
+        if isinstance(pages, pd.DataFrame):
+            pages = pages.to_dict('records')
+        stored = self.revisions()
+
+        # Diff snapshot against stored revisions
+        stats = collections.Counter()
+        seen = set()
+        updates = []
+        for page in pages:
+            seen.add(page['page'])
+            revision = _revision(page)
+            if stored.get(page['page']) == revision:
+                stats['unchanged'] += 1
+                continue
+            stats['changed' if page['page'] in stored else 'new'] += 1
+            updates.append((page['page'], page['text'], revision))
+        removed = [page for page in stored if page not in seen] if remove_missing else []
+        stats['removed'] = len(removed)
+
+        # Count changes are only applied in memory once the transaction is committed,
+        # so that a failed refresh (rolled back in the database) leaves no partial counts
+        subj_deltas, obj_deltas = collections.Counter(), collections.Counter()
+        with self._conn:
+            # Retract triplets of changed and removed pages
+            for page in [page for page, _, _ in updates if page in stored] + removed:
+                rows = self._conn.execute(
+                    "SELECT subject, object FROM triplets WHERE page=?", (page,)).fetchall()
+                self._conn.execute("DELETE FROM triplets WHERE page=?", (page,))
+                self._conn.execute("DELETE FROM pages WHERE page=?", (page,))
+                self._count(rows, -1, subj_deltas, obj_deltas)
+                stats['retracted'] += len(rows)
+
+            # Re-extract new and changed pages only
+            if updates:
+                if nlp is None:
+                    nlp = get_nlp()
+                if not isinstance(global_ents_list, EntityMatcher):
+                    global_ents_list = EntityMatcher(global_ents_list, nlp)
+                revisions = {page: revision for page, _, revision in updates}
+                records = ((page, text) for page, text, _ in updates)
+                for page, sro_triplets in extract_triplets_stream(records, global_ents_list, batch_size,
+                                                                  nlp=nlp, with_sent=True):
+                    self._conn.executemany(
+                        "INSERT INTO triplets (page, sent, subject, relation, object) VALUES (?, ?, ?, ?, ?)",
+                        [(page, sent, subj, rel, obj) for subj, rel, obj, sent in sro_triplets])
+                    self._conn.execute("INSERT INTO pages (page, revision) VALUES (?, ?)",
+                                       (page, revisions[page]))
+                    self._count([(subj, obj) for subj, _, obj, _ in sro_triplets], 1,
+                                subj_deltas, obj_deltas)
+                    stats['added'] += len(sro_triplets)
+
+            self._save_counts(subj_deltas, obj_deltas)
+
+        changed_subjs = self._apply_counts(subj_deltas, obj_deltas)
+        # Subjects which appeared or disappeared can change the duplicate subject mapping
+        self._update_merge_map(changed_subjs)
+        if stats['added'] or stats['retracted']:
+            self._triplets = {}
+        return dict(stats)
+
+    @staticmethod
+    def _count(rows, delta, subj_deltas, obj_deltas):
+        """Helper function to add changes of subject/object counts for (subject, object) rows
+        """
+        for subj, obj in rows:
+            subj_deltas[subj] += delta
+            obj_deltas[obj] += delta
+
+    def _save_counts(self, subj_deltas, obj_deltas):
+        """Helper function to persist counts updated with changes, within the current transaction
+        """
+        for table, column, counts, deltas in (('subj_counts', 'subject', self.subj_counts, subj_deltas),
+                                              ('obj_counts', 'object', self.obj_counts, obj_deltas)):
+            for key, delta in deltas.items():
+                n = counts[key] + delta
+                if n > 0:
+                    self._conn.execute("INSERT OR REPLACE INTO {} ({}, n) VALUES (?, ?)".format(table, column),
+                                       (key, n))
+                else:
+                    self._conn.execute("DELETE FROM {} WHERE {}=?".format(table, column), (key,))
+
+    def _apply_counts(self, subj_deltas, obj_deltas):
+        """Helper function to apply changes of counts in memory, and maintain the sorted subject list
+
+        Returns
+        -------
+        changed_subjs : set
+            Subjects which were added to or removed from the knowledge graph
+        """
+        changed_subjs = set()
+        for subj, delta in subj_deltas.items():
+            self.subj_counts[subj] += delta
+            i = bisect.bisect_left(self.subjects, subj)
+            present = i < len(self.subjects) and self.subjects[i] == subj
+            if self.subj_counts[subj] > 0:
+                if not present:
+                    self.subjects.insert(i, subj)
+                    changed_subjs.add(subj)
+            else:
+                del self.subj_counts[subj]
+                if present:
+                    del self.subjects[i]
+                    changed_subjs.add(subj)
+        for obj, delta in obj_deltas.items():
+            self.obj_counts[obj] += delta
+            if self.obj_counts[obj] <= 0:
+                del self.obj_counts[obj]
+        return changed_subjs
+
+    def _update_merge_map(self, changed_subjs):
+        """Helper function to update the duplicate subject mapping around changed subjects
+
+        The mapping is computed by a scan over sorted subjects whose only state is the
+        current merged subject (see `kg_utils.merge_duplicate_subjs`). The scan is re-run
+        from each change, and stops as soon as the mapping is the same as before.
+        """
+        changed_subjs = set(changed_subjs)
+        for subj in changed_subjs:
+            self.merge_map.pop(subj, None)
+        positions = sorted(set(bisect.bisect_left(self.subjects, subj) for subj in changed_subjs))
+
+        scanned = 0  # Subjects before this position are up to date
+        for start in positions:
+            i = max(start, scanned)
+            if i >= len(self.subjects):
+                break
+            prev_subj = self._merged(self.subjects[i-1]) if i > 0 else None
+            while i < len(self.subjects):
+                subj = self.subjects[i]
+                old = self.merge_map.get(subj)
+                if prev_subj is not None and prev_subj in subj:
+                    new = (prev_subj, subj.replace(prev_subj, '').strip())
+                    self.merge_map[subj] = new
+                else:
+                    new = None
+                    self.merge_map.pop(subj, None)
+                    prev_subj = subj
+                i += 1
+                if new == old and subj not in changed_subjs:
+                    break
+            scanned = i
+
+    def _merged(self, subj):
+        """Helper function to get the subject an (extended) subject is merged into
+        """
+        return self.merge_map[subj][0] if subj in self.merge_map else subj
+
+    def triplets(self, merge=True, min_subj=2, min_obj=2, drop_self_loops=True):
+        """Method to build the S-R-O triplets dataframe of the knowledge graph
+
+        Duplicate subjects are merged with the maintained mapping, and infrequent
+        subjects/objects are pruned with the maintained counts, without re-counting.
+        As in `kg_utils.prune_triplets`, subject and object frequencies are both
+        counted before pruning.
+
+        Building the dataframe reads and maps the whole triplets table, which costs
+        O(corpus) rather than O(changed pages). The result is therefore cached per
+        arguments until a refresh adds or retracts triplets, and repeated calls
+        between refreshes return the same (shared) dataframe: copy it before
+        modifying it.
+
+        Parameters
+        ----------
+        merge : bool, optional
+            Flag for merging duplicate subjects
+        min_subj : int, optional
+            Frequency threshold for pruning (merged) subjects
+        min_obj : int, optional
+            Frequency threshold for pruning objects
+        drop_self_loops : bool, optional
+            Flag for pruning triplets where subject is the same as object
+
+        Returns
+        -------
+        triplets : pd.DataFrame
+            S-R-O triplets dataframe, with entries ('subject', 'relation', 'object', 'page', 'sent')
+        """
+        key = (merge, min_subj, min_obj, drop_self_loops)
+        if key not in self._triplets:
+            self._triplets[key] = self._build_triplets(*key)
+        return self._triplets[key]
+
+    def _build_triplets(self, merge, min_subj, min_obj, drop_self_loops):
+        """Helper function to build the S-R-O triplets dataframe from the triplets table (see `triplets`)
+        """
+        triplets = pd.read_sql_query(
+            "SELECT subject, relation, object, page, sent FROM triplets", self._conn)
+        if len(triplets) == 0:
+            return triplets
+
+        # Frequencies of merged subjects, from maintained counts of unmerged subjects
+        subj_counts = collections.Counter()
+        for subj, n in self.subj_counts.items():
+            subj_counts[self._merged(subj) if merge else subj] += n
+
+        if merge:
+            triplets = apply_subject_merge_map(triplets, self.merge_map)
+
+        subj_codes, subjects = pd.factorize(triplets.subject)
+        obj_codes, objects = pd.factorize(triplets.object)
+        keep = np.array([subj_counts[subj] >= min_subj for subj in subjects], dtype=bool)[subj_codes]
+        keep &= np.array([self.obj_counts[obj] >= min_obj for obj in objects], dtype=bool)[obj_codes]
+        if drop_self_loops:
+            keep &= triplets.subject.to_numpy() != triplets.object.to_numpy()
+        return triplets[keep].reset_index(drop=True)
+
+    def close(self):
+        self._conn.close()
+
+
+def _revision(page):
+    """Helper function to get the revision key of a scraped page: its revision id if known,
+    otherwise a hash of its text
+    """
+    revid = page.get('revid')
+    if revid is not None and not pd.isnull(revid):
+        return str(int(revid))
+    return hashlib.sha1(page['text'].encode('utf-8')).hexdigest()
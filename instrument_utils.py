@@ -0,0 +1,275 @@
+import collections
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Instrumentation is disabled (and near-free) until `enable` is called
+_enabled = False
+_sinks = []
+_lock = threading.Lock()
+_counters = collections.Counter()
+# Timer name -> [number of calls, total seconds, self seconds (excluding nested timers), max seconds]
+_timers = {}
+# Stack of running timers of each thread, for attributing nested time
+_local = threading.local()
+
+
+def enable(*sinks):
+    """Method to start recording metrics, reported to the given sinks on `flush`
+
+    Parameters
+    ----------
+    *sinks
+        Objects with an `emit(snapshot)` method, e.g. `LogSink`, `JSONLinesSink`, `PrometheusSink`
+    """
+    global _enabled
+    _sinks[:] = sinks
+    _enabled = True
+
+
+def disable():
+    """Method to stop recording metrics
+    """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def count(name, value=1):
+    """Method to increment a counter, e.g. count('scrape.pages_fetched')
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, seconds, self_seconds=None):
+    """Method to record the duration of one call of a timed stage
+    """
+    if not _enabled:
+        return
+    with _lock:
+        stats = _timers.get(name)
+        if stats is None:
+            stats = _timers[name] = [0, 0.0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] += seconds if self_seconds is None else self_seconds
+        stats[3] = max(stats[3], seconds)
+
+
+class _Timer:
+    """Context manager timing a stage, excluding time spent in nested timers from its self time
+    """
+    __slots__ = ('name', 'start', 'nested')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.nested = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].nested += elapsed
+        observe(self.name, elapsed, elapsed - self.nested)
+        return False
+
+
+class _NullTimer:
+    """No-op context manager, returned by `timer` when instrumentation is disabled
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+    """Method to time a stage, as a context manager
+
+    Examples
+    --------
+    >>> with timer('nlp.parse'):
+    ...     doc = nlp(text)
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def timed_iter(name, iterable):
+    """Method to time the production of each item of an iterable (e.g. `nlp.pipe`)
+
+    Only time spent producing items is counted, not time spent by the consumer.
+    The iterable is returned as is when instrumentation is disabled.
+    """
+    if not _enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with _Timer(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def snapshot():
+    """Method to get the metrics recorded so far
+
+    Returns
+    -------
+    metrics : dict
+        Entries 'counters' (name -> value) and 'timers' (name -> dict with
+        'count', 'seconds', 'self_seconds' and 'max_seconds')
+    """
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timers': {name: {'count': stats[0], 'seconds': stats[1], 'self_seconds': stats[2],
+                              'max_seconds': stats[3]} for name, stats in _timers.items()},
+        }
+
+
+def merge(metrics):
+    """Method to add metrics recorded elsewhere (e.g. a `snapshot` from a worker process)
+    """
+    if not _enabled or not metrics:
+        return
+    with _lock:
+        _counters.update(metrics['counters'])
+        for name, stats in metrics['timers'].items():
+            current = _timers.setdefault(name, [0, 0.0, 0.0, 0.0])
+            current[0] += stats['count']
+            current[1] += stats['seconds']
+            current[2] += stats['self_seconds']
+            current[3] = max(current[3], stats['max_seconds'])
+
+
+def reset():
+    """Method to clear all recorded metrics
+    """
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def flush():
+    """Method to report the metrics recorded so far to all sinks
+    """
+    if not _sinks:
+        return
+    metrics = snapshot()
+    for sink in _sinks:
+        sink.emit(metrics)
+
+
+class LogSink:
+    """Sink reporting metrics through `logging`, one line per counter/timer
+
+    Parameters
+    ----------
+    log : logging.Logger, optional
+        Logger, defaults to this module's logger
+    level : int, optional
+        Logging level
+    """
+    def __init__(self, log=None, level=logging.INFO):
+        self.log = log or logger
+        self.level = level
+
+    def emit(self, metrics):
+        for name, value in sorted(metrics['counters'].items()):
+            self.log.log(self.level, "%s: %s", name, value)
+        for name, stats in sorted(metrics['timers'].items(), key=lambda item: -item[1]['self_seconds']):
+            self.log.log(self.level, "%s: %.3fs total, %.3fs self, %d calls, %.3fs max", name,
+                         stats['seconds'], stats['self_seconds'], stats['count'], stats['max_seconds'])
+
+
+class JSONLinesSink:
+    """Sink appending metrics to a file as one JSON object per flush, with a timestamp
+
+    Parameters
+    ----------
+    path : str
+        Path of JSON lines file
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, metrics):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(dict(metrics, timestamp=time.time())) + '\n')
+
+
+class PrometheusSink:
+    """Sink writing metrics to a file in the Prometheus text exposition format
+
+    The file is replaced atomically on each flush, e.g. for the node exporter's
+    textfile collector. Metric names are prefixed, and characters which are not
+    allowed are replaced by underscores (e.g. 'scrape.pages_fetched' becomes
+    'kg_scrape_pages_fetched_total').
+
+    Parameters
+    ----------
+    path : str
+        Path of metrics file (conventionally ending with '.prom')
+    prefix : str, optional
+        Prefix of metric names
+    """
+    def __init__(self, path, prefix='kg_'):
+        self.path = path
+        self.prefix = prefix
+
+    def _name(self, name):
+        return self.prefix + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+    def emit(self, metrics):
+        lines = []
+        for name, value in sorted(metrics['counters'].items()):
+            metric = self._name(name) + '_total'
+            lines += ['# TYPE {} counter'.format(metric), '{} {}'.format(metric, value)]
+        for name, stats in sorted(metrics['timers'].items()):
+            metric = self._name(name)
+            lines += ['# TYPE {}_seconds_total counter'.format(metric),
+                      '{}_seconds_total {}'.format(metric, stats['seconds']),
+                      '# TYPE {}_self_seconds_total counter'.format(metric),
+                      '{}_self_seconds_total {}'.format(metric, stats['self_seconds']),
+                      '# TYPE {}_calls_total counter'.format(metric),
+                      '{}_calls_total {}'.format(metric, stats['count']),
+                      '# TYPE {}_max_seconds gauge'.format(metric),
+                      '{}_max_seconds {}'.format(metric, stats['max_seconds'])]
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
@@ -1,13 +1,49 @@
 import pandas as pd
+import numpy as np
 import re
-import spacy
-from transformers import AutoModelForTokenClassification, AutoTokenizer
-import torch
-import neuralcoref
+import bisect
+import collections
+import difflib
+import hashlib
+import itertools
+import json
+import multiprocessing
 from tqdm import tqdm
 
-nlp = spacy.load('en_core_web_lg')
-neuralcoref.add_to_pipe(nlp)
+import instrument_utils as instrument
+from model_utils import get_bert_ner, get_nlp, has_coref, prepare_fork
+from store_utils import TripletStore
+
+# Pipeline, entity matcher and feature cache inherited by forked workers of `extract_triplets_corpus`,
+# and whether the current process is one of these workers
+_worker_nlp = None
+_worker_matcher = None
+_worker_cache = None
+_worker_subprocess = False
+
+
+def __getattr__(name):
+    # Lazily load the default pipeline for code still using `kg_utils.nlp`
+    if name == 'nlp':
+        return get_nlp()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+# Labels predicted by pre-trained BERT NER model (CoNLL-03, IOB1 tagging scheme)
+BERT_LABEL_LIST = [
+    "O",       # Outside of a named entity
+    "B-MISC",  # Beginning of a miscellaneous entity right after another miscellaneous entity
+    "I-MISC",  # Miscellaneous entity
+    "B-PER",   # Beginning of a person's name right after another person's name
+    "I-PER",   # Person's name
+    "B-ORG",   # Beginning of an organisation right after another organisation
+    "I-ORG",   # Organisation
+    "B-LOC",   # Beginning of a location right after another location
+    "I-LOC"    # Location
+]
+
+# Mapping from BERT NE types to Spacy NE labels
+BERT_TO_SPACY_LABELS = {"PER": "PERSON", "ORG": "ORG", "LOC": "LOC", "MISC": "MISC"}
 
 
 def extract_ner_bert(text, model=None, tokenizer=None):
@@ -32,50 +68,453 @@ def extract_ner_bert(text, model=None, tokenizer=None):
     HuggingFace Transformers library tutorials:
     https://huggingface.co/transformers/usage.html#named-entity-recognition
     """
-    if model is None:
-        model = AutoModelForTokenClassification.from_pretrained("dbmdz/bert-large-cased-finetuned-conll03-english")
-    if tokenizer is None:
-        tokenizer = AutoTokenizer.from_pretrained("bert-base-cased")
+    spans = extract_ner_bert_spans([text], model, tokenizer)[0]
+    ents = [text[start:end] for start, end, _ in spans]
+    return ents
+
+
+def extract_ner_bert_spans(texts, model=None, tokenizer=None, batch_size=16, 
+                           max_length=512, stride=128, quantize=False):
+    """Method to extract Named Entity character spans from texts using pre-trained BERT
+    
+    Texts are split into overlapping windows of at most `max_length` tokens, 
+    windows are sorted by length and padded per batch (dynamic padding), 
+    and each batch is run through the model without tracking gradients.
+    Predictions from overlapping windows are stitched back together, 
+    keeping each token's label from the window in which it is furthest from the edge.
+    
+    Parameters
+    ----------
+    texts : list
+        List of text documents/paragraphs/sentences from which NEs are extracted
+    model : transformers.Model, optional
+        Pre-trained BERT model, defaults to `model_utils.get_bert_ner()`
+    tokenizer : transformers.PreTrainedTokenizerFast, optional
+        Fast tokenizer associated with BERT model
+    batch_size : int, optional
+        Number of windows per forward pass
+    max_length : int, optional
+        Maximum number of tokens per window
+    stride : int, optional
+        Number of overlapping tokens between consecutive windows
+    quantize : bool, optional
+        Flag for using a dynamically int8-quantized model (when `model` is not given)
         
-    label_list = [
-        "O",       # Outside of a named entity
-        "B-MISC",  # Beginning of a miscellaneous entity right after another miscellaneous entity
-        "I-MISC",  # Miscellaneous entity
-        "B-PER",   # Beginning of a person's name right after another person's name
-        "I-PER",   # Person's name
-        "B-ORG",   # Beginning of an organisation right after another organisation
-        "I-ORG",   # Organisation
-        "B-LOC",   # Beginning of a location right after another location
-        "I-LOC"    # Location
-    ]
-    tokens = tokenizer.tokenize(tokenizer.decode(tokenizer.encode(text)))
-    inputs = tokenizer.encode(text, return_tensors="pt")
-
-    outputs = model(inputs)[0]
-    predictions = torch.argmax(outputs, dim=2)
-    
-    # Build list of named entities
-    ents = []
-    cur_ent = ""
-    cur_label = ""
-    for token, prediction in zip(tokens, predictions[0].tolist()):
-        if label_list[prediction] != "O":
-            if token[:2] == "##":
-                # Append token to current NE
-                cur_ent += token[2:]
+    Returns
+    -------
+    spans : list
+        List (one entry per text) of lists of (start_char, end_char, label) tuples,
+        where label is a Spacy NE label (see `BERT_TO_SPACY_LABELS`)
+    """
+    import torch
+    
+    if model is None or tokenizer is None:
+        default_model, default_tokenizer = get_bert_ner(quantize=quantize)
+        model = default_model if model is None else model
+        tokenizer = default_tokenizer if tokenizer is None else tokenizer
+    if len(texts) == 0:
+        return []
+    
+    # Tokenize all texts once, into overlapping windows with character offsets
+    encoded = tokenizer(list(texts), truncation=True, max_length=max_length, stride=stride,
+                        return_overflowing_tokens=True, return_offsets_mapping=True)
+    n_windows = len(encoded['input_ids'])
+    sample_map = encoded.get('overflow_to_sample_mapping', list(range(n_windows)))
+    model_inputs = [key for key in ('input_ids', 'attention_mask', 'token_type_ids') if key in encoded]
+    
+    # Predict labels for all windows, batching windows of similar length together
+    predictions = [None] * n_windows
+    order = sorted(range(n_windows), key=lambda w: len(encoded['input_ids'][w]))
+    no_grad = getattr(torch, 'inference_mode', torch.no_grad)
+    with no_grad():
+        for i in range(0, n_windows, batch_size):
+            batch = order[i:i+batch_size]
+            features = [{key: encoded[key][w] for key in model_inputs} for w in batch]
+            inputs = tokenizer.pad(features, return_tensors="pt")
+            outputs = model(**inputs)[0]
+            labels = torch.argmax(outputs, dim=2).tolist()
+            for w, window_labels in zip(batch, labels):
+                predictions[w] = window_labels[:len(encoded['input_ids'][w])]
+    
+    # Stitch token labels of overlapping windows back together for each text
+    token_labels = [[] for _ in texts]
+    half_stride = stride // 2
+    for w in range(n_windows):
+        sample = sample_map[w]
+        first = w == 0 or sample_map[w-1] != sample
+        last = w == n_windows - 1 or sample_map[w+1] != sample
+        # Skip special tokens, which have empty character offsets
+        window = [(offset, label) for offset, label in zip(encoded['offset_mapping'][w], predictions[w])
+                  if offset[0] != offset[1]]
+        start = 0 if first else half_stride
+        end = len(window) if last else len(window) - (stride - half_stride)
+        token_labels[sample] += window[start:end]
+    
+    # Build NE spans from token labels
+    spans = []
+    for sample_labels in token_labels:
+        sample_spans = []
+        cur_start, cur_end, cur_type = None, None, None
+        for (start, end), prediction in sample_labels:
+            label = BERT_LABEL_LIST[prediction]
+            if label == "O" or label[:2] == "B-" or label[2:] != cur_type:
+                # End of current NE
+                if cur_type is not None:
+                    sample_spans.append((cur_start, cur_end, BERT_TO_SPACY_LABELS[cur_type]))
+                    cur_type = None
+                if label != "O":
+                    # Start of a new NE
+                    cur_start, cur_end, cur_type = start, end, label[2:]
             else:
-                # Start of a new NE
-                if cur_ent != "":
-                    ents.append(cur_ent)
-                cur_ent = token
-                cur_label = label_list[prediction]
-    if cur_ent != "":
-        ents.append(cur_ent)
-        
+                # Append token to current NE
+                cur_end = end
+        if cur_type is not None:
+            sample_spans.append((cur_start, cur_end, BERT_TO_SPACY_LABELS[cur_type]))
+        spans.append(sample_spans)
+    
+    return spans
+
+
+def _char_spans_to_ents(doc, spans):
+    """Helper function to align character spans (e.g. from BERT) to Spacy tokens
+    
+    Spans which do not fall on token boundaries are expanded 
+    to the smallest sequence of tokens covering them.
+    """
+    from spacy.tokens import Span
+    
+    token_starts = [tok.idx for tok in doc]
+    ents = []
+    for start_char, end_char, label in spans:
+        start = bisect.bisect_right(token_starts, start_char) - 1
+        end = bisect.bisect_left(token_starts, end_char)
+        if start < end:
+            ents.append(Span(doc, max(start, 0), end, label=label))
     return ents
 
 
-def extract_triplets(text, title, global_ents_list, verbose=False, use_bert=False):
+# Version of `EntityMatcher` matching semantics, part of its fingerprint: bump it whenever 
+# the spans it returns change, so that features cached with older versions are not reused
+MATCHER_VERSION = 2
+
+
+class EntityMatcher:
+    """Compiled dictionary of domain-specific entities, matched case-insensitively
+    
+    Multi-word entities (e.g. 'monoclonal antibody') are matched with a Spacy 
+    `PhraseMatcher` over lowercased tokens, in time linear in the document length 
+    regardless of the dictionary size. Single tokens (including Named Entities 
+    merged into one token) are matched by a set lookup. 
+    Build it once and reuse it across documents.
+    
+    Parameters
+    ----------
+    entities : iterable
+        Domain-specific entities
+    nlp : spacy.language.Language, optional
+        Spacy pipeline whose tokenizer and vocabulary are used, 
+        defaults to `model_utils.get_nlp()`
+    patterns : list, optional
+        Entities already tokenized into lists of lowercased words (see `to_disk`)
+    """
+    def __init__(self, entities, nlp=None, patterns=None):
+        import spacy
+        from spacy.matcher import PhraseMatcher
+        from spacy.tokens import Doc
+        
+        if nlp is None:
+            nlp = get_nlp()
+        self.terms = set(ent.lower() for ent in entities)
+        if patterns is None:
+            # Tokenize entities once (tokenizer only, no tagging/parsing)
+            patterns = [[tok.lower_ for tok in doc] for doc in nlp.tokenizer.pipe(sorted(self.terms))]
+        self.patterns = [words for words in patterns if len(words) > 1]
+        self._fingerprint = None
+        
+        self.matcher = PhraseMatcher(nlp.vocab, attr='LOWER')
+        docs = [Doc(nlp.vocab, words=words) for words in self.patterns]
+        if int(spacy.__version__.split('.')[0]) < 3:
+            self.matcher.add('GLOBAL_ENT', None, *docs)
+        else:
+            self.matcher.add('GLOBAL_ENT', docs)
+    
+    def __call__(self, doc):
+        """Method to find domain-specific entities in a Doc
+        
+        Every single-token match is kept, as with a per-token lookup, even when it 
+        is nested in a multi-word match. Multi-word matches are de-overlapped 
+        among themselves, longest first.
+        
+        Returns
+        -------
+        spans : list
+            Entity spans, sorted by start and end
+        """
+        from spacy.util import filter_spans
+        
+        spans = [doc[tok.i:tok.i+1] for tok in doc if tok.lower_ in self.terms]
+        if self.patterns:
+            spans += filter_spans([doc[start:end] for _, start, end in self.matcher(doc)])
+            spans.sort(key=lambda span: (span.start, span.end))
+        return spans
+    
+    def __contains__(self, term):
+        return term.lower() in self.terms
+    
+    def __len__(self):
+        return len(self.terms)
+
+    def fingerprint(self):
+        """Method to get a hash identifying the entity dictionary (e.g. for cache keys)
+        """
+        if self._fingerprint is None:
+            data = json.dumps({'terms': sorted(self.terms), 'patterns': self.patterns, 
+                               'version': MATCHER_VERSION})
+            self._fingerprint = hashlib.sha1(data.encode('utf-8')).hexdigest()
+        return self._fingerprint
+
+    def to_disk(self, path):
+        """Method to save the entity dictionary along with its tokenized patterns
+        """
+        with open(path, 'w') as f:
+            json.dump({'terms': sorted(self.terms), 'patterns': self.patterns}, f)
+    
+    @classmethod
+    def from_disk(cls, path, nlp=None):
+        """Method to load an entity dictionary saved with `to_disk`, without re-tokenizing it
+        """
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['terms'], nlp, patterns=data['patterns'])
+
+
+# Cleaning patterns: new-lines, reference numbers and (non-nested) parenthesis are 
+# removed in a single pass, then spaces are added after punctuation
+_CLEAN_RE = re.compile(r'(\n+)|\[\d+\]|\([^()]*\)')
+_PUNCT_SPACE_RE = re.compile(r'(?<=[.,])(?=[^\s0-9])')
+# Sentence boundaries of cleaned text, used to split long articles into windows
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def _clean_match(match):
+    # New-lines become sentence ends, reference numbers and parenthesis are removed
+    return '. ' if match.group(1) else ' '
+
+
+def clean_text(text):
+    """Method to clean raw Wikipedia text before coreference resolution
+    
+    Parameters
+    ----------
+    text : str
+        Raw text from Wikipedia article/document
+        
+    Returns
+    -------
+    text : str
+        Cleaned text, with new-lines, reference numbers and parenthesis removed
+    """
+    # Remove new-lines, reference numbers and parenthesis
+    text = _CLEAN_RE.sub(_clean_match, text)
+    # Fix formatting
+    text = _PUNCT_SPACE_RE.sub(' ', text)
+    return text
+
+
+def split_windows(text, max_chars=10000, overlap=2):
+    """Method to split a long cleaned text into windows of whole sentences
+    
+    Each window holds at most about `max_chars` characters: its own sentences, 
+    preceded by the last `overlap` sentences of the previous window as context 
+    (e.g. for antecedents of coreferences). The own parts of consecutive 
+    windows partition the text, so that no sentence is lost or repeated 
+    when windows are stitched back together. Sentences longer than 
+    half a window are split at whitespace.
+    
+    Parameters
+    ----------
+    text : str
+        Cleaned text (see `clean_text`)
+    max_chars : int, optional
+        Maximum number of characters per window
+    overlap : int, optional
+        Number of sentences of context repeated from the previous window
+        
+    Returns
+    -------
+    windows : list
+        List of (window text, start of own part in window text) tuples
+    """
+    if len(text) <= max_chars:
+        return [(text, 0)]
+    
+    # Sentence boundaries, splitting sentences longer than half a window
+    max_sent = max(1, max_chars // 2)
+    bounds = [0]
+    for end in [match.end() for match in _SENTENCE_END_RE.finditer(text)] + [len(text)]:
+        while end - bounds[-1] > max_sent:
+            cut = text.rfind(' ', bounds[-1] + 1, bounds[-1] + max_sent)
+            bounds.append(cut + 1 if cut > bounds[-1] else bounds[-1] + max_sent)
+        if end > bounds[-1]:
+            bounds.append(end)
+    
+    windows = []
+    i = 0  # Index of first own sentence of current window
+    n_sents = len(bounds) - 1
+    while i < n_sents:
+        # Context: up to `overlap` previous sentences, within half a window
+        ctx = i
+        while ctx > 0 and i - ctx < overlap and bounds[i] - bounds[ctx-1] <= max_sent:
+            ctx -= 1
+        # Own part: as many sentences as fit in the rest of the window (at least one)
+        j = i + 1
+        while j < n_sents and bounds[j+1] - bounds[ctx] <= max_chars:
+            j += 1
+        windows.append((text[bounds[ctx]:bounds[j]], bounds[i] - bounds[ctx]))
+        i = j
+    return windows
+
+
+def resolve_docs(texts, batch_size=32, nlp=None):
+    """Method to resolve coreferences for a stream of cleaned texts
+    
+    Both passes (coreference resolution, then parsing of the resolved text) 
+    are streamed through `nlp.pipe`, so documents are processed in batches 
+    and lazily as the input iterable is consumed.
+    
+    Parameters
+    ----------
+    texts : iterable of str
+        Cleaned texts (see `clean_text`)
+    batch_size : int, optional
+        Number of documents buffered per `nlp.pipe` batch
+    nlp : spacy.language.Language, optional
+        Spacy pipeline, defaults to `model_utils.get_nlp()`
+        
+    Returns
+    -------
+    docs : generator of spacy.tokens.Doc
+        Parsed documents built from the coreference-resolved texts
+    """
+    if nlp is None:
+        nlp = get_nlp()
+    if not has_coref(nlp):
+        # Pipeline without neuralcoref: parse cleaned texts as they are
+        return nlp.pipe(texts, batch_size=batch_size)
+    resolved = (doc._.coref_resolved for doc in nlp.pipe(texts, batch_size=batch_size))
+    # Coreferences are already resolved, so skip neuralcoref on the second pass
+    return nlp.pipe(resolved, batch_size=batch_size, disable=['neuralcoref'])
+
+
+def resolve_windows(texts, batch_size=32, nlp=None, max_window_chars=None, overlap=2):
+    """Method to resolve coreferences for a stream of cleaned texts, split into windows
+    
+    Long texts are split into overlapping windows of sentences (see `split_windows`), 
+    so that coreference resolution runs with bounded memory and time per window. 
+    Each window is resolved along with its context from the previous window, and 
+    only the resolved text of its own part is kept and parsed. Windows of all texts 
+    are streamed through `nlp.pipe` together, as in `resolve_docs`.
+    
+    Parameters
+    ----------
+    texts : iterable of str
+        Cleaned texts (see `clean_text`)
+    batch_size : int, optional
+        Number of windows buffered per `nlp.pipe` batch
+    nlp : spacy.language.Language, optional
+        Spacy pipeline, defaults to `model_utils.get_nlp()`
+    max_window_chars : int, optional
+        Maximum number of characters per window, defaults to `nlp.max_length`
+    overlap : int, optional
+        Number of sentences of context repeated from the previous window
+        
+    Yields
+    ------
+    docs : list of spacy.tokens.Doc
+        Parsed documents built from the coreference-resolved windows of each text, in order
+    """
+    for windows in _window_docs(texts, batch_size, nlp, max_window_chars, overlap):
+        yield [doc for doc, _ in windows]
+
+
+def _window_docs(texts, batch_size=32, nlp=None, max_window_chars=None, overlap=2):
+    """Helper function to stream the windows of cleaned texts through `nlp.pipe`
+    
+    Yields
+    ------
+    windows : list
+        List of (Doc, start of own part) tuples for each text; with coreference 
+        resolution, Docs are parsed from the resolved own parts (with starts of 0)
+    """
+    if nlp is None:
+        nlp = get_nlp()
+    max_chars = max_window_chars or nlp.max_length
+    coref = has_coref(nlp)
+    
+    # Number of windows per text, and starts of own parts of windows,
+    # for texts handed to (but not yet returned by) nlp.pipe
+    counts = collections.deque()
+    starts = collections.deque()
+    
+    def windows():
+        for text in texts:
+            # Without coreference resolution, windows do not need any context
+            text_windows = split_windows(text, max_chars, overlap if coref else 0)
+            counts.append(len(text_windows))
+            instrument.count('nlp.windows', len(text_windows))
+            for window, start in text_windows:
+                starts.append(start)
+                yield window
+    
+    # With coreference resolution, time of the first pass (including its parse) is reported 
+    # as 'nlp.coref', and time of parsing resolved texts as 'nlp.parse'
+    docs = instrument.timed_iter('nlp.coref' if coref else 'nlp.parse', 
+                                 nlp.pipe(windows(), batch_size=batch_size))
+    if coref:
+        # Keep the resolved text of the own part of each window, 
+        # and parse it without neuralcoref (see `resolve_docs`)
+        resolved = (_resolved_text(doc, starts.popleft()) for doc in docs)
+        docs = ((doc, 0) for doc in instrument.timed_iter(
+            'nlp.parse', nlp.pipe(resolved, batch_size=batch_size, disable=['neuralcoref'])))
+    else:
+        docs = ((doc, starts.popleft()) for doc in docs)
+    
+    # Group windows back by text
+    group = []
+    for doc in docs:
+        group.append(doc)
+        if len(group) == counts[0]:
+            counts.popleft()
+            yield group
+            group = []
+
+
+def _resolved_tokens(doc):
+    """Helper function to get the text of each token of a Doc, after coreference resolution
+    
+    Mentions are replaced by the main mention of their cluster, as in `doc._.coref_resolved`.
+    """
+    resolved = [tok.text_with_ws for tok in doc]
+    for cluster in (doc._.coref_clusters or []):
+        for mention in cluster:
+            if mention != cluster.main:
+                resolved[mention.start] = cluster.main.text + doc[mention.end-1].whitespace_
+                for i in range(mention.start+1, mention.end):
+                    resolved[i] = ""
+    return resolved
+
+
+def _resolved_text(doc, start_char=0):
+    """Helper function to get the coreference-resolved text of a Doc from a given character
+    """
+    if start_char == 0:
+        return doc._.coref_resolved
+    resolved = _resolved_tokens(doc)
+    return "".join(resolved[tok.i] for tok in doc if tok.idx >= start_char)
+
+
+def extract_triplets(text, title, global_ents_list, verbose=False, use_bert=False, nlp=None, cache=None, 
+                     max_window_chars=None, overlap=2):
     """Method to extract Subject-Relation-Object triplets for KG construction
     
     Parameters
@@ -84,221 +523,648 @@ def extract_triplets(text, title, global_ents_list, verbose=False, use_bert=Fals
         Raw text from Wikipedia article/document
     title : str
         Title of document, used as a default/fallback subject
-    global_ents_list : list
+    global_ents_list : list or EntityMatcher
         List of domain-specific entities which Spacy tools do not 
         recognize as Named entities or Nouns chunks
     verbose : bool, optional
         Flag for displaying progress bar and verbose output
     use_bert : bool, optional
-        Flag for using pre-trained BERT for NER instead of Spacy (default)
+        Flag for using pre-trained BERT for NER instead of Spacy (default),
+        see `extract_ner_bert_spans`
+    nlp : spacy.language.Language, optional
+        Spacy pipeline, defaults to `model_utils.get_nlp()`
+    cache : cache_utils.SentenceCache, optional
+        Cache of extracted features: cached windows of documents are not parsed again 
+        (see `_text_features`)
+    max_window_chars : int, optional
+        Maximum number of characters per window for coreference resolution 
+        (see `resolve_windows`), defaults to `nlp.max_length`
+    overlap : int, optional
+        Number of sentences of context repeated from the previous window
         
     Returns
     -------
     sro_triplets_df : pd.DataFrame
         Pandas dataframe with S-R-O triplets extracted from document
     """
-    # print("\nRaw text:\n", text)
-    text = re.sub(r'\n+', '. ', text)
-    # print("\nRemove new-line:\n", text)
-    text = re.sub(r'\[\d+\]', ' ', text)
-    # print("\nRemove reference numbers:\n", text)
-    text = re.sub(r'\([^()]*\)', ' ', text)
-    # print("\nRemove parenthesis:\n", text)
-    text = re.sub(r'(?<=[.,])(?=[^\s0-9])', r' ', text)
-    # print("\nFix formatting:\n", text)
-    
-    # Resolve coreferences with Spacy+neuralcoref
-    text = nlp(text)
-    text = nlp(text._.coref_resolved)
-    # print("\nResolve coreferences:\n", text)
+    if nlp is None:
+        nlp = get_nlp()
+    
+    # Resolve coreferences with Spacy+neuralcoref, per window of the document, 
+    # and extract features of its sentences
+    features = next(_text_features([clean_text(text)], global_ents_list, nlp=nlp, use_bert=use_bert, 
+                                   cache=cache, max_window_chars=max_window_chars, overlap=overlap, 
+                                   progress=True))
+    
+    sro_triplets = _extract_triplets_doc(features, title, nlp, verbose)
+    
+    # Convert to df
+    sro_triplets_df = pd.DataFrame(sro_triplets, columns=['subject', 'relation', 'object'])
+    return sro_triplets_df
+
+
+def extract_triplets_corpus(wiki_data, global_ents_list, n_process=1, batch_size=32, 
+                            verbose=False, use_bert=False, nlp=None, as_store=False, cache=None, 
+                            max_window_chars=None, overlap=2):
+    """Method to extract Subject-Relation-Object triplets from a corpus of articles
+    
+    Articles are streamed through `nlp.pipe` in batches, and split across 
+    `n_process` worker processes. Triplets for each article are identical 
+    to those returned by `extract_triplets`.
+    
+    The pipeline is loaded once in the parent process and inherited by 
+    forked workers (see `model_utils.preload`), along with the entity matcher 
+    and the feature cache.
+    
+    Parameters
+    ----------
+    wiki_data : pd.DataFrame
+        Scraped articles, as returned by `scraper_utils.wiki_scrape`,
+        with entries ('page', 'text', ...)
+    global_ents_list : list or EntityMatcher
+        List of domain-specific entities which Spacy tools do not 
+        recognize as Named entities or Nouns chunks
+    n_process : int, optional
+        Number of worker processes
+    batch_size : int, optional
+        Number of documents buffered per `nlp.pipe` batch
+    verbose : bool, optional
+        Flag for displaying progress bar and verbose output
+    use_bert : bool, optional
+        Flag for using pre-trained BERT for NER instead of Spacy (default)
+    nlp : spacy.language.Language, optional
+        Spacy pipeline, defaults to `model_utils.get_nlp()`
+    as_store : bool, optional
+        Flag for returning a `store_utils.TripletStore` (with page and 
+        sentence index provenance) instead of a dataframe
+    cache : cache_utils.SentenceCache, optional
+        Cache of extracted features: cached windows of documents are not parsed again 
+        (see `_text_features`); workers inherit the cache, re-open its database, 
+        and keep their own hit/miss counters
+    max_window_chars : int, optional
+        Maximum number of characters per window for coreference resolution 
+        (see `resolve_windows`), defaults to `nlp.max_length`
+    overlap : int, optional
+        Number of sentences of context repeated from the previous window
+        
+    Returns
+    -------
+    sro_triplets_df : pd.DataFrame or store_utils.TripletStore
+        Pandas dataframe with S-R-O triplets extracted from all documents,
+        with entries ('subject', 'relation', 'object', 'page')
+    """
+    if nlp is None:
+        nlp = get_nlp()
+    
+    records = list(zip(wiki_data.page, wiki_data.text))
+    
+    # Split corpus into chunks, a few per worker to balance load
+    n_chunks = max(1, min(len(records), n_process * 4))
+    chunk_size = -(-len(records) // n_chunks) if records else 1
+    chunks = [(records[i:i+chunk_size], batch_size, verbose, use_bert, max_window_chars, overlap)
+              for i in range(0, len(records), chunk_size)]
+    
+    # Compile domain-specific entities once, shared with workers
+    if not isinstance(global_ents_list, EntityMatcher):
+        global_ents_list = EntityMatcher(global_ents_list, nlp)
+    
+    progress = tqdm(desc='Pages Extracted', unit='', total=len(records), disable=not verbose)
+    sro_triplets = []
+    if n_process > 1:
+        # Fork workers after loading the pipeline, so that model weights are shared
+        if 'fork' in multiprocessing.get_all_start_methods():
+            prepare_fork()
+            ctx = multiprocessing.get_context('fork')
+        else:
+            ctx = multiprocessing.get_context()
+        with ctx.Pool(n_process, initializer=_init_worker, 
+                      initargs=(nlp, global_ents_list, cache, True)) as pool:
+            for chunk_triplets, n_pages, metrics in pool.imap(_extract_triplets_chunk, chunks):
+                sro_triplets += chunk_triplets
+                instrument.merge(metrics)
+                progress.update(n_pages)
+    else:
+        _init_worker(nlp, global_ents_list, cache)
+        for chunk in chunks:
+            chunk_triplets, n_pages, _ = _extract_triplets_chunk(chunk)
+            sro_triplets += chunk_triplets
+            progress.update(n_pages)
+    progress.close()
+    
+    # Convert to df
+    sro_triplets_df = pd.DataFrame(sro_triplets, columns=['subject', 'relation', 'object', 'page', 'sent'])
+    if as_store:
+        return TripletStore.from_dataframe(sro_triplets_df)
+    return sro_triplets_df.drop(columns='sent')
+
+
+def _init_worker(nlp, matcher, cache=None, subprocess=False):
+    """Helper function to set the pipeline, entity matcher and feature cache used by `_extract_triplets_chunk`
+    """
+    global _worker_nlp, _worker_matcher, _worker_cache, _worker_subprocess
+    _worker_nlp = nlp
+    _worker_matcher = matcher
+    _worker_cache = cache
+    _worker_subprocess = subprocess
+    if subprocess:
+        # Forked workers start without the metrics already recorded by the parent
+        instrument.reset()
+
+
+def extract_triplets_stream(records, global_ents_list, batch_size=32, verbose=False, 
+                            use_bert=False, nlp=None, with_sent=False, cache=None, 
+                            max_window_chars=None, overlap=2):
+    """Method to lazily extract Subject-Relation-Object triplets from a stream of articles
+    
+    Articles are consumed from `records` only as fast as `nlp.pipe` 
+    processes them, so arbitrarily large (or unbounded) streams can be 
+    processed with bounded memory.
+    
+    Parameters
+    ----------
+    records : iterable
+        Stream of (title, raw text) tuples
+    global_ents_list : list or EntityMatcher
+        List of domain-specific entities which Spacy tools do not 
+        recognize as Named entities or Nouns chunks
+    batch_size : int, optional
+        Number of documents buffered per `nlp.pipe` batch
+    verbose : bool, optional
+        Flag for verbose output
+    use_bert : bool, optional
+        Flag for using pre-trained BERT for NER instead of Spacy (default)
+    nlp : spacy.language.Language, optional
+        Spacy pipeline, defaults to `model_utils.get_nlp()`
+    with_sent : bool, optional
+        Flag for appending the index of the source sentence to each triplet
+    cache : cache_utils.SentenceCache, optional
+        Cache of extracted features: cached windows of documents are not parsed again 
+        (see `_text_features`)
+    max_window_chars : int, optional
+        Maximum number of characters per window for coreference resolution 
+        (see `resolve_windows`), defaults to `nlp.max_length`
+    overlap : int, optional
+        Number of sentences of context repeated from the previous window
+        
+    Yields
+    ------
+    title : str
+        Title of article
+    sro_triplets : list
+        List of (subject, relation, object) tuples extracted from article
+    """
+    if nlp is None:
+        nlp = get_nlp()
+    if not isinstance(global_ents_list, EntityMatcher):
+        global_ents_list = EntityMatcher(global_ents_list, nlp)
+    
+    # Titles of articles handed to (but not yet returned by) nlp.pipe
+    titles = collections.deque()
+    
+    def texts():
+        for title, text in records:
+            titles.append(title)
+            with instrument.timer('clean'):
+                text = clean_text(text)
+            yield text
+    
+    for features in _text_features(texts(), global_ents_list, batch_size, nlp, use_bert, cache, 
+                                   max_window_chars, overlap):
+        title = titles.popleft()
+        instrument.count('extract.pages')
+        yield title, _extract_triplets_doc(features, title, nlp, verbose, with_sent)
+
+
+def _extract_triplets_chunk(args):
+    """Helper function to extract triplets from a chunk of (page, text) records
+    """
+    records, batch_size, verbose, use_bert, max_window_chars, overlap = args
+    sro_triplets = []
+    for page, triplets in extract_triplets_stream(records, _worker_matcher, batch_size, verbose, use_bert, 
+                                                  nlp=_worker_nlp, with_sent=True, cache=_worker_cache, 
+                                                  max_window_chars=max_window_chars, overlap=overlap):
+        sro_triplets += [triplet[:3] + (page, triplet[3]) for triplet in triplets]
+    # Report metrics of worker processes back to the parent (see `instrument_utils.merge`)
+    metrics = None
+    if instrument.is_enabled() and _worker_subprocess:
+        metrics = instrument.snapshot()
+        instrument.reset()
+    return sro_triplets, len(records), metrics
+
+
+def _sentence_docs(doc):
+    """Helper function to split a parsed document into one Doc per sentence
+    
+    Leading/trailing whitespace tokens are trimmed from each sentence, 
+    and the sentence spans are reused instead of re-parsing sentences.
+    """
+    for sent in doc.sents:
+        start, end = sent.start, sent.end
+        while start < end and doc[start].is_space:
+            start += 1
+        while end > start and doc[end-1].is_space:
+            end -= 1
+        if start < end:
+            yield doc[start:end].as_doc()
+
+
+# Span of a sentence, with its text and its words used in triplets (lowercased, 
+# without stop words and punctuation)
+_Span = collections.namedtuple('_Span', ['start', 'end', 'start_char', 'end_char', 'text', 'words'])
+
+
+def _span_features(span):
+    """Helper function to convert a Spacy span into a `_Span`
+    """
+    return _Span(span.start, span.end, span.start_char, span.end_char, span.text, 
+                 " ".join(tok.text.lower() for tok in span if 
+                          (tok.is_stop == False and tok.is_punct == False)).strip())
+
+
+def _sentence_features(sent, global_ents_list, bert_spans=None):
+    """Helper function to extract the features of a sentence used to form triplets
+    
+    Named Entities are merged into single tokens (in place). Features only hold 
+    plain (JSON-serializable) values, so that they can be memoized.
+    
+    Returns
+    -------
+    features : dict
+        Sentence text, lemmas of tokens, flags for tokens which are neither stop words 
+        nor punctuation, verbs as (index, lowercased text) pairs, 
+        and candidate subject/object spans by category
+    """
+    from spacy.util import filter_spans
+    
+    if bert_spans is not None:
+        # Replace Spacy's Named Entities with BERT's, aligned to Spacy tokens.
+        # Pre-trained BERT does not support detailed NE types beyond 
+        # (person, location, organization, misc.), so Spacy's additional 
+        # entities (Date/Time/etc.) are kept wherever they do not overlap.
+        bert_ents = _char_spans_to_ents(sent, bert_spans)
+        addn_ents = [ent for ent in sent.ents if ent.label_ in ("DATE", "TIME", "MONEY", "QUANTITY")]
+        sent.ents = filter_spans(bert_ents + addn_ents)
+
+    # Retokenize to combine Named Entities into single tokens
+    ents = list(sent.ents)
+    spans = filter_spans(ents)
+    with sent.retokenize() as retokenizer:
+        [retokenizer.merge(span) for span in spans]
+
+    # Re-build Named Entities by categories
+    ents = list(sent.ents)
+    main_ents = []  # Named Entities recognised by Spacy (Main)
+    addn_ents = []  # Additional named entities (Date/Time/etc.)
+    for ent in ents:
+        if ent.label_ in ("DATE", "TIME", "MONEY", "QUANTITY"):
+            addn_ents.append(ent)
+        elif ent.label_ in ("CARDINAL", "ORDINAL", "PERCENT"):
+            # Ignore cardinal/ordinal numbers and percentages
+            continue
+        elif ent.label_ in ("PERSON", "NORP", "FAC", "ORG", 
+                            "GPE", "LOC", "PRODUCT", "EVENT", 
+                            "WORK_OF_ART", "LAW", "LANGUAGE", 
+                            "MISC"):  # MISC is only predicted by BERT
+            main_ents.append(ent)
+    # Identidy Domain-specific/global named entities
+    global_ents = global_ents_list(sent)
+
+    # Identify noun chunks besides Named Entities 
+    noun_chunks = list(sent.noun_chunks)
+
+    # Identify verbs for forming relations
+    verbs = [tok for tok in sent if tok.pos_ == "VERB"]
+    
+    return {
+        'text': sent.text,
+        'lemmas': [tok.lemma_.lower() for tok in sent],
+        'keep': [tok.is_stop == False and tok.is_punct == False for tok in sent],
+        'verbs': [(verb.i, verb.text.lower()) for verb in verbs],
+        'main_ents': [_span_features(span) for span in main_ents],
+        'global_ents': [_span_features(span) for span in global_ents],
+        'noun_chunks': [_span_features(span) for span in noun_chunks],
+        'addn_ents': [_span_features(span) for span in addn_ents],
+    }
+
+
+def _docs_features(sentences, global_ents_list, use_bert=False, progress=False):
+    """Helper function to extract the features of sentence Docs (see `_sentence_features`)
+    """
+    instrument.count('extract.sentences', len(sentences))
+    if use_bert:
+        # Run BERT NER over all sentences in batches
+        with instrument.timer('nlp.bert'):
+            bert_spans = extract_ner_bert_spans([sent.text for sent in sentences])
+    with instrument.timer('extract.features'):
+        return [_sentence_features(sent, global_ents_list, bert_spans[sent_idx] if use_bert else None)
+                for sent_idx, sent in enumerate(tqdm(sentences) if progress else sentences)]
+
+
+def _pipeline_params(nlp):
+    """Helper function to identify a pipeline in cache keys, by its model and components
+    """
+    return (nlp.meta.get('lang'), nlp.meta.get('name'), nlp.meta.get('version'), list(nlp.pipe_names))
+
+
+def _memoized(cache, keys, compute):
+    """Helper function to look up entries of a `SentenceCache`, computing and storing missing ones
+    
+    Entries are looked up and stored in one batch, and keys repeated in `keys` are computed once.
+    
+    Parameters
+    ----------
+    cache : cache_utils.SentenceCache
+        Cache of entries
+    keys : list
+        Keys of entries (see `SentenceCache.key`)
+    compute : callable
+        Function mapping a list of positions (in `keys`) of missing entries to their values
         
+    Returns
+    -------
+    values : list
+        Values of entries, in the order of `keys`
+    """
+    unique = list(dict.fromkeys(keys))
+    values = dict(zip(unique, cache.get_many(unique)))
+    missing = [key for key in unique if values[key] is None]
+    instrument.count('cache.hits', len(unique) - len(missing))
+    instrument.count('cache.misses', len(missing))
+    if missing:
+        positions = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, i)
+        computed = compute([positions[key] for key in missing])
+        values.update(zip(missing, computed))
+        cache.put_many(zip(missing, computed))
+    return [values[key] for key in keys]
+
+
+def _text_features(texts, global_ents_list, batch_size=32, nlp=None, use_bert=False, cache=None, 
+                   max_window_chars=None, overlap=2, progress=False):
+    """Helper function to stream the features of the sentences of cleaned texts
+    
+    Texts are resolved and parsed per window (see `_window_docs`), and the features 
+    of their sentences are extracted (see `_sentence_features`). 
+    
+    If a `cache` is given, features are memoized per window, keyed by the coreference-resolved 
+    text of the window along with the pipeline, whether BERT is used and the domain-specific 
+    entities. With coreference resolution, the resolved text of each window is memoized too, 
+    keyed by the window text (with its context) and the pipeline. Windows are looked up in 
+    chunks of about `batch_size`, and only missing windows are run through `nlp.pipe`: 
+    coreference resolution is skipped for windows whose resolved text is cached, and parsing 
+    for windows whose features are cached. Features of a window only depend on its resolved 
+    text, which is parsed as one document either way, so triplets are the same 
+    with or without a cache, including a cache shared across documents.
+    
+    Yields
+    ------
+    features : list
+        Features of the sentences of each text, in order
+    """
+    if nlp is None:
+        nlp = get_nlp()
+    if not isinstance(global_ents_list, EntityMatcher):
+        global_ents_list = EntityMatcher(global_ents_list, nlp)
+    if cache is None:
+        for windows in _window_docs(texts, batch_size, nlp, max_window_chars, overlap):
+            sentences = [sent for doc, _ in windows for sent in _sentence_docs(doc)]
+            yield _docs_features(sentences, global_ents_list, use_bert, progress)
+        return
+    
+    max_chars = max_window_chars or nlp.max_length
+    coref = has_coref(nlp)
+    pipeline = _pipeline_params(nlp)
+    params = pipeline + (bool(use_bert), global_ents_list.fingerprint())
+    
+    def chunks():
+        # Windows of consecutive texts, along with the number of windows of each text
+        windows, counts = [], []
+        for text in texts:
+            # Without coreference resolution, windows do not need any context
+            text_windows = split_windows(text, max_chars, overlap if coref else 0)
+            instrument.count('nlp.windows', len(text_windows))
+            windows += text_windows
+            counts.append(len(text_windows))
+            if len(windows) >= batch_size:
+                yield windows, counts
+                windows, counts = [], []
+        if counts:
+            yield windows, counts
+    
+    for windows, counts in chunks():
+        if coref:
+            def resolve(positions):
+                docs = nlp.pipe([windows[i][0] for i in positions], batch_size=batch_size)
+                return [_resolved_text(doc, windows[i][1]) 
+                        for i, doc in zip(positions, instrument.timed_iter('nlp.coref', docs))]
+            resolved = _memoized(cache, [cache.key(window, start, 'resolved', *pipeline) 
+                                         for window, start in windows], resolve)
+        else:
+            resolved = [window for window, _ in windows]
+        
+        def parse(positions):
+            # Coreferences are already resolved, so skip neuralcoref (see `resolve_docs`)
+            docs = nlp.pipe([resolved[i] for i in positions], batch_size=batch_size, 
+                            disable=['neuralcoref'] if coref else [])
+            sentences = [list(_sentence_docs(doc)) for doc in instrument.timed_iter('nlp.parse', docs)]
+            features = iter(_docs_features([sent for sents in sentences for sent in sents], 
+                                           global_ents_list, use_bert))
+            return [list(itertools.islice(features, len(sents))) for sents in sentences]
+        window_features = _memoized(cache, [cache.key(text, 'features', *params) for text in resolved], parse)
+        
+        # Group windows back by text (spans of features read from disk are deserialized as lists)
+        window_features = iter(window_features)
+        for count in counts:
+            yield [dict(sent, **{name: [_Span(*span) for span in sent[name]] 
+                                 for name in ('main_ents', 'global_ents', 'noun_chunks', 'addn_ents')})
+                   for features in itertools.islice(window_features, count) for sent in features]
+
+
+def _extract_triplets_doc(features, title, nlp, verbose=False, with_sent=False):
+    """Helper function to extract S-R-O triplets from the features of the sentences of a document
+    
+    Features are given in order of sentences (see `_text_features`), 
+    and processed as one document.
+    
+    Returns
+    -------
+    sro_triplets : list
+        List of (subject, relation, object) tuples, 
+        or (subject, relation, object, sentence index) tuples if `with_sent` is set
+    """
+    # Set default subject: title of document
+    default_subj = _span_features(nlp.make_doc(title)[:])
+    with instrument.timer('extract.candidates'):
+        return _extract_triplets_features(features, default_subj, verbose, with_sent)
+
+
+def _extract_triplets_features(features, default_subj, verbose=False, with_sent=False):
+    """Helper function to form S-R-O triplets from the features of consecutive sentences
+    """
     # Track (Subject, Relation, Object) triplets
     sro_triplets = []
 
     # Temp variables to track previous sentence subject and object
-    prev_subj = nlp("")[:]
-    prev_obj = nlp("")[:]
-    default_subj = nlp(title)[:]  # Set default subject: title of document
+    prev_subj = _Span(0, 0, 0, 0, "", "")
+    prev_obj = _Span(0, 0, 0, 0, "", "")
+    
+    # Counts of verbs examined and duplicate triplets, reported once per document
+    n_verbs = 0
+    n_duplicates = 0
 
-    sentences = [sent.string.strip() for sent in text.sents]
-    for sent in tqdm(sentences):
+    for sent_idx, sent in enumerate(features):
         prev_obj_end = 0  # Temp pointer to previous object end
-
-        sent = nlp(sent)  # Pass through Spacy pipeline
-
-        # Retokenize to combine Named Entities into single tokens
-        ents = list(sent.ents)
-        spans = spacy.util.filter_spans(ents)
-        with sent.retokenize() as retokenizer:
-            [retokenizer.merge(span) for span in spans]
-
-        # Re-build Named Entities by categories
-        if use_bert:
-            # TODO: 
-            # Implement using BERT NER model in combination with spacy features.
-            # There are several issues with BERT:
-            # 1. At the moment, using BERT means we won't be able to use spans, lemmas, PoS tags, etc.
-            #    from spacy. If needed in the future, we can write a functions to bridge the gap.
-            # 2. Unfortunately, pre-trained BERT does not support detailed NE types beyond 
-            #    (person, location, organization). On the other hand, spacy supports up to 18 NE types.
-            raise NotImplementedError
-            # ents = extract_ner_bert(sent)
-        else:
-            # Use spacy's NER model 
-            ents = list(sent.ents)
-        main_ents = []  # Named Entities recognised by Spacy (Main)
-        addn_ents = []  # Additional named entities (Date/Time/etc.)
-        for ent in ents:
-            if ent.label_ in ("DATE", "TIME", "MONEY", "QUANTITY"):
-                addn_ents.append(ent)
-            elif ent.label_ in ("CARDINAL", "ORDINAL", "PERCENT"):
-                # Ignore cardinal/ordinal numbers and percentages
-                continue
-            elif ent.label_ in ("PERSON", "NORP", "FAC", "ORG", 
-                                "GPE", "LOC", "PRODUCT", "EVENT", 
-                                "WORK_OF_ART", "LAW", "LANGUAGE"):
-                main_ents.append(ent)
-        # Identidy Domain-specific/global named entities
-        global_ents = []
-        for tok in sent:
-            if tok.text.lower() in global_ents_list:
-                global_ents.append(sent[tok.i:tok.i+1])
-
-        # Identify noun chunks besides Named Entities 
-        noun_chunks = list(sent.noun_chunks)
-
-        # Identify verbs for forming relations
-        verbs = [tok for tok in sent if tok.pos_ == "VERB"]
         
         if verbose:
             print("\n----------\n")
-            print("\nSentence:\n", sent)
-            print("\nNamed Entities:\n", main_ents)
-            print("\nDomain-specific Entities:\n", global_ents)
-            print("\nAdditional Entities:\n", addn_ents)
-            print("\nNoun spans:\n", noun_chunks)
-            print("\nVerbs:\n", verbs)
-
-        for verb in verbs:
+            print("\nSentence:\n", sent['text'])
+            print("\nNamed Entities:\n", [span.text for span in sent['main_ents']])
+            print("\nDomain-specific Entities:\n", [span.text for span in sent['global_ents']])
+            print("\nAdditional Entities:\n", [span.text for span in sent['addn_ents']])
+            print("\nNoun spans:\n", [span.text for span in sent['noun_chunks']])
+            print("\nVerbs:\n", [verb_text for _, verb_text in sent['verbs']])
+
+        # Index candidate subjects/objects once per sentence
+        candidate_tiers = (
+            _CandidateIndex(sent['main_ents']), _CandidateIndex(sent['global_ents'], exclude_verb=True), 
+            _CandidateIndex(sent['noun_chunks']), _CandidateIndex(sent['addn_ents'])
+        )
+        lemmas, keep = sent['lemmas'], sent['keep']
+        n_verbs += len(sent['verbs'])
+        
+        for verb_i, verb_text in sent['verbs']:
             
-            # Identify Subject
+            # Identify Subject, in order of priority:
+            # leftmost Main Ent, Global Ent, noun chunk, Additional Ent to verb
             subj = None
-            # Find leftmost Main Ent to verb
-            for ent in main_ents:
-                if ent.end > verb.i:
-                    break
-                elif ent.end > prev_obj_end:
-                    subj = ent
+            for candidates in candidate_tiers:
+                subj = candidates.leftmost(verb_i, prev_obj_end)
+                if subj is not None:
                     rel_start = subj.end
-            if subj is None:
-                # Find leftmost Global Ent to verb
-                for ent in global_ents:
-                    if ent.end > verb.i:
-                        break
-                    elif ent.end > prev_obj_end:
-                        subj = ent
-                        rel_start = subj.end
-            if subj is None:
-                # Find leftmost noun chunk to verb
-                for noun_chunk in noun_chunks:
-                    if noun_chunk.end > verb.i:
-                        break
-                    elif noun_chunk.end > prev_obj_end:
-                        subj = noun_chunk
-                        rel_start = subj.end
-            if subj is None:
-                # Find leftmost Additional Ent to verb
-                for ent in addn_ents:
-                    if ent.end > verb.i:
-                        break
-                    elif ent.end > prev_obj_end:
-                        subj = ent
-                        rel_start = subj.end
+                    break
             if subj is None:
                 # If no subject found, assign default subject
                 subj = default_subj
-                rel_start = verb.i
+                rel_start = verb_i
 
             ##########
 
-            # Identify Object
+            # Identify Object, in order of priority:
+            # rightmost Main Ent, Global Ent, noun chunk, Additional Ent to verb
             obj = None
-            # Find rightmost Main Ent to verb
-            for ent in main_ents[::-1]:
-                if ent.end <= verb.i:
-                    break
-                else:
-                    obj = ent
+            for candidates in candidate_tiers:
+                obj = candidates.rightmost(verb_i, verb_text)
+                if obj is not None:
                     rel_end = obj.start
-            if obj is None:
-                # Find rightmost Global Ent to verb
-                for ent in global_ents[::-1]:
-                    if ent.end <= verb.i:
-                        break
-                    elif ent.text.lower() != verb.text.lower():  
-                        # Additional check for global entity not being verb itself!
-                        obj = ent
-                        rel_end = obj.start
-            if obj is None:
-                # Find rightmost noun chunk to verb
-                for noun_chunk in noun_chunks[::-1]:
-                    if noun_chunk.end <= verb.i:
-                        break
-                    else:
-                        obj = noun_chunk
-                        rel_end = obj.start
-            if obj is None:
-                # Find rightmost Additional Ent to verb
-                for ent in addn_ents[::-1]:
-                    if ent.end <= verb.i:
-                        break
-                    else:
-                        obj = ent
-                        rel_end = obj.start
+                    break
             if obj is None:
                 # If no object found, assign previous subject
                 obj = prev_obj
-                rel_end = verb.i + 1
+                rel_end = verb_i + 1
 
             ##########
 
             # Identify and lemmatized relationship spans around verb token
             triplet = (
                 # Subject
-                " ".join(tok.text.lower() for tok in subj if  
-                         (tok.is_stop == False and tok.is_punct == False)).strip(), 
+                subj.words, 
                 # Relationship
-                " ".join(tok.lemma_.lower() for tok in sent[rel_start:rel_end] if 
-                         (tok == verb or (tok.is_stop == False and tok.is_punct == False))).strip(),
+                " ".join(lemmas[i] for i in range(rel_start, rel_end) if 
+                         (i == verb_i or keep[i])).strip(),
                 # Object 
-                " ".join(tok.text.lower() for tok in obj if 
-                         (tok.is_stop == False and tok.is_punct == False)).strip(), 
+                obj.words, 
+                # Sentence index, for provenance
+                sent_idx,
             )
             
             # Append valid SRO triplets to list
             if triplet[0] != "" and triplet[1] != "" and triplet[2] != "" and triplet[0] != triplet[2]:
                 # Check for duplicate triplets within same sentence 
-                if subj == prev_subj and obj == prev_obj:
+                # (Spacy spans are compared by character offsets)
+                if (subj.start_char, subj.end_char) == (prev_subj.start_char, prev_subj.end_char) and \
+                   (obj.start_char, obj.end_char) == (prev_obj.start_char, prev_obj.end_char):
                     prev_triplet = sro_triplets.pop()
+                    n_duplicates += 1
                     # Define relation as the longest relation span among duplicates
                     if len(prev_triplet[1]) > len(triplet[1]):
                         triplet = prev_triplet
                 
                 sro_triplets.append(triplet)
                 if verbose:
-                    print("\nS-R-O:\n", subj, "-", relation, "-", obj)
+                    print("\nS-R-O:\n", subj.text, "-", triplet[1], "-", obj.text)
 
             # Update previous subject and object variables
             prev_subj = subj
             prev_obj = obj
             prev_obj_end = obj.end
     
-    # Convert to df
-    sro_triplets_df = pd.DataFrame(sro_triplets, columns=['subject', 'relation', 'object'])
-    return sro_triplets_df
+    instrument.count('extract.verbs', n_verbs)
+    instrument.count('extract.triplets_deduped', n_duplicates)
+    instrument.count('extract.triplets_emitted', len(sro_triplets))
+    if not with_sent:
+        sro_triplets = [triplet[:3] for triplet in sro_triplets]
+    return sro_triplets
 
 
-def merge_duplicate_subjs(triplets, title=None):
+class _CandidateIndex:
+    """Helper class indexing candidate subject/object spans of a sentence by their end
+    
+    When span ends are sorted (as for entities, noun chunks, etc.), the leftmost/rightmost 
+    candidate to a verb is found by binary search; otherwise the spans are scanned linearly.
+    Both give identical results.
+    
+    Parameters
+    ----------
+    spans : list
+        Candidate spans, in sentence order
+    exclude_verb : bool, optional
+        Flag for skipping objects whose text is the verb itself
+    """
+    def __init__(self, spans, exclude_verb=False):
+        self.spans = spans
+        self.ends = [span.end for span in spans]
+        self.exclude_verb = exclude_verb
+        self.is_sorted = all(a <= b for a, b in zip(self.ends, self.ends[1:]))
+    
+    def leftmost(self, verb_i, prev_obj_end):
+        """Method to find the last span ending before the verb and after the previous object
+        """
+        if not self.is_sorted:
+            subj = None
+            for span in self.spans:
+                if span.end > verb_i:
+                    break
+                elif span.end > prev_obj_end:
+                    subj = span
+            return subj
+        
+        k = bisect.bisect_right(self.ends, verb_i)
+        if k > 0 and self.ends[k-1] > prev_obj_end:
+            return self.spans[k-1]
+        return None
+    
+    def rightmost(self, verb_i, verb_text):
+        """Method to find the first span ending after the verb
+        """
+        if not self.is_sorted:
+            obj = None
+            for span in self.spans[::-1]:
+                if span.end <= verb_i:
+                    break
+                elif not self.exclude_verb or span.text.lower() != verb_text:
+                    obj = span
+            return obj
+        
+        for j in range(bisect.bisect_right(self.ends, verb_i), len(self.spans)):
+            # Additional check for global entity not being verb itself!
+            if not self.exclude_verb or self.spans[j].text.lower() != verb_text:
+                return self.spans[j]
+        return None
+
+
+def merge_duplicate_subjs(triplets, title=None, fuzzy=False, fuzzy_threshold=0.9, 
+                          ngram=3, max_block_size=100):
     """Helper function to merge duplicate subjects
     
     Duplicate subjects can be extensions/additional words joined to typical subjects,
@@ -307,32 +1173,255 @@ def merge_duplicate_subjs(triplets, title=None):
     back to a subject ('bayer'), we append the extension ('healthcare') 
     to the relation for the triplet and then replace the extended subject with the subject.
     
+    The subject -> merged subject mapping is computed once over the sorted unique 
+    subjects, and then applied to all rows at once via categorical codes.
+    
+    Optionally, near-duplicate subjects (e.g. spelling variants) are also merged:
+    candidate pairs sharing a character n-gram are compared by edit-distance-based 
+    similarity, and each group of similar subjects is replaced by its most frequent subject.
+    
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore
+        S-R-O triplets dataframe
+    fuzzy : bool, optional
+        Flag for also merging near-duplicate subjects
+    fuzzy_threshold : float, optional
+        Minimum similarity (between 0 and 1) of near-duplicate subjects
+    ngram : int, optional
+        Length of character n-grams used for blocking candidate pairs
+    max_block_size : int, optional
+        N-grams shared by more subjects than this are not used for blocking
+    
+    Returns
+    -------
+    triplets : pd.DataFrame
+        Updated dataframe with merged duplicate subjects
+    """
+    if len(triplets) == 0:
+        return triplets
+    if isinstance(triplets, TripletStore):
+        return _merge_duplicate_subjs_store(triplets, fuzzy, fuzzy_threshold, ngram, max_block_size)
+    codes, uniques = pd.factorize(triplets.subject)
+    
+    # Compute mapping from subject to (merged subject, extension) over unique subjects
+    mapping = _subject_merge_map(list(uniques))
+    triplets = apply_subject_merge_map(triplets, mapping, codes, uniques)
+    
+    if fuzzy:
+        # Merge near-duplicates among the remaining subjects
+        codes, uniques = pd.factorize(triplets.subject)
+        counts = np.bincount(codes, minlength=len(uniques))
+        fuzzy_map = _fuzzy_subject_map(list(uniques), counts, fuzzy_threshold, ngram, max_block_size)
+        triplets['subject'] = np.array([uniques[i] for i in fuzzy_map], dtype=object)[codes]
+    
+    return triplets
+
+
+def apply_subject_merge_map(triplets, mapping, codes=None, uniques=None):
+    """Helper function to merge subjects of a triplets dataframe given a precomputed mapping
+    
     Parameters
     ----------
     triplets : pd.DataFrame
         S-R-O triplets dataframe
+    mapping : dict
+        Mapping from extended subjects to (subject, extension) pairs
+    codes : np.ndarray, optional
+        Codes of `triplets.subject`, as returned by `pd.factorize`
+    uniques : pd.Index, optional
+        Unique subjects, as returned by `pd.factorize`
     
     Returns
     -------
     triplets : pd.DataFrame
         Updated dataframe with merged duplicate subjects
     """
-    subjects = sorted(list(triplets.subject.unique()))
+    if codes is None:
+        codes, uniques = pd.factorize(triplets.subject)
+    merged_subjs = np.array([mapping[subj][0] if subj in mapping else subj for subj in uniques], dtype=object)
+    extensions = np.array([mapping[subj][1] if subj in mapping else None for subj in uniques], dtype=object)
+    is_merged = np.array([subj in mapping for subj in uniques], dtype=bool)[codes]
+    
+    # Append extensions to relations of rows with merged subjects, and update subjects
+    relations = triplets['relation'].to_numpy(dtype=object, copy=True)
+    relations[is_merged] = extensions[codes[is_merged]] + ' ' + relations[is_merged]
+    triplets['relation'] = relations
+    triplets['subject'] = merged_subjs[codes]
+    return triplets
+
+
+def _subject_merge_map(subjects):
+    """Helper function to map extended subjects to (subject, extension) pairs
+    
+    Returns
+    -------
+    mapping : dict
+        Mapping from each extended subject to the subject it is merged into, 
+        and its extension compared to that subject
+    """
+    mapping = {}
+    subjects = sorted(subjects)
     prev_subj = subjects[0]
     for subj in subjects[1:]:
-        # TODO Use string edit distance between prev_subj and subj
         if prev_subj in subj:
-            # Detect extension in subj compared to prev_subj and append it to relations of rows with subj
-            triplets.loc[triplets.subject==subj, 'relation'] = \
-                subj.replace(prev_subj, '').strip() + ' ' + triplets[triplets.subject==subj].relation
-            # Update subject from subj to prev_subj
-            triplets.loc[triplets.subject==subj, 'subject'] = prev_subj
-            
+            # Detect extension in subj compared to prev_subj
+            mapping[subj] = (prev_subj, subj.replace(prev_subj, '').strip())
         else:
             # Update prev_subj
             prev_subj = subj
+    return mapping
+
+
+def _merge_duplicate_subjs_store(store, fuzzy, fuzzy_threshold, ngram, max_block_size):
+    """Helper function to merge duplicate subjects of a `TripletStore`, working on entity ids
+    """
+    entities, relations = store.entities, store.relations
+    subject_ids = np.unique(store.subject)
+    mapping = _subject_merge_map([entities[i] for i in subject_ids])
     
-    return triplets
+    # Entity id -> merged entity id, and extended entity id -> extension
+    merged_ids = np.arange(len(entities), dtype=np.int32)
+    extensions = {}
+    for subj, (merged_subj, extension) in mapping.items():
+        merged_ids[entities.ids[subj]] = entities.ids[merged_subj]
+        extensions[entities.ids[subj]] = extension
+    
+    # Append extensions to relations, interning each distinct (subject, relation) pair once
+    relation_ids = store.relation.copy()
+    is_merged = np.zeros(len(entities), dtype=bool)
+    is_merged[list(extensions)] = True
+    rows = np.flatnonzero(is_merged[store.subject])
+    if len(rows):
+        n_relations = len(relations)
+        pairs = store.subject[rows].astype(np.int64) * n_relations + store.relation[rows]
+        unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+        new_ids = np.array([relations.add(extensions[pair // n_relations] + ' ' + 
+                                          relations[pair % n_relations]) 
+                            for pair in unique_pairs.tolist()], dtype=np.int32)
+        relation_ids[rows] = new_ids[inverse.ravel()]
+    subject_ids = merged_ids[store.subject]
+    
+    if fuzzy:
+        # Merge near-duplicates among the remaining subjects
+        counts = np.bincount(subject_ids, minlength=len(entities))
+        remaining = np.flatnonzero(counts)
+        fuzzy_map = _fuzzy_subject_map([entities[i] for i in remaining], counts[remaining], 
+                                       fuzzy_threshold, ngram, max_block_size)
+        fuzzy_ids = np.arange(len(entities), dtype=np.int32)
+        fuzzy_ids[remaining] = remaining[fuzzy_map]
+        subject_ids = fuzzy_ids[subject_ids]
+    
+    return store.with_columns(subject=subject_ids, relation=relation_ids)
+
+
+def _fuzzy_subject_map(subjects, counts, threshold, ngram, max_block_size):
+    """Helper function to cluster near-duplicate subjects
+    
+    Returns
+    -------
+    mapping : list
+        Index of the representative subject for each subject
+    """
+    # Inverted index from character n-grams to subjects
+    blocks = collections.defaultdict(list)
+    for i, subj in enumerate(subjects):
+        for gram in set(subj[j:j+ngram] for j in range(max(1, len(subj) - ngram + 1))):
+            blocks[gram].append(i)
+    
+    # Union-find over similar candidate pairs
+    parent = list(range(len(subjects)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    compared = set()
+    for block in blocks.values():
+        if len(block) < 2 or len(block) > max_block_size:
+            continue
+        for a, b in itertools.combinations(block, 2):
+            if (a, b) in compared or find(a) == find(b):
+                continue
+            compared.add((a, b))
+            if difflib.SequenceMatcher(None, subjects[a], subjects[b]).ratio() >= threshold:
+                parent[find(a)] = find(b)
+    
+    # Most frequent (then shortest) subject represents each cluster
+    representative = {}
+    for i in range(len(subjects)):
+        root = find(i)
+        best = representative.get(root)
+        if best is None or (-counts[i], len(subjects[i]), subjects[i]) < (-counts[best], len(subjects[best]), subjects[best]):
+            representative[root] = i
+    return [representative[find(i)] for i in range(len(subjects))]
+
+
+def prune_triplets(triplets, min_subj=2, min_obj=2, drop_self_loops=True, iterate_to_fixpoint=False):
+    """Helper function to prune triplets with infrequent subjects/objects and self-loops
+    
+    Subjects and objects are encoded as integer codes once, their frequencies 
+    are counted with `np.bincount`, and all pruning criteria are combined 
+    into a single boolean mask, so the dataframe is only copied once.
+    
+    Unlike chaining `prune_infreq_subjects` and `prune_infreq_objects`, subject 
+    and object frequencies are both counted before pruning. Since pruning objects 
+    can make subjects infrequent (and vice versa), pruning can optionally be 
+    repeated until no more triplets are removed.
+    
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore
+        S-R-O triplets dataframe
+    min_subj : int, optional
+        Frequency threshold for pruning subjects
+    min_obj : int, optional
+        Frequency threshold for pruning objects
+    drop_self_loops : bool, optional
+        Flag for pruning triplets where subject is the same as object
+    iterate_to_fixpoint : bool, optional
+        Flag for repeating pruning until no more triplets are removed
+    
+    Returns
+    -------
+    triplets : pd.DataFrame
+        Updated dataframe with pruned rows
+    """
+    if isinstance(triplets, TripletStore):
+        # Subjects and objects are already encoded over a shared vocabulary
+        subj_codes, obj_codes = triplets.subject, triplets.object
+        n_uniques = len(triplets.entities)
+    else:
+        n = len(triplets)
+        # Encode subjects and objects over a shared vocabulary, so codes are comparable
+        codes, uniques = pd.factorize(pd.concat([triplets.subject, triplets.object], ignore_index=True))
+        subj_codes, obj_codes = codes[:n], codes[n:]
+        n_uniques = len(uniques)
+    
+    keep = np.ones(len(subj_codes), dtype=bool)
+    self_loops = subj_codes == obj_codes if drop_self_loops else None
+    while True:
+        mask = keep.copy()
+        if min_subj > 1:
+            subj_counts = np.bincount(subj_codes[keep], minlength=n_uniques)
+            mask &= subj_counts[subj_codes] >= min_subj
+        if min_obj > 1:
+            obj_counts = np.bincount(obj_codes[keep], minlength=n_uniques)
+            mask &= obj_counts[obj_codes] >= min_obj
+        if drop_self_loops:
+            mask &= ~self_loops
+        converged = mask.sum() == keep.sum()
+        keep = mask
+        if converged or not iterate_to_fixpoint:
+            break
+    
+    instrument.count('prune.triplets', len(keep))
+    instrument.count('prune.triplets_pruned', len(keep) - int(keep.sum()))
+    if isinstance(triplets, TripletStore):
+        return triplets.filter(keep)
+    return triplets[keep]
 
 
 def prune_infreq_subjects(triplets, threshold=2):
@@ -340,7 +1429,7 @@ def prune_infreq_subjects(triplets, threshold=2):
     
     Parameters
     ----------
-    triplets : pd.DataFrame
+    triplets : pd.DataFrame or store_utils.TripletStore
         S-R-O triplets dataframe
     threshold : int
         Frequency threshold for pruning
@@ -350,14 +1439,8 @@ def prune_infreq_subjects(triplets, threshold=2):
     triplets : pd.DataFrame
         Updated dataframw with pruned rows
     """
-    # Count unique subjects
-    subj_counts = triplets.subject.value_counts()
     # TODO: add more/smarter heuristics for pruning?
-    # Drop subjects with counts below threshold
-    triplets['subj_count'] = list(subj_counts[triplets.subject])
-    triplets.drop(triplets[triplets['subj_count'] < threshold].index, inplace=True)
-    triplets = triplets.drop('subj_count', 1)
-    return triplets
+    return prune_triplets(triplets, min_subj=threshold, min_obj=0, drop_self_loops=False)
 
 
 def prune_infreq_objects(triplets, threshold=2):
@@ -365,7 +1448,7 @@ def prune_infreq_objects(triplets, threshold=2):
     
     Parameters
     ----------
-    triplets : pd.DataFrame
+    triplets : pd.DataFrame or store_utils.TripletStore
         S-R-O triplets dataframe
     threshold : int
         Frequency threshold for pruning
@@ -375,18 +1458,11 @@ def prune_infreq_objects(triplets, threshold=2):
     triplets : pd.DataFrame
         Updated dataframw with pruned rows
     """
-    # Count unique objects
-    obj_counts = triplets.object.value_counts()
     # TODO: add more/smarter heuristics for pruning?
-    # Drop objects with counts below threshold
-    triplets['obj_count'] = list(obj_counts[triplets.object])
-    triplets.drop(triplets[triplets['obj_count'] < threshold].index, inplace=True)
-    triplets = triplets.drop('obj_count', 1)
-    return triplets
+    return prune_triplets(triplets, min_subj=0, min_obj=threshold, drop_self_loops=False)
 
 
 def prune_self_loops(triplets):
     """Helper function to prune triplets where subject is the same as object
     """
-    triplets.drop(triplets[triplets.subject==triplets.object].index, inplace=True)
-    return triplets
+    return prune_triplets(triplets, min_subj=0, min_obj=0, drop_self_loops=True)
@@ -0,0 +1,124 @@
+import gc
+
+# Spacy pipelines loaded in this process, keyed by (model_name, coref, disable)
+_PIPELINES = {}
+# BERT NER (model, tokenizer) pairs, keyed by (model_name, tokenizer_name, quantize)
+_BERT_MODELS = {}
+
+DEFAULT_MODEL = 'en_core_web_lg'
+DEFAULT_BERT_MODEL = 'dbmdz/bert-large-cased-finetuned-conll03-english'
+DEFAULT_BERT_TOKENIZER = 'bert-base-cased'
+
+
+def get_nlp(model_name=DEFAULT_MODEL, coref=True, disable=()):
+    """Method to lazily load a Spacy pipeline, cached per process
+
+    The first call for a given configuration loads the model (and adds
+    neuralcoref to the pipeline); subsequent calls return the cached pipeline.
+
+    Parameters
+    ----------
+    model_name : str, optional
+        Name of Spacy model to load
+    coref : bool, optional
+        Flag for adding neuralcoref to the pipeline
+    disable : tuple, optional
+        Names of pipeline components to disable, e.g. ('ner',)
+
+    Returns
+    -------
+    nlp : spacy.language.Language
+        Loaded Spacy pipeline
+    """
+    key = (model_name, bool(coref), tuple(sorted(disable)))
+    nlp = _PIPELINES.get(key)
+    if nlp is None:
+        import spacy
+        nlp = spacy.load(model_name, disable=list(disable))
+        if coref:
+            import neuralcoref
+            neuralcoref.add_to_pipe(nlp)
+        _PIPELINES[key] = nlp
+    return nlp
+
+
+def get_bert_ner(model_name=DEFAULT_BERT_MODEL, tokenizer_name=DEFAULT_BERT_TOKENIZER, quantize=False):
+    """Method to lazily load a pre-trained BERT NER model and tokenizer, cached per process
+
+    Parameters
+    ----------
+    model_name : str, optional
+        Name of pre-trained token classification model
+    tokenizer_name : str, optional
+        Name of (fast) tokenizer associated with BERT model
+    quantize : bool, optional
+        Flag for applying dynamic int8 quantization to the model's linear layers,
+        which speeds up CPU inference at a small cost in accuracy
+
+    Returns
+    -------
+    model : transformers.PreTrainedModel
+        Pre-trained BERT model, in evaluation mode
+    tokenizer : transformers.PreTrainedTokenizerFast
+        Tokenizer associated with BERT model
+    """
+    key = (model_name, tokenizer_name, bool(quantize))
+    if key not in _BERT_MODELS:
+        import torch
+        from transformers import AutoModelForTokenClassification, AutoTokenizer
+        model = AutoModelForTokenClassification.from_pretrained(model_name)
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        # Fast tokenizers are required for character offset mappings
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True)
+        _BERT_MODELS[key] = (model, tokenizer)
+    return _BERT_MODELS[key]
+
+
+def preload(model_name=DEFAULT_MODEL, coref=True, disable=()):
+    """Method to load a Spacy pipeline before forking worker processes
+
+    Call this in the parent process before creating a (fork-based) worker pool:
+    workers then share the model weights as copy-on-write pages instead of
+    each loading their own copy. Objects allocated so far are moved out of
+    the garbage collector's reach, so that collections in the workers do not
+    touch (and hence copy) the shared pages.
+
+    Parameters
+    ----------
+    model_name : str, optional
+        Name of Spacy model to load
+    coref : bool, optional
+        Flag for adding neuralcoref to the pipeline
+    disable : tuple, optional
+        Names of pipeline components to disable
+
+    Returns
+    -------
+    nlp : spacy.language.Language
+        Loaded Spacy pipeline
+    """
+    nlp = get_nlp(model_name, coref, disable)
+    prepare_fork()
+    return nlp
+
+
+def prepare_fork():
+    """Helper function to keep pages shared with forked workers copy-on-write
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def has_coref(nlp):
+    """Helper function to check whether a pipeline resolves coreferences
+    """
+    return 'neuralcoref' in nlp.pipe_names
+
+
+def clear_cache():
+    """Helper function to release all cached pipelines
+    """
+    _PIPELINES.clear()
+    _BERT_MODELS.clear()
@@ -0,0 +1,243 @@
+import collections
+import queue
+import sys
+import threading
+
+import networkx as nx
+import pandas as pd
+from tqdm import tqdm
+
+from canon_utils import canonicalize_triplets
+from kg_utils import (extract_triplets_stream, merge_duplicate_subjs,
+                      prune_infreq_subjects, prune_infreq_objects, prune_self_loops)
+from scraper_utils import PAGE_BLACKLIST, wiki_crawl
+
+
+def background(iterable, maxsize=64):
+    """Method to consume an iterable in a background thread, through a bounded queue
+
+    The producer blocks once `maxsize` items are waiting to be consumed
+    (backpressure), so a fast producer (e.g. network I/O) never runs
+    arbitrarily far ahead of a slow consumer (e.g. NLP).
+    Exceptions raised by the producer are re-raised in the consumer.
+    If the consumer stops early (e.g. the generator is closed), the producer 
+    stops at its next item instead of blocking on the full queue.
+
+    Parameters
+    ----------
+    iterable : iterable
+        Stream of items to produce in the background
+    maxsize : int, optional
+        Maximum number of buffered items
+
+    Yields
+    ------
+    item
+        Items of `iterable`, in order
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+
+    def put(entry):
+        """Helper function to wait for free space, unless the consumer has stopped
+        """
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    # Release the resources of the iterable (e.g. a crawler's thread pool)
+                    if hasattr(iterable, 'close'):
+                        iterable.close()
+                    return
+        except BaseException:
+            put((done, sys.exc_info()[1]))
+        else:
+            put((done, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def stream_pages(start_page_name, depth=1, cat_whitelist=None, cache=None, wiki_api=None,
+                 max_in_flight=5, maxsize=64):
+    """Method to stream scraped Wikipedia articles, crawling in a background thread
+
+    Generic Wikipedia pages and (near-)empty pages are skipped,
+    consistently with `scraper_utils.wiki_scrape`.
+
+    Parameters
+    ----------
+    start_page_name : str
+        Name of page to start crawling from
+    depth : int, optional
+        Maximum number of hops from the starting page
+    cat_whitelist : set, optional
+        Whitelist of categories for pruning the crawl (see `scraper_utils.wiki_crawl`)
+    cache : scraper_utils.PageCache, optional
+        Page cache, so that unchanged pages are not downloaded again
+    wiki_api : wikipediaapi.Wikipedia, optional
+        Wikipedia API (or any object with a compatible `page` method)
+    max_in_flight : int, optional
+        Maximum number of concurrent requests
+    maxsize : int, optional
+        Maximum number of scraped pages buffered ahead of the consumer
+
+    Yields
+    ------
+    page : dict
+        Scraped page with entries ('page', 'text', 'link', 'categories')
+    """
+    pages = wiki_crawl(start_page_name, depth=depth, cat_whitelist=cat_whitelist,
+                       max_in_flight=max_in_flight, cache=cache, wiki_api=wiki_api,
+                       verbose=False)
+    for page in background(pages, maxsize=maxsize):
+        if len(page['text']) <= 20 or page['page'].startswith(PAGE_BLACKLIST):
+            continue
+        yield {'page': page['page'], 'text': page['text'], 'link': page['link'],
+               'categories': [cat[9:] for cat in page['categories']]}
+
+
+class KGBuilder:
+    """Incremental knowledge graph builder
+
+    Triplets are added as they are extracted, and only unique
+    (subject, relation, object) triplets are kept in memory, with their counts.
+    Duplicate subjects are merged and infrequent subjects/objects are pruned
+    once all triplets have been added (see `KGBuilder.triplets`).
+    """
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.n_pages = 0
+
+    def add(self, sro_triplets):
+        """Method to add (subject, relation, object) triplets extracted from one page
+        """
+        self.counts.update(sro_triplets)
+        self.n_pages += 1
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def triplets(self, merge=True, subj_threshold=2, obj_threshold=2, self_loops=False, 
+                 canonicalize=False, nlp=None):
+        """Method to build the S-R-O triplets dataframe, after merging and pruning
+
+        Parameters
+        ----------
+        merge : bool, optional
+            Flag for merging duplicate subjects (see `kg_utils.merge_duplicate_subjs`)
+        subj_threshold : int, optional
+            Frequency threshold for pruning subjects
+        obj_threshold : int, optional
+            Frequency threshold for pruning objects
+        self_loops : bool, optional
+            Flag for keeping triplets where subject is the same as object
+        canonicalize : bool, optional
+            Flag for rewriting near-duplicate entities and relations by word vector 
+            similarity before pruning (see `canon_utils.canonicalize_triplets`)
+        nlp : spacy.language.Language, optional
+            Spacy pipeline with word vectors, used if `canonicalize` is set
+
+        Returns
+        -------
+        triplets : pd.DataFrame
+            S-R-O triplets dataframe
+        """
+        triplets = pd.DataFrame(list(self.counts.keys()), columns=['subject', 'relation', 'object'])
+        # Repeat unique triplets by their counts, so that frequencies are preserved
+        triplets = triplets.loc[triplets.index.repeat(list(self.counts.values()))].reset_index(drop=True)
+        if len(triplets) == 0:
+            return triplets
+        if merge:
+            triplets = merge_duplicate_subjs(triplets)
+        if canonicalize:
+            triplets = canonicalize_triplets(triplets, nlp=nlp)
+        triplets = prune_infreq_subjects(triplets, subj_threshold)
+        triplets = prune_infreq_objects(triplets, obj_threshold)
+        if not self_loops:
+            triplets = prune_self_loops(triplets)
+        return triplets
+
+
+def triplets_to_graph(triplets):
+    """Method to build a networkx graph from S-R-O triplets, with relations as edge attributes
+    """
+    return nx.from_pandas_edgelist(triplets, source='subject', target='object',
+                                   edge_attr='relation', create_using=nx.MultiDiGraph())
+
+
+def run_pipeline(start_page_name, global_ents_list, depth=1, cat_whitelist=None, cache=None,
+                 wiki_api=None, batch_size=16, maxsize=64, nlp=None, verbose=True, **kwargs):
+    """Method to build a knowledge graph end-to-end, streaming pages through each stage
+
+    Stages: scrape -> clean -> coref -> extract -> merge/prune -> graph.
+    Pages are crawled in a background thread while NLP runs in the foreground,
+    and pages/Docs are discarded as soon as their triplets are extracted, so
+    memory does not grow with the amount of scraped text.
+
+    Parameters
+    ----------
+    start_page_name : str
+        Name of page to start crawling from
+    global_ents_list : list
+        List of domain-specific entities which Spacy tools do not
+        recognize as Named entities or Nouns chunks
+    depth : int, optional
+        Maximum number of hops from the starting page
+    cat_whitelist : set, optional
+        Whitelist of categories for pruning the crawl
+    cache : scraper_utils.PageCache, optional
+        Page cache, so that unchanged pages are not downloaded again
+    wiki_api : wikipediaapi.Wikipedia, optional
+        Wikipedia API (or any object with a compatible `page` method)
+    batch_size : int, optional
+        Number of documents buffered per `nlp.pipe` batch
+    maxsize : int, optional
+        Maximum number of scraped pages buffered ahead of NLP
+    nlp : spacy.language.Language, optional
+        Spacy pipeline, defaults to `model_utils.get_nlp()`
+    verbose : bool, optional
+        Flag for displaying progress bar
+    **kwargs
+        Merging/pruning options passed to `KGBuilder.triplets`
+
+    Returns
+    -------
+    triplets : pd.DataFrame
+        S-R-O triplets dataframe
+    k_graph : nx.MultiDiGraph
+        Knowledge graph built from triplets
+    """
+    pages = stream_pages(start_page_name, depth=depth, cat_whitelist=cat_whitelist,
+                         cache=cache, wiki_api=wiki_api, maxsize=maxsize)
+    records = ((page['page'], page['text']) for page in pages)
+
+    builder = KGBuilder()
+    progress = tqdm(desc='Pages Extracted', unit='') if verbose else None
+    for _, sro_triplets in extract_triplets_stream(records, global_ents_list, batch_size, nlp=nlp):
+        builder.add(sro_triplets)
+        progress.update(1) if verbose else None
+    progress.close() if verbose else None
+
+    triplets = builder.triplets(nlp=nlp, **kwargs)
+    k_graph = triplets_to_graph(triplets)
+    return triplets, k_graph
@@ -0,0 +1,280 @@
+import numpy as np
+import pandas as pd
+
+from store_utils import TripletStore
+
+# Positions of subject, relation and object in triplets and patterns
+_S, _R, _O = 0, 1, 2
+# Orders of the sorted indexes, as permutations of (subject, relation, object)
+_ORDERS = {'spo': (_S, _R, _O), 'pos': (_R, _O, _S), 'osp': (_O, _S, _R)}
+# Number of matching triplets decoded at once when streaming results
+_CHUNK_SIZE = 4096
+
+
+class TripletQueryEngine:
+    """In-memory query engine over S-R-O triplets, with SPO, POS and OSP indexes
+
+    Subjects/objects and relations are encoded as integer ids (see
+    `store_utils.TripletStore`), and triplets are sorted in three orders,
+    so that the triplets matching any combination of fixed subject, relation
+    and object form a contiguous range of one of the indexes, found by
+    binary search (`np.searchsorted`) in O(log n) time.
+
+    Queries are basic graph patterns: lists of (subject, relation, object)
+    patterns whose terms are either strings, variables (strings starting
+    with '?', e.g. '?x') or wildcards ('?' or None). Patterns are joined on
+    shared variables, in order of their number of matching triplets, and
+    results are streamed.
+
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore
+        S-R-O triplets dataframe
+
+    Examples
+    --------
+    >>> engine = TripletQueryEngine(triplets)
+    >>> list(engine.triplets(subject='aspirin'))
+    >>> engine.count(relation='acquire')
+    >>> list(engine.query(('bayer', '?', '?x'), ('?x', '?r', '?y')))
+    """
+    def __init__(self, triplets):
+        if not isinstance(triplets, TripletStore):
+            triplets = TripletStore.from_dataframe(triplets)
+        self.entities = triplets.entities
+        self.relations = triplets.relations
+        columns = (triplets.subject, triplets.relation, triplets.object)
+
+        # Columns of each index, sorted by the index order
+        self.indexes = {}
+        for name, order in _ORDERS.items():
+            # np.lexsort sorts by the last key first
+            perm = np.lexsort([columns[pos] for pos in reversed(order)])
+            self.indexes[name] = tuple(np.ascontiguousarray(columns[pos][perm]) for pos in order)
+
+    def __len__(self):
+        return len(self.indexes['spo'][0])
+
+    def _vocab(self, pos):
+        return self.relations if pos == _R else self.entities
+
+    def _encode(self, pos, term):
+        """Helper function to get the id of a term, or -1 if unknown
+        """
+        return self._vocab(pos).ids.get(term, -1)
+
+    def _range(self, ids):
+        """Helper function to find the range of triplets matching fixed ids (None for free positions)
+
+        Returns
+        -------
+        index : str
+            Name of index whose prefix covers the fixed positions
+        lo, hi : int
+            Range of matching triplets in the index
+        """
+        fixed = tuple(pos for pos in range(3) if ids[pos] is not None)
+        # Index whose order starts with the fixed positions
+        for name, order in _ORDERS.items():
+            if set(order[:len(fixed)]) == set(fixed):
+                break
+        columns = self.indexes[name]
+        lo, hi = 0, len(columns[0])
+        for depth in range(len(fixed)):
+            column = columns[depth][lo:hi]
+            # Keys of another dtype than the column would make numpy convert the whole column
+            value = column.dtype.type(ids[order[depth]])
+            lo, hi = (lo + int(np.searchsorted(column, value, 'left')),
+                      lo + int(np.searchsorted(column, value, 'right')))
+            if lo == hi:
+                break
+        return name, lo, hi
+
+    def _pattern_ids(self, pattern, binding=None):
+        """Helper function to get the ids of the fixed terms of a pattern, given bound variables
+
+        Returns None if a term is unknown, i.e. if the pattern cannot match.
+        """
+        ids = [None, None, None]
+        for pos, term in enumerate(pattern):
+            if _is_free(term):
+                continue
+            if _is_variable(term):
+                if binding is not None and term in binding:
+                    ids[pos] = binding[term]
+                continue
+            ids[pos] = self._encode(pos, term)
+            if ids[pos] < 0:
+                return None
+        return ids
+
+    def count(self, subject=None, relation=None, object=None):
+        """Method to count the triplets matching fixed terms, in O(log n) time
+
+        Parameters
+        ----------
+        subject, relation, object : str, optional
+            Fixed subject, relation and object; any term matches if None
+        """
+        ids = self._pattern_ids((subject, relation, object))
+        if ids is None:
+            return 0
+        _, lo, hi = self._range(ids)
+        return hi - lo
+
+    def triplets(self, subject=None, relation=None, object=None):
+        """Method to stream the triplets matching fixed terms
+
+        Parameters
+        ----------
+        subject, relation, object : str, optional
+            Fixed subject, relation and object; any term matches if None
+
+        Yields
+        ------
+        triplet : tuple
+            Matching (subject, relation, object) triplets, in index order
+        """
+        ids = self._pattern_ids((subject, relation, object))
+        if ids is None:
+            return
+        for triplet in self._scan(ids):
+            yield (self.entities[triplet[_S]], self.relations[triplet[_R]], self.entities[triplet[_O]])
+
+    def _scan(self, ids):
+        """Helper function to stream the id triplets matching fixed ids, in chunks
+        """
+        name, lo, hi = self._range(ids)
+        order = _ORDERS[name]
+        columns = self.indexes[name]
+        # Positions of the columns of the index in (subject, relation, object) order
+        inverse = [order.index(pos) for pos in range(3)]
+        for start in range(lo, hi, _CHUNK_SIZE):
+            stop = min(start + _CHUNK_SIZE, hi)
+            chunk = [columns[i][start:stop].tolist() for i in inverse]
+            yield from zip(*chunk)
+
+    def plan(self, *patterns):
+        """Method to order the patterns of a query for joining
+
+        Patterns are ordered greedily: the next pattern is the one matching
+        the fewest triplets (counted with its fixed terms only) among those
+        sharing a variable with the patterns already ordered, if any,
+        so that intermediate results stay small and cross products are avoided.
+
+        Returns
+        -------
+        plan : list
+            List of (pattern, number of matching triplets) tuples, in join order
+        """
+        patterns = [_check_pattern(pattern) for pattern in patterns]
+        cardinalities = []
+        for pattern in patterns:
+            ids = self._pattern_ids(pattern)
+            cardinalities.append(0 if ids is None else self.count(*[
+                None if _is_free(term) or _is_variable(term) else term for term in pattern]))
+
+        plan = []
+        bound = set()
+        remaining = list(range(len(patterns)))
+        while remaining:
+            connected = [i for i in remaining if bound & _variables(patterns[i])]
+            best = min(connected or remaining, key=lambda i: cardinalities[i])
+            remaining.remove(best)
+            bound |= _variables(patterns[best])
+            plan.append((patterns[best], cardinalities[best]))
+        return plan
+
+    def query(self, *patterns, distinct=False, limit=None):
+        """Method to stream the solutions of a basic graph pattern
+
+        Parameters
+        ----------
+        *patterns : tuple
+            (subject, relation, object) patterns, with variables ('?x') and wildcards ('?' or None)
+        distinct : bool, optional
+            Flag for dropping duplicate solutions (e.g. from triplets extracted several times)
+        limit : int, optional
+            Maximum number of solutions
+
+        Yields
+        ------
+        solution : dict
+            Values of all named variables, e.g. {'?x': 'aspirin'}
+        """
+        ordered = self.plan(*patterns)
+        plan = [pattern for pattern, _ in ordered]
+        # Variables only hold ids of one vocabulary
+        positions = {}
+        for pattern in plan:
+            for pos, term in enumerate(pattern):
+                if _is_variable(term):
+                    if positions.setdefault(term, pos == _R) != (pos == _R):
+                        raise ValueError("Variable {} is used both as a relation and as an entity".format(term))
+        if any(cardinality == 0 for _, cardinality in ordered):
+            return
+
+        seen = set()
+        n_solutions = 0
+        for binding in self._solve(plan, {}):
+            solution = {var: (self.relations if positions[var] else self.entities)[idx]
+                        for var, idx in binding.items()}
+            if distinct:
+                key = tuple(sorted(solution.items()))
+                if key in seen:
+                    continue
+                seen.add(key)
+            yield solution
+            n_solutions += 1
+            if limit is not None and n_solutions >= limit:
+                return
+
+    def _solve(self, plan, binding):
+        """Helper function to join patterns by index nested loops, streaming variable bindings (as ids)
+        """
+        if not plan:
+            yield binding
+            return
+        pattern, rest = plan[0], plan[1:]
+        ids = self._pattern_ids(pattern, binding)
+        if ids is None:
+            return
+        # Variables bound by this pattern (possibly at several positions)
+        new_vars = [(pos, term) for pos, term in enumerate(pattern)
+                    if _is_variable(term) and term not in binding]
+        for triplet in self._scan(ids):
+            extended = dict(binding)
+            for pos, var in new_vars:
+                if extended.setdefault(var, triplet[pos]) != triplet[pos]:
+                    break
+            else:
+                yield from self._solve(rest, extended)
+
+    def query_dataframe(self, *patterns, distinct=False, limit=None):
+        """Method to collect the solutions of a basic graph pattern into a dataframe (see `query`)
+        """
+        variables = sorted(set().union(*[_variables(_check_pattern(pattern)) for pattern in patterns]))
+        return pd.DataFrame(list(self.query(*patterns, distinct=distinct, limit=limit)), columns=variables)
+
+
+def _is_free(term):
+    """Helper function to check if a pattern term is a wildcard
+    """
+    return term is None or term == '?'
+
+
+def _is_variable(term):
+    """Helper function to check if a pattern term is a named variable
+    """
+    return isinstance(term, str) and len(term) > 1 and term.startswith('?')
+
+
+def _variables(pattern):
+    return set(term for term in pattern if _is_variable(term))
+
+
+def _check_pattern(pattern):
+    pattern = tuple(pattern)
+    if len(pattern) != 3:
+        raise ValueError("Patterns must be (subject, relation, object) tuples, got {!r}".format(pattern))
+    return pattern
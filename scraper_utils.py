@@ -1,10 +1,410 @@
 import wikipediaapi
 import pandas as pd
+import numpy as np
+import asyncio
+import collections
 import concurrent.futures
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
 from tqdm import tqdm
 
+import instrument_utils as instrument
 
-def wiki_scrape(start_page_name, verbose=True):
+logger = logging.getLogger(__name__)
+
+# Prefixes of generic Wikipedia pages, which are not scraped
+PAGE_BLACKLIST = ('Template', 'Help:', 'Category:', 'Portal:', 'Wikipedia:', 'Talk:')
+
+# MediaWiki API endpoint and limits used by `wiki_scrape_async`
+WIKI_API_URL = 'https://en.wikipedia.org/w/api.php'
+MAX_TITLES_PER_QUERY = 50
+USER_AGENT = 'knowledge-graphs (https://github.com/chaitjo/knowledge-graphs)'
+
+# Maximum number of variables per SQLite query (the default limit of older SQLite versions)
+_MAX_VARIABLES = 999
+
+# Time (in seconds) for which cached pages are served without revalidation, by default
+DEFAULT_PAGE_TTL = 24 * 60 * 60
+
+
+class PageCache:
+    """Persistent on-disk cache of scraped Wikipedia pages
+    
+    Pages are stored in a SQLite database as zlib-compressed JSON 
+    (text, fullurl, categories and optionally links), addressed by title 
+    and the revision id they were scraped at. Only the latest cached revision 
+    of a page is kept, and served for lookups by title only.
+    
+    Entries younger than `ttl` are served without any network call. 
+    Older entries are revalidated against the page's latest revision id, 
+    and only re-fetched if the page has changed. When `max_bytes` is set, 
+    least recently used entries are evicted to keep the cache under that size.
+    
+    Revalidation costs one API call per page with `wiki_scrape`/`wiki_crawl`, 
+    and one query per batch of `MAX_TITLES_PER_QUERY` pages with `wiki_scrape_async` 
+    (whose revision ids are queried together with categories), so by default 
+    entries are trusted for a day: re-runs within a day make no network calls, 
+    at the cost of missing edits made since pages were cached.
+    
+    Parameters
+    ----------
+    path : str, optional
+        Path to SQLite database file
+    ttl : float, optional
+        Time (in seconds) for which entries are served without revalidation 
+        (defaults to `DEFAULT_PAGE_TTL`), entries are always revalidated if None
+    max_bytes : int, optional
+        Maximum total size of compressed entries, unbounded if None
+    offline : bool, optional
+        Flag for serving pages from cache only, without any network calls
+    """
+    def __init__(self, path='wiki_cache.sqlite', ttl=DEFAULT_PAGE_TTL, max_bytes=None, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        # Access times of looked up entries, written with the next commit
+        self._accessed = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Pages which do not exist are stored with revision id 0
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS page_revisions (
+                title TEXT NOT NULL,
+                revid INTEGER NOT NULL,
+                fetched_at REAL,
+                accessed_at REAL,
+                size INTEGER,
+                data BLOB,
+                PRIMARY KEY (title, revid)
+            )""")
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM page_revisions").fetchone()[0]
+    
+    def get(self, title, revid=None):
+        """Method to look up a cached page
+        
+        Parameters
+        ----------
+        title : str
+            Title of page
+        revid : int, optional
+            Revision id of page, defaults to the latest cached revision
+        
+        Returns
+        -------
+        entry : dict or None
+            Cached entry with keys ('revid', 'fetched_at', 'data'), where 'data' is 
+            the scraped page dict (or None for pages which do not exist),
+            None if the page (at this revision) is not cached
+        """
+        return self.get_many([title], None if revid is None else [revid])[0]
+    
+    def get_many(self, titles, revids=None):
+        """Method to look up several cached pages at once, in a single query
+        
+        Lookups only update access times in memory, which are written to the database 
+        with the next update (or `flush`), so that reads do not commit.
+        
+        Parameters
+        ----------
+        titles : list
+            Titles of pages
+        revids : list, optional
+            Revision id of each page, defaults to the latest cached revisions
+        
+        Returns
+        -------
+        entries : list
+            Cached entry (see `get`) or None for each title
+        """
+        titles = list(titles)
+        rows = {}
+        with self._lock:
+            for i in range(0, len(titles), _MAX_VARIABLES):
+                batch = titles[i:i+_MAX_VARIABLES]
+                query = "SELECT title, revid, fetched_at, data FROM page_revisions WHERE title IN ({})".format(
+                    ','.join('?' * len(batch)))
+                for title, revid, fetched_at, data in self._conn.execute(query, batch):
+                    rows[title] = (revid, fetched_at, data)
+            now = time.time()
+            entries = []
+            for i, title in enumerate(titles):
+                row = rows.get(title)
+                if row is None or (revids is not None and revids[i] is not None and row[0] != revids[i]):
+                    entries.append(None)
+                    continue
+                revid, fetched_at, data = row
+                self._accessed[(title, revid)] = now
+                entries.append({'revid': revid or None, 'fetched_at': fetched_at,
+                                'data': json.loads(zlib.decompress(data).decode('utf-8'))})
+        return entries
+    
+    def put(self, title, revid, data):
+        """Method to store a scraped page (or None for pages which do not exist)
+        """
+        self.put_many([(title, revid, data)])
+    
+    def put_many(self, items):
+        """Method to store several scraped pages in a single transaction
+        
+        Parameters
+        ----------
+        items : list
+            Tuples of (title, revid, data), with data None for pages which do not exist; 
+            other revisions of these pages are replaced
+        """
+        now = time.time()
+        with self._lock:
+            for title, revid, data in items:
+                blob = zlib.compress(json.dumps(data).encode('utf-8'))
+                for (size,) in self._conn.execute(
+                        "SELECT size FROM page_revisions WHERE title=?", (title,)):
+                    self._size -= size
+                self._conn.execute("DELETE FROM page_revisions WHERE title=?", (title,))
+                self._conn.execute(
+                    "INSERT INTO page_revisions (title, revid, fetched_at, accessed_at, size, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (title, revid or 0, now, now, len(blob), blob))
+                self._accessed.pop((title, revid or 0), None)
+                self._size += len(blob)
+            self._commit()
+    
+    def revalidate(self, title):
+        """Method to mark a cached page as up-to-date, restarting its TTL
+        """
+        self.revalidate_many([title])
+    
+    def revalidate_many(self, titles):
+        """Method to mark several cached pages as up-to-date in a single transaction
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE page_revisions SET fetched_at=?, accessed_at=? WHERE title=?", 
+                [(now, now, title) for title in titles])
+            self._commit()
+    
+    def is_fresh(self, entry):
+        """Method to check whether a cached entry can be served without revalidation
+        """
+        return self.ttl is not None and time.time() - entry['fetched_at'] < self.ttl
+    
+    def flush(self):
+        """Method to write pending access times to the database
+        """
+        with self._lock:
+            self._commit()
+    
+    def _commit(self):
+        """Helper function to write pending access times, evict entries above `max_bytes` and commit
+        """
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE page_revisions SET accessed_at=? WHERE title=? AND revid=? AND accessed_at<?", 
+                [(accessed_at, title, revid, accessed_at) for (title, revid), accessed_at in self._accessed.items()])
+            self._accessed.clear()
+        self._evict()
+        self._conn.commit()
+    
+    def _evict(self):
+        """Helper function to evict least recently used entries above `max_bytes`
+        """
+        if self.max_bytes is None or self._size <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT title, revid, size FROM page_revisions ORDER BY accessed_at")
+        evicted = []
+        for title, revid, size in rows:
+            if self._size <= self.max_bytes:
+                break
+            evicted.append((title, revid))
+            self._size -= size
+        self._conn.executemany("DELETE FROM page_revisions WHERE title=? AND revid=?", evicted)
+    
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM page_revisions").fetchone()[0]
+    
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+
+def fetch_page(wiki_api, title, cache=None, with_links=False):
+    """Method to scrape a single Wikipedia page, going through the page cache
+    
+    Parameters
+    ----------
+    wiki_api : wikipediaapi.Wikipedia
+        Wikipedia API (or any object with a compatible `page` method)
+    title : str
+        Title of page to scrape
+    cache : PageCache, optional
+        Page cache to serve from and update
+    with_links : bool or callable, optional
+        Flag for also scraping titles of pages linked from this page, 
+        or function deciding so given the scraped page dict
+    
+    Returns
+    -------
+    data : dict or None
+        Scraped page with entries ('page', 'text', 'link', 'categories', 'revid'),
+        and 'links' if `with_links` is set; None if page does not exist
+    """
+    def wants_links(data):
+        return with_links(data) if callable(with_links) else with_links
+    
+    entry, usable = None, False
+    if cache is not None:
+        entry = cache.get(title)
+        if entry is not None:
+            usable = (entry['data'] is None or 'links' in entry['data'] 
+                      or not wants_links(entry['data']))
+            if cache.offline or (usable and cache.is_fresh(entry)):
+                instrument.count('scrape.cache_hits')
+                return entry['data']
+        elif cache.offline:
+            return None
+    
+    # Page attributes are fetched lazily by the API, so HTTP requests are timed together
+    with instrument.timer('scrape.http'):
+        page = wiki_api.page(title)
+        if not page.exists():
+            if cache is not None:
+                cache.put(title, None, None)
+            return None
+        revid = getattr(page, 'lastrevid', None)
+        
+        # Page has not changed since it was cached: no need to re-fetch its contents
+        if usable and revid is not None and entry['revid'] == revid:
+            cache.revalidate(title)
+            instrument.count('scrape.cache_revalidated')
+            return entry['data']
+        
+        data = {'page': title, 'text': page.text, 'link': page.fullurl,
+                'categories': list(page.categories.keys()), 'revid': revid}
+        if wants_links(data):
+            data['links'] = list(page.links.keys())
+    instrument.count('scrape.pages_fetched')
+    instrument.count('scrape.bytes', len(data['text'].encode('utf-8')))
+    if cache is not None:
+        cache.put(title, revid, data)
+    return data
+
+
+def wiki_crawl(start_page_name, depth=1, cat_whitelist=None, max_in_flight=5, 
+               max_retries=3, backoff=1.0, cache=None, wiki_api=None, verbose=True):
+    """Method to crawl Wikipedia pages breadth-first from a starting page
+    
+    Pages are fetched with at most `max_in_flight` concurrent requests and 
+    yielded as soon as they are scraped. Links are followed up to `depth` hops 
+    from the starting page; each page is fetched at most once. 
+    
+    Parameters
+    ----------
+    start_page_name : str
+        Name of page to start crawling from
+    depth : int, optional
+        Maximum number of hops from the starting page
+    cat_whitelist : set, optional
+        Whitelist of categories (see `build_category_whitelist`): links are only 
+        followed from pages in at least one whitelisted category. 
+        Links from the starting page are always followed.
+    max_in_flight : int, optional
+        Maximum number of concurrent requests
+    max_retries : int, optional
+        Number of retries for failed requests
+    backoff : float, optional
+        Delay (in seconds) before the first retry, doubled for every retry
+    cache : PageCache, optional
+        Page cache, so that unchanged pages are not downloaded again
+    wiki_api : wikipediaapi.Wikipedia, optional
+        Wikipedia API (or any object with a compatible `page` method),
+        defaults to the English Wikipedia API
+    verbose : bool, optional
+        Flag for displaying progress bar and verbose output
+    
+    Yields
+    ------
+    data : dict
+        Scraped page with entries ('page', 'text', 'link', 'categories', 'revid'),
+        and 'links' for pages whose links were followed
+    """
+    def follow_links(data, hops):
+        """Helper function to decide whether to follow links from a page
+        """
+        if hops >= depth:
+            return False
+        if hops == 0 or cat_whitelist is None:
+            return True
+        return any(cat[9:] in cat_whitelist for cat in data['categories'])
+    
+    def follow_link(link, hops):
+        """Helper function to follow links using Wikipedia API, with retries
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                return fetch_page(wiki_api, link, cache, 
+                                  with_links=lambda data: follow_links(data, hops))
+            except Exception as e:
+                if attempt == max_retries:
+                    logger.warning("Failed to scrape page %r: %r", link, e)
+                    instrument.count('scrape.failures')
+                    return None
+                instrument.count('scrape.retries')
+                time.sleep(backoff * 2 ** attempt)
+    
+    # Instantiate Wikipedia API (not needed when serving from cache only)
+    if wiki_api is None and not (cache is not None and cache.offline):
+        wiki_api = wikipediaapi.Wikipedia(language='en', extract_format=wikipediaapi.ExtractFormat.WIKI)
+    
+    # Deduplicated frontier of (page, hops from starting page)
+    frontier = collections.deque([(start_page_name, 0)])
+    seen = {start_page_name}
+    
+    # Multithreading to parallely scrape from multiple pages
+    progress = tqdm(desc='Pages Scraped', unit='', total=1) if verbose else None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = {}
+        while frontier or in_flight:
+            # Keep at most max_in_flight requests in flight
+            while frontier and len(in_flight) < max_in_flight:
+                link, hops = frontier.popleft()
+                in_flight[executor.submit(follow_link, link, hops)] = (link, hops)
+            
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                link, hops = in_flight.pop(future)
+                data = future.result()
+                progress.update(1) if verbose else None
+                if data is None:
+                    if hops == 0:
+                        print('page does not exist')
+                    continue
+                
+                # Extend frontier with unseen links
+                for next_link in data.get('links', ()):
+                    if next_link not in seen and not next_link.startswith(PAGE_BLACKLIST):
+                        seen.add(next_link)
+                        frontier.append((next_link, hops + 1))
+                        if verbose:
+                            progress.total += 1
+                
+                yield data
+            progress.refresh() if verbose else None
+    progress.close() if verbose else None
+    if cache is not None:
+        cache.flush()
+
+
+def wiki_scrape(start_page_name, verbose=True, cache=None, wiki_api=None, 
+                depth=1, cat_whitelist=None, max_in_flight=5):
     """Method to scrape Wikipedia pages associated with/linked to a starting page
     
     Parameters
@@ -13,6 +413,17 @@ def wiki_scrape(start_page_name, verbose=True):
         Name of page to start scraping from
     verbose : bool, optional
         Flag for displaying progress bar and verbose output
+    cache : PageCache, optional
+        Page cache, so that unchanged pages are not downloaded again
+    wiki_api : wikipediaapi.Wikipedia, optional
+        Wikipedia API (or any object with a compatible `page` method),
+        defaults to the English Wikipedia API
+    depth : int, optional
+        Maximum number of hops from the starting page (see `wiki_crawl`)
+    cat_whitelist : set, optional
+        Whitelist of categories for pruning the crawl (see `wiki_crawl`)
+    max_in_flight : int, optional
+        Maximum number of concurrent requests
 
     Returns
     -------
@@ -24,64 +435,402 @@ def wiki_scrape(start_page_name, verbose=True):
     ----------
     Modified from https://towardsdatascience.com/auto-generated-knowledge-graphs-92ca99a81121
     """
-    def follow_link(link):
-        """Helper function to follow links using Wikipedia API
+    sources = list(wiki_crawl(start_page_name, depth=depth, cat_whitelist=cat_whitelist, 
+                              max_in_flight=max_in_flight, cache=cache, wiki_api=wiki_api, 
+                              verbose=verbose))
+    if len(sources) == 0:
+        return
+    return _build_sources_df(sources)
+
+
+def _build_sources_df(sources):
+    """Helper function to convert scraped pages to a DataFrame
+    
+    Generic Wikipedia pages and (near-)empty pages are filtered out,
+    and the 'Category:' prefix is stripped from categories.
+    """
+    # Convert dict to df
+    sources = pd.DataFrame(sources, columns=['page', 'text', 'link', 'categories'])
+    
+    # Filter out generic Wikipedia pages
+    sources = sources[(sources['text'].str.len() > 20)
+                      & ~(sources['page'].str.startswith(PAGE_BLACKLIST))].copy()
+    sources['categories'] = sources.categories.apply(lambda x: [y[9:] for y in x])
+    
+    return sources
+
+
+class TokenBucket:
+    """Token-bucket rate limiter for asyncio coroutines
+    
+    Parameters
+    ----------
+    rate : float
+        Number of tokens (requests) added per second
+    capacity : float, optional
+        Maximum number of tokens, i.e. size of bursts, defaults to `rate`
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = None
+    
+    async def acquire(self):
+        """Method to wait until a token is available, and consume it
         """
-        try:
-            page = wiki_api.page(link)
-            if page.exists():
-                d = {'page': link, 'text': page.text, 'link': page.fullurl,
-                     'categories': list(page.categories.keys())}
-                return d
-            else:
-                return None
-        except:
-            return None
+        if self._lock is None:
+            # Created lazily, so that the lock belongs to the running event loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def wiki_scrape_async(start_page_name, verbose=True, cache=None, api_url=WIKI_API_URL, 
+                      rate=50, max_connections=10, max_retries=3, backoff=1.0, 
+                      user_agent=USER_AGENT):
+    """Method to scrape Wikipedia pages linked to a starting page, using asyncio
     
-    # Instantiate Wikipedia API
-    wiki_api = wikipediaapi.Wikipedia(language='en', extract_format=wikipediaapi.ExtractFormat.WIKI)
+    Unlike `wiki_scrape`, which makes separate info, extract and category queries 
+    for each page through `wikipediaapi`, pages are looked up through the MediaWiki API 
+    directly, over a pooled HTTP session with a token-bucket rate limit. Info and categories 
+    are queried in batches of `MAX_TITLES_PER_QUERY` titles, but the TextExtracts API only 
+    returns the full text of one page per query, so texts still cost one query per page 
+    (made concurrently, up to `max_connections`). For a page with 500 links on a local 
+    fake API (see `bench_utils.FakeWikiAPI.serve`), this makes 511 queries, 
+    instead of about 1500 with `wikipediaapi`. Stale cached pages are revalidated by the 
+    batched info queries, and their texts are only queried again if they have changed. 
+    Requires the `aiohttp` package.
     
-    # Scrape starting page
-    page_name = wiki_api.page(start_page_name)
-    if not page_name.exists():
+    Parameters
+    ----------
+    start_page_name : str
+        Name of page to start scraping from
+    verbose : bool, optional
+        Flag for displaying progress bar and verbose output
+    cache : PageCache, optional
+        Page cache; fresh entries (see `PageCache.ttl`) are not downloaded again
+    api_url : str, optional
+        URL of MediaWiki API endpoint
+    rate : float, optional
+        Maximum number of requests per second
+    max_connections : int, optional
+        Maximum number of pooled connections, i.e. concurrent requests
+    max_retries : int, optional
+        Number of retries for failed requests
+    backoff : float, optional
+        Delay (in seconds) before the first retry, doubled for every retry
+    user_agent : str, optional
+        User-Agent header sent with every request, as required by Wikimedia
+    
+    Returns
+    -------
+    sources : pd.DataFrame
+        DataFrame containing all scraped Wikipedia articles linked to start_page_name,
+        with entries ('page', 'text', 'link', 'categories')
+    """
+    scraper = _AsyncScraper(api_url, cache, rate, max_connections, max_retries, backoff, user_agent)
+    sources = asyncio.run(scraper.scrape(start_page_name, verbose))
+    if len(sources) == 0:
         print('page does not exist')
         return
+    return _build_sources_df(sources)
+
+
+class _AsyncScraper:
+    """Helper class holding the HTTP session and rate limiter for `wiki_scrape_async`
+    """
+    def __init__(self, api_url, cache, rate, max_connections, max_retries, backoff, user_agent):
+        self.api_url = api_url
+        self.cache = cache
+        self.limiter = TokenBucket(rate)
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.user_agent = user_agent
+        self.session = None
+        self.n_requests = 0
     
-    # Initialize dict (to be converted to df)
-    sources = [{
-        'page': start_page_name, 
-        'text': page_name.text, 
-        'link': page_name.fullurl,
-        'categories': list(page_name.categories.keys())
-    }]
-    
-    page_links = set(page_name.links.keys())
-    # Multiprocessing to parallely scrape from multiple pages
-    progress = tqdm(desc='Links Scraped', unit='', total=len(page_links)) if verbose else None
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        # Follow links from list of links
-        future_link = {executor.submit(follow_link, link): link for link in page_links}
-        for future in concurrent.futures.as_completed(future_link):
-            data = future.result()
-            progress.update(1) if verbose else None
-            if data:
-                # Update sources dict
-                sources.append(data)
-    progress.close() if verbose else None
+    async def scrape(self, start_page_name, verbose):
+        import aiohttp
+        
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        headers = {'User-Agent': self.user_agent}
+        async with aiohttp.ClientSession(connector=connector, headers=headers) as self.session:
+            start_page = (await self.fetch_pages([start_page_name], with_links=True))[0]
+            if start_page is None:
+                return []
+            
+            page_links = sorted(set(start_page['links']))
+            batches = [page_links[i:i+MAX_TITLES_PER_QUERY] 
+                       for i in range(0, len(page_links), MAX_TITLES_PER_QUERY)]
+            
+            sources = [start_page]
+            progress = tqdm(desc='Links Scraped', unit='', total=len(page_links)) if verbose else None
+            for batch in asyncio.as_completed([self.fetch_batch(batch) for batch in batches]):
+                pages = await batch
+                progress.update(len(pages)) if verbose else None
+                sources += [page for page in pages if page is not None]
+            progress.close() if verbose else None
+        if self.cache is not None:
+            self.cache.flush()
+        return sources
     
-    # Convert dict to df
-    sources = pd.DataFrame(sources)
+    async def fetch_batch(self, titles):
+        """Method to scrape a batch of linked pages, skipping the whole batch if it still fails after retries
+        
+        Failed pages are logged and counted as in `wiki_crawl`, so the pages of other batches are kept.
+        """
+        try:
+            return await self.fetch_pages(titles)
+        except Exception as e:
+            logger.warning("Failed to scrape pages %r: %r", titles, e)
+            instrument.count('scrape.failures', len(titles))
+            return [None] * len(titles)
     
-    # Filter out generic Wikipedia pages
-    blacklist = ('Template', 'Help:', 'Category:', 'Portal:', 'Wikipedia:', 'Talk:')
-    sources = sources[(len(sources['text']) > 20)
-                      & ~(sources['page'].str.startswith(blacklist))]
-    sources['categories'] = sources.categories.apply(lambda x: [y[9:] for y in x])
+    async def fetch_pages(self, titles, with_links=False):
+        """Method to scrape a batch of pages, returning one dict (or None) per title
+        
+        Info (revision id and URL), categories and optionally links of all pages are queried 
+        together, `MAX_TITLES_PER_QUERY` titles per query (plus continuations, since category 
+        and link limits are shared by all pages of a query). The TextExtracts API only returns 
+        the full-text extract of one page per query, so texts are then queried separately, 
+        one query per page, concurrently. Stale cached pages are revalidated by the info query, 
+        and texts are only queried again for pages whose revision id has changed.
+        """
+        pages = {}
+        stale = {}
+        if self.cache is not None:
+            for title, entry in zip(titles, self.cache.get_many(titles)):
+                if entry is None:
+                    continue
+                has_links = entry['data'] is None or 'links' in entry['data'] or not with_links
+                if self.cache.offline or (has_links and self.cache.is_fresh(entry)):
+                    pages[title] = entry['data']
+                elif entry['data'] is not None:
+                    stale[title] = entry
+            instrument.count('scrape.cache_hits', len(pages))
+        missing = [title for title in titles if title not in pages]
+        if len(missing) == 0 or (self.cache is not None and self.cache.offline):
+            return [pages.get(title) for title in titles]
+        
+        params = {'prop': 'info|categories', 'inprop': 'url', 'cllimit': 'max'}
+        if with_links:
+            params.update(prop='info|categories|links', pllimit='max')
+        results = await self.query_pages(missing, params)
+        
+        # Pages which have not changed since they were cached: no need to re-fetch their texts
+        revalidated = [title for title in missing if title in stale and results[title] is not None 
+                       and stale[title]['revid'] is not None 
+                       and stale[title]['revid'] == results[title].get('lastrevid')]
+        fetched = []
+        for title in revalidated:
+            pages[title] = stale[title]['data']
+            if with_links and 'links' not in pages[title]:
+                pages[title] = dict(pages[title], links=list(dict.fromkeys(results[title]['links'])))
+                fetched.append((title, pages[title]['revid'], pages[title]))
+        if len(revalidated) > 0:
+            self.cache.revalidate_many(revalidated)
+            instrument.count('scrape.cache_revalidated', len(revalidated))
+        
+        found = [title for title in missing if results[title] is not None and title not in pages]
+        extracts = await asyncio.gather(*[
+            self.query_pages([title], {'prop': 'extracts', 'explaintext': '1', 'exsectionformat': 'wiki'}) 
+            for title in found])
+        extracts = dict(zip(found, extracts))
+        
+        for title in missing:
+            if title in pages:
+                continue
+            result = results[title]
+            if result is None:
+                data = None
+            else:
+                extract = extracts[title][title]
+                data = {'page': title, 'text': (extract or {}).get('text', ''), 'link': result.get('fullurl'),
+                        'categories': list(dict.fromkeys(result['categories'])), 
+                        'revid': result.get('lastrevid')}
+                if with_links:
+                    data['links'] = list(dict.fromkeys(result['links']))
+                instrument.count('scrape.pages_fetched')
+                instrument.count('scrape.bytes', len(data['text'].encode('utf-8')))
+            fetched.append((title, data['revid'] if data else None, data))
+            pages[title] = data
+        if self.cache is not None and len(fetched) > 0:
+            self.cache.put_many(fetched)
+        
+        return [pages.get(title) for title in titles]
     
-    return sources
+    async def query_pages(self, titles, params):
+        """Method to query properties of pages, following continuations until they are complete
+        
+        Returns
+        -------
+        results : dict
+            Mapping from each title (resolving normalizations and redirects) to a dict of 
+            its properties ('text', 'fullurl', 'lastrevid', 'categories', 'links'), 
+            or None if the page does not exist
+        """
+        params = dict(params, action='query', format='json', formatversion='2', redirects='1', 
+                      titles='|'.join(titles))
+        results = {}
+        aliases = {}
+        cont = {}
+        while True:
+            response = await self.request(dict(params, **cont))
+            query = response.get('query', {})
+            for alias in query.get('normalized', []) + query.get('redirects', []):
+                aliases[alias['from']] = alias['to']
+            for page in query.get('pages', []):
+                result = results.setdefault(page['title'], {'categories': [], 'links': []})
+                if page.get('missing') or page.get('invalid'):
+                    result['missing'] = True
+                    continue
+                if page.get('extract'):
+                    result['text'] = page['extract']
+                for key in ('fullurl', 'lastrevid'):
+                    if key in page:
+                        result[key] = page[key]
+                result['categories'] += [cat['title'] for cat in page.get('categories', [])]
+                result['links'] += [link['title'] for link in page.get('links', [])]
+            if 'continue' not in response:
+                break
+            cont = response['continue']
+        
+        resolved_results = {}
+        for title in titles:
+            resolved = title
+            while resolved in aliases and aliases[resolved] != resolved:
+                resolved = aliases[resolved]
+            result = results.get(resolved)
+            resolved_results[title] = None if result is None or result.get('missing') else result
+        return resolved_results
+    
+    async def request(self, params):
+        """Method to make a rate-limited API request, with retries
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            # Requests are interleaved in the event loop, so they are not timed with `instrument.timer`
+            start = time.perf_counter()
+            try:
+                self.n_requests += 1
+                async with self.session.get(self.api_url, params=params) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                instrument.observe('scrape.http', time.perf_counter() - start)
+                return result
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                instrument.count('scrape.retries')
+                logger.warning("Retrying API request after error: %r", e)
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+
+class CategoryIndex:
+    """Inverted index of the categories of scraped pages
+    
+    The page -> categories and category -> pages mappings are built once, 
+    with pages and categories encoded as integer codes (in CSR format), 
+    so that lookups and category-based filtering do not scan the scraped pages.
+    
+    Parameters
+    ----------
+    wiki_data : pd.DataFrame
+        Scraped articles, as returned by `wiki_scrape`, with entries ('page', 'categories', ...)
+    """
+    def __init__(self, wiki_data):
+        self.pages = pd.Index(wiki_data.page.to_numpy(dtype=object))
+        lengths = np.fromiter((len(cats) for cats in wiki_data.categories), dtype=np.int64, count=len(wiki_data))
+        
+        # Row of each (page, category) pair, and code of its category
+        self.rows = np.repeat(np.arange(len(wiki_data)), lengths)
+        codes, categories = pd.factorize(np.fromiter(
+            (cat for cats in wiki_data.categories for cat in cats), dtype=object, count=int(lengths.sum())))
+        self.codes = codes.astype(np.int64)
+        self.categories = pd.Index(categories, dtype=object)
+        
+        # Page -> categories: pairs are already grouped by row
+        self.page_indptr = np.concatenate([[0], np.cumsum(lengths)])
+        # Category -> pages: pairs grouped by category
+        self.cat_order = np.argsort(self.codes, kind='stable')
+        self.cat_indptr = np.concatenate([[0], np.cumsum(np.bincount(self.codes, minlength=len(self.categories)))])
+    
+    def __len__(self):
+        return len(self.pages)
+    
+    def page_rows(self, pages):
+        """Method to get the rows of the given pages, raising KeyError for unknown pages
+        """
+        pages = list(pages)
+        rows = self.pages.get_indexer_for(pages)
+        if (rows < 0).any():
+            raise KeyError([page for page in pages if page not in self.pages])
+        return rows
+    
+    def page_categories(self, page):
+        """Method to get the categories of a page
+        """
+        row = self.page_rows([page])[0]
+        return list(self.categories[self.codes[self.page_indptr[row]:self.page_indptr[row+1]]])
+    
+    def category_pages(self, category):
+        """Method to get the pages of a category (an empty list for unknown categories)
+        """
+        code = self.categories.get_indexer([category])[0]
+        if code < 0:
+            return []
+        rows = self.rows[self.cat_order[self.cat_indptr[code]:self.cat_indptr[code+1]]]
+        return list(self.pages[rows])
+    
+    def category_mask(self, categories):
+        """Method to get a boolean mask of the indexed categories which are in `categories`
+        """
+        codes = self.categories.get_indexer(list(categories))
+        mask = np.zeros(len(self.categories), dtype=bool)
+        mask[codes[codes >= 0]] = True
+        return mask
+    
+    def blacklist_mask(self, cat_blacklist):
+        """Method to get a boolean mask of the indexed categories containing any blacklisted term
+        
+        Each distinct category is only matched once, against a single compiled pattern.
+        """
+        pattern = compile_blacklist(cat_blacklist)
+        if pattern is None:
+            return np.zeros(len(self.categories), dtype=bool)
+        return np.fromiter((pattern.search(cat) is not None for cat in self.categories), 
+                           dtype=bool, count=len(self.categories))
+    
+    def row_mask(self, category_mask):
+        """Method to get a boolean mask of the pages having any category selected by `category_mask`
+        """
+        mask = np.zeros(len(self.pages), dtype=bool)
+        mask[self.rows[category_mask[self.codes]]] = True
+        return mask
+
+
+def compile_blacklist(terms):
+    """Helper function to compile blacklisted terms into one pattern matching any of them as a substring
+    
+    Returns None if there are no terms.
+    """
+    terms = sorted(set(terms), key=len, reverse=True)
+    if len(terms) == 0:
+        return None
+    return re.compile('|'.join(re.escape(term) for term in terms))
 
 
-def build_category_whitelist(wiki_data, page_whitelist, cat_blacklist):
+def build_category_whitelist(wiki_data, page_whitelist, cat_blacklist, index=None):
     """Helper function to build whitelist of page categories
     
     This method finds a set of page categories which we can use to 
@@ -92,33 +841,55 @@ def build_category_whitelist(wiki_data, page_whitelist, cat_blacklist):
     Parameters
     ----------
     wiki_data : pd.DataFrame
-        
+        Scraped articles, as returned by `wiki_scrape`
     page_whitelist : list
         List of pages from whose categories we select a domain-specific subset
     cat_blacklist : list
-        List of categories which we don't want to include in the whitelist
+        List of categories which we don't want to include in the whitelist: 
+        categories containing any of them are excluded
+    index : CategoryIndex, optional
+        Category index of `wiki_data`, built if not given
         
     Returns
     -------
     cat_whitelist : set/list
         List of categories which we want to build KGs about
     """
-    cat_whitelist = []
-    for page_name in page_whitelist:
-        # Iterate over categies list for each page in the page whitelist
-        categories = list(wiki_data[wiki_data.page==page_name].categories)[0]
-        for cat in categories:
-            relevant_cat = True
-            for unwanted in cat_blacklist:
-                # If given category is part of blacklisted categories, 
-                # do not add it to whitelist
-                if unwanted in cat:
-                    relevant_cat = False
-                    break
-            
-            # All non-blacklisted categories from the page whitelist 
-            # are added to categories whitelist
-            if relevant_cat:
-                cat_whitelist.append(cat)
-                
-    return set(cat_whitelist)
+    if index is None:
+        index = CategoryIndex(wiki_data)
+    # Categories of all whitelisted pages
+    selected = np.zeros(len(index), dtype=bool)
+    selected[index.page_rows(page_whitelist)] = True
+    codes = np.unique(index.codes[selected[index.rows]])
+    # All non-blacklisted categories from the page whitelist are added to categories whitelist
+    pattern = compile_blacklist(cat_blacklist)
+    return set(cat for cat in index.categories[codes] if pattern is None or pattern.search(cat) is None)
+
+
+def filter_pages_by_categories(wiki_data, cat_whitelist, cat_blacklist=None, index=None):
+    """Method to select the scraped pages having any whitelisted category
+    
+    Parameters
+    ----------
+    wiki_data : pd.DataFrame
+        Scraped articles, as returned by `wiki_scrape`
+    cat_whitelist : set/list
+        Categories of pages to keep (see `build_category_whitelist`)
+    cat_blacklist : list, optional
+        Terms of categories of pages to drop: pages having any category 
+        containing any of them are dropped, even if they have a whitelisted category
+    index : CategoryIndex, optional
+        Category index of `wiki_data`, built if not given 
+        (recommended when filtering the same pages several times)
+    
+    Returns
+    -------
+    wiki_data : pd.DataFrame
+        Selected rows of `wiki_data`
+    """
+    if index is None:
+        index = CategoryIndex(wiki_data)
+    mask = index.row_mask(index.category_mask(cat_whitelist))
+    if cat_blacklist:
+        mask &= ~index.row_mask(index.blacklist_mask(cat_blacklist))
+    return wiki_data[mask]
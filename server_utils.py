@@ -0,0 +1,522 @@
+import argparse
+import collections
+import http.client
+import http.server
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import instrument_utils as instrument
+from kg_utils import EntityMatcher, extract_triplets_stream
+from model_utils import get_nlp
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+# Media type of Arrow IPC stream responses
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+# Number of recent request latencies kept for percentiles
+_LATENCY_WINDOW = 1000
+
+
+class ExtractionServer:
+    """Long-lived extraction service keeping a Spacy pipeline (and BERT) loaded
+
+    Requests are queued, and a single batcher thread collects concurrent requests
+    for up to `max_latency` seconds (or until `max_batch_size` requests are queued)
+    and extracts their triplets together with `kg_utils.extract_triplets_stream`,
+    i.e. one `nlp.pipe` call per batch, instead of one `nlp` call per request.
+    Requests of a batch with different entity lists (or BERT flags) are extracted
+    in separate groups; entity matchers are cached per entity list.
+
+    The service is served over HTTP, on localhost or on a Unix socket (see `serve`):
+
+    - POST /extract with a JSON body {'text', 'title', 'entities', 'use_bert'},
+      returning {'triplets': [[subject, relation, object], ...]}, or an Arrow IPC stream
+      with columns ('subject', 'relation', 'object') with ?format=arrow
+    - GET /metrics, returning queue depth, batch sizes and latencies as JSON,
+      or in the Prometheus text format with ?format=prometheus
+    - GET /health
+
+    Parameters
+    ----------
+    nlp : spacy.language.Language, optional
+        Spacy pipeline, defaults to `model_utils.get_nlp()`
+    max_batch_size : int, optional
+        Maximum number of requests per batch
+    max_latency : float, optional
+        Maximum number of seconds the first request of a batch waits for others
+    max_queue : int, optional
+        Maximum number of queued requests, beyond which requests are rejected
+    cache : cache_utils.SentenceCache, optional
+        Cache of extracted features (see `kg_utils.extract_triplets`)
+    max_window_chars : int, optional
+        Maximum number of characters per window for coreference resolution
+        (see `kg_utils.resolve_windows`), defaults to `nlp.max_length`
+    overlap : int, optional
+        Number of sentences of context repeated from the previous window
+    max_matchers : int, optional
+        Number of entity matchers kept (least recently used are dropped)
+    verbose : bool, optional
+        Flag for printing requests and batches
+
+    Examples
+    --------
+    >>> server = ExtractionServer(max_latency=0.05)
+    >>> server.serve(socket_path='/tmp/kg.sock')
+    >>> extract_triplets_remote(text, title, entities, url='unix:///tmp/kg.sock')
+    """
+    def __init__(self, nlp=None, max_batch_size=32, max_latency=0.05, max_queue=1024, cache=None,
+                 max_window_chars=None, overlap=2, max_matchers=16, verbose=False):
+        self.nlp = get_nlp() if nlp is None else nlp
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.cache = cache
+        self.max_window_chars = max_window_chars
+        self.overlap = overlap
+        self.max_matchers = max_matchers
+        self.verbose = verbose
+
+        self._queue = queue.Queue(max_queue)
+        self._matchers = collections.OrderedDict()
+        self._stopped = threading.Event()
+        self._batcher = None
+        self._httpd = None
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+        self._latencies = collections.deque(maxlen=_LATENCY_WINDOW)
+
+    def start(self):
+        """Method to start the batcher thread (called by `serve`)
+        """
+        if self._batcher is None:
+            self._stopped.clear()
+            self._batcher = threading.Thread(target=self._run, name='kg-batcher', daemon=True)
+            self._batcher.start()
+        return self
+
+    def stop(self):
+        """Method to stop serving, after the batch being extracted (queued requests fail)
+        """
+        self._stopped.set()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            if isinstance(self._httpd, _UnixHTTPServer):
+                os.unlink(self._httpd.server_address)
+            self._httpd = None
+        if self._batcher is not None:
+            self._batcher.join()
+            self._batcher = None
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            request[-1].set_exception(RuntimeError("Extraction server stopped"))
+
+    def submit(self, text, title, entities, use_bert=False):
+        """Method to queue an extraction request, in process
+
+        Parameters
+        ----------
+        text : str
+            Raw text from Wikipedia article/document
+        title : str
+            Title of document, used as a default/fallback subject
+        entities : list
+            List of domain-specific entities (see `kg_utils.extract_triplets`)
+        use_bert : bool, optional
+            Flag for using pre-trained BERT for NER instead of Spacy (default)
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Future of the list of (subject, relation, object) tuples
+
+        Raises
+        ------
+        queue.Full
+            If `max_queue` requests are already queued
+        RuntimeError
+            If the server is not started
+        """
+        if self._batcher is None:
+            raise RuntimeError("Extraction server is not started")
+        future = Future()
+        # Entity lists are compared case-insensitively, as in `kg_utils.EntityMatcher`
+        key = (tuple(sorted(set(ent.lower() for ent in entities))), bool(use_bert))
+        self._queue.put_nowait((time.perf_counter(), text, title, key, future))
+        self._count('requests')
+        instrument.count('server.requests')
+        return future
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _matcher(self, entities):
+        """Helper function to get the (cached) entity matcher of an entity list
+        """
+        matcher = self._matchers.pop(entities, None)
+        if matcher is None:
+            matcher = EntityMatcher(entities, self.nlp)
+            if len(self._matchers) >= self.max_matchers:
+                self._matchers.popitem(last=False)
+        self._matchers[entities] = matcher
+        return matcher
+
+    def _next_batch(self):
+        """Helper function to wait for a request, then collect others for up to `max_latency` seconds
+        """
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """Helper function looping over batches of requests, in the batcher thread
+        """
+        while not self._stopped.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            self._count('batches')
+            self._count('batched_requests', len(batch))
+            instrument.count('server.batches')
+            for enqueued, _, _, _, _ in batch:
+                instrument.observe('server.queue_wait', started - enqueued)
+
+            # Requests sharing an entity list are extracted in one stream
+            groups = collections.OrderedDict()
+            for request in batch:
+                groups.setdefault(request[3], []).append(request)
+            for (entities, use_bert), requests in groups.items():
+                try:
+                    with instrument.timer('server.extract'):
+                        results = extract_triplets_stream(
+                            ((title, text) for _, text, title, _, _ in requests), self._matcher(entities),
+                            batch_size=len(requests), use_bert=use_bert, nlp=self.nlp, cache=self.cache,
+                            max_window_chars=self.max_window_chars, overlap=self.overlap)
+                        for request, (_, triplets) in zip(requests, results):
+                            self._complete(request, triplets)
+                except Exception as e:
+                    # Requests of the group not completed yet fail with the error
+                    for request in requests:
+                        if not request[-1].done():
+                            self._count('errors')
+                            request[-1].set_exception(e)
+            if self.verbose:
+                print("Extracted batch of {} requests ({} groups) in {:.3f}s".format(
+                    len(batch), len(groups), time.perf_counter() - started))
+
+    def _complete(self, request, triplets):
+        latency = time.perf_counter() - request[0]
+        with self._lock:
+            self._latencies.append(latency)
+            self._stats['latency_seconds'] += latency
+        instrument.observe('server.latency', latency)
+        request[-1].set_result(triplets)
+
+    def metrics(self):
+        """Method to get queue depth, batch sizes and latencies of the requests served so far
+
+        Returns
+        -------
+        metrics : dict
+            Entries 'queue_depth', 'requests', 'batches', 'errors', 'mean_batch_size',
+            'mean_latency_seconds', and 'latency_p50_seconds', 'latency_p95_seconds',
+            'latency_max_seconds' (over the last completed requests)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = np.array(self._latencies)
+        n_batches = stats.get('batches', 0)
+        n_completed = stats.get('batched_requests', 0) - stats.get('errors', 0)
+        metrics = {
+            'queue_depth': self._queue.qsize(),
+            'requests': stats.get('requests', 0),
+            'batches': n_batches,
+            'errors': stats.get('errors', 0),
+            'mean_batch_size': stats.get('batched_requests', 0) / n_batches if n_batches else 0.0,
+            'mean_latency_seconds': stats.get('latency_seconds', 0.0) / n_completed if n_completed else 0.0,
+        }
+        for name, q in (('p50', 50), ('p95', 95), ('max', 100)):
+            metrics['latency_{}_seconds'.format(name)] = float(np.percentile(latencies, q)) if len(latencies) else 0.0
+        return metrics
+
+    def prometheus_metrics(self, prefix='kg_server_'):
+        """Method to format `metrics` in the Prometheus text exposition format
+        """
+        lines = []
+        for name, value in sorted(self.metrics().items()):
+            kind = 'counter' if name in ('requests', 'batches', 'errors') else 'gauge'
+            metric = prefix + name + ('_total' if kind == 'counter' else '')
+            lines += ['# TYPE {} {}'.format(metric, kind), '{} {}'.format(metric, value)]
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, host='127.0.0.1', port=8765, socket_path=None, block=True):
+        """Method to serve extraction requests over HTTP, on localhost or on a Unix socket
+
+        Parameters
+        ----------
+        host : str, optional
+            Host to listen on (localhost only by default)
+        port : int, optional
+            Port to listen on (0 for any free port, see `url`)
+        socket_path : str, optional
+            Path of Unix socket to listen on instead of `host` and `port`
+        block : bool, optional
+            Flag for serving until interrupted, otherwise serve from a background thread
+        """
+        self.start()
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._httpd = _UnixHTTPServer(socket_path, _Handler)
+        else:
+            self._httpd = _TCPHTTPServer((host, port), _Handler)
+        self._httpd.extraction_server = self
+        if self.verbose:
+            print("Serving triplet extraction on {}".format(self.url))
+        if not block:
+            threading.Thread(target=self._httpd.serve_forever, name='kg-server', daemon=True).start()
+            return self
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    @property
+    def url(self):
+        """URL of the server for `extract_triplets_remote` (None if not serving)
+        """
+        if self._httpd is None:
+            return None
+        if isinstance(self._httpd, _UnixHTTPServer):
+            return 'unix://' + self._httpd.server_address
+        host, port = self._httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+
+class _TCPHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """HTTP handler of `ExtractionServer` requests, in one thread per connection
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.extraction_server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type='application/json'):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, obj):
+        self._send(status, json.dumps(obj))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        server = self.server.extraction_server
+        if url.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif url.path == '/metrics':
+            if parse_qs(url.query).get('format') == ['prometheus']:
+                self._send(200, server.prometheus_metrics(), 'text/plain; version=0.0.4')
+            else:
+                self._send_json(200, server.metrics())
+        else:
+            self._send_json(404, {'error': 'Not found: {}'.format(url.path)})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/extract':
+            self._send_json(404, {'error': 'Not found: {}'.format(url.path)})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            future = self.server.extraction_server.submit(
+                request['text'], request.get('title', ''), request.get('entities', []),
+                request.get('use_bert', False))
+        except (queue.Full, RuntimeError) as e:
+            self._send_json(503, {'error': 'Unavailable: {!r}'.format(e)})
+            return
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': 'Invalid request: {!r}'.format(e)})
+            return
+        try:
+            triplets = future.result()
+        except Exception as e:
+            self._send_json(500, {'error': repr(e)})
+            return
+        if parse_qs(url.query).get('format') == ['arrow']:
+            self._send(200, _arrow_stream(triplets), ARROW_STREAM)
+        else:
+            self._send_json(200, {'triplets': triplets})
+
+
+def _arrow_stream(triplets):
+    """Helper function to serialize (subject, relation, object) tuples as an Arrow IPC stream
+    """
+    import pyarrow as pa
+
+    columns = list(zip(*triplets)) or [[], [], []]
+    table = pa.table([pa.array(column, pa.string()) for column in columns],
+                     names=['subject', 'relation', 'object'])
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket
+    """
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connection(url, timeout=None):
+    """Helper function to open a connection to 'http://host:port' or 'unix:///path/to/socket'
+    """
+    if url.startswith('unix://'):
+        return _UnixHTTPConnection(url[len('unix://'):], timeout)
+    parts = urlsplit(url)
+    return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+
+
+def _request(url, method, path, body=None, timeout=None):
+    connection = _connection(url, timeout)
+    try:
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError("Extraction server error {}: {}".format(
+            response.status, json.loads(data).get('error') if data else response.reason))
+    return data
+
+
+def extract_triplets_remote(text, title, global_ents_list, verbose=False, use_bert=False,
+                            url=DEFAULT_URL, arrow=False, timeout=None):
+    """Method to extract Subject-Relation-Object triplets with a running `ExtractionServer`
+
+    Same as `kg_utils.extract_triplets`, without loading any model in this process.
+
+    Parameters
+    ----------
+    text : str
+        Raw text from Wikipedia article/document
+    title : str
+        Title of document, used as a default/fallback subject
+    global_ents_list : list or EntityMatcher
+        List of domain-specific entities which Spacy tools do not
+        recognize as Named entities or Nouns chunks
+    verbose : bool, optional
+        Flag for verbose output
+    use_bert : bool, optional
+        Flag for using pre-trained BERT for NER instead of Spacy (default)
+    url : str, optional
+        URL of server, 'http://host:port' or 'unix:///path/to/socket'
+    arrow : bool, optional
+        Flag for transferring triplets as an Arrow IPC stream instead of JSON
+    timeout : float, optional
+        Timeout in seconds of socket operations
+
+    Returns
+    -------
+    sro_triplets_df : pd.DataFrame
+        Pandas dataframe with S-R-O triplets extracted from document
+    """
+    entities = sorted(global_ents_list.terms) if isinstance(global_ents_list, EntityMatcher) else list(global_ents_list)
+    body = json.dumps({'text': text, 'title': title, 'entities': entities, 'use_bert': use_bert})
+    start = time.perf_counter()
+    data = _request(url, 'POST', '/extract?format=arrow' if arrow else '/extract', body.encode('utf-8'), timeout)
+    if arrow:
+        import pyarrow as pa
+        sro_triplets_df = pa.ipc.open_stream(data).read_all().to_pandas()
+    else:
+        sro_triplets_df = pd.DataFrame([tuple(triplet) for triplet in json.loads(data)['triplets']],
+                                       columns=['subject', 'relation', 'object'])
+    if verbose:
+        print("Extracted {} triplets from '{}' in {:.3f}s".format(
+            len(sro_triplets_df), title, time.perf_counter() - start))
+    return sro_triplets_df
+
+
+def server_metrics(url=DEFAULT_URL, timeout=None):
+    """Method to get the metrics of a running `ExtractionServer` (see `ExtractionServer.metrics`)
+    """
+    return json.loads(_request(url, 'GET', '/metrics', timeout=timeout))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve triplet extraction with a warm Spacy pipeline")
+    parser.add_argument('--host', default='127.0.0.1', help="Host to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on")
+    parser.add_argument('--socket', help="Path of Unix socket to listen on instead of host and port")
+    parser.add_argument('--model', default=None, help="Spacy model, defaults to model_utils.DEFAULT_MODEL")
+    parser.add_argument('--max-batch-size', type=int, default=32, help="Maximum number of requests per batch")
+    parser.add_argument('--max-latency', type=float, default=0.05,
+                        help="Maximum number of seconds a request waits for others to batch with")
+    parser.add_argument('--max-queue', type=int, default=1024, help="Maximum number of queued requests")
+    parser.add_argument('--verbose', action='store_true', help="Print requests and batches")
+    args = parser.parse_args(argv)
+
+    nlp = get_nlp(args.model) if args.model else get_nlp()
+    server = ExtractionServer(nlp, max_batch_size=args.max_batch_size, max_latency=args.max_latency,
+                              max_queue=args.max_queue, verbose=args.verbose)
+    server.serve(args.host, args.port, args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
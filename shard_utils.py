@@ -0,0 +1,275 @@
+import hashlib
+import json
+import multiprocessing
+import os
+
+from tqdm import tqdm
+
+import instrument_utils as instrument
+from kg_utils import (EntityMatcher, _extract_triplets_chunk, _init_worker,
+                      merge_duplicate_subjs, prune_triplets)
+from model_utils import get_nlp, prepare_fork
+from store_utils import TripletStore
+
+# Manifest of completed shards, in the shard directory
+MANIFEST = 'manifest.json'
+
+
+def extract_triplets_sharded(wiki_data, global_ents_list, shard_dir, shard_size=500, n_process=1,
+                             batch_size=32, verbose=False, use_bert=False, nlp=None, cache=None,
+                             max_window_chars=None, overlap=2):
+    """Method to extract S-R-O triplets from a corpus of articles into Parquet shards (map step)
+
+    Articles are split into shards of `shard_size` consecutive pages, which are
+    extracted by `n_process` worker processes (see `kg_utils.extract_triplets_corpus`).
+    Each worker writes the triplets of its shard to a Parquet file, and completed
+    shards are recorded in a manifest, so an interrupted run can be resumed by
+    running it again: shards already completed (for the same pages and settings)
+    are skipped. Files are written to a temporary path and then renamed,
+    so a crash never leaves a partially written shard behind.
+
+    Parameters
+    ----------
+    wiki_data : pd.DataFrame
+        Scraped articles, as returned by `scraper_utils.wiki_scrape`,
+        with entries ('page', 'text', ...)
+    global_ents_list : list or EntityMatcher
+        List of domain-specific entities which Spacy tools do not
+        recognize as Named entities or Nouns chunks
+    shard_dir : str
+        Directory of shards and manifest, created if needed
+    shard_size : int, optional
+        Number of pages per shard
+    n_process : int, optional
+        Number of worker processes
+    batch_size : int, optional
+        Number of documents buffered per `nlp.pipe` batch
+    verbose : bool, optional
+        Flag for displaying progress bar and verbose output
+    use_bert : bool, optional
+        Flag for using pre-trained BERT for NER instead of Spacy (default)
+    nlp : spacy.language.Language, optional
+        Spacy pipeline, defaults to `model_utils.get_nlp()`
+    cache : cache_utils.SentenceCache, optional
+        Cache of extracted features (see `kg_utils.extract_triplets_corpus`), 
+        inherited by workers along with the pipeline and the entity matcher
+    max_window_chars : int, optional
+        Maximum number of characters per window for coreference resolution
+        (see `kg_utils.resolve_windows`), defaults to `nlp.max_length`
+    overlap : int, optional
+        Number of sentences of context repeated from the previous window
+
+    Returns
+    -------
+    shard_paths : list
+        Paths of all Parquet shards of the corpus, in order (see `reduce_shards`)
+    """
+    if nlp is None:
+        nlp = get_nlp()
+    if not isinstance(global_ents_list, EntityMatcher):
+        global_ents_list = EntityMatcher(global_ents_list, nlp)
+    os.makedirs(shard_dir, exist_ok=True)
+
+    # Shards are identified by their pages and the extraction settings
+    settings = (nlp.meta.get('lang'), nlp.meta.get('name'), nlp.meta.get('version'),
+                list(nlp.pipe_names), bool(use_bert), global_ents_list.fingerprint(),
+                max_window_chars, overlap)
+    records = list(zip(wiki_data.page, wiki_data.text))
+    shards = []
+    for shard_id, i in enumerate(range(0, len(records), shard_size)):
+        shard_records = records[i:i+shard_size]
+        name = 'shard-{:05d}.parquet'.format(shard_id)
+        shards.append((name, _shard_fingerprint(shard_records, settings), shard_records))
+
+    # Keep completed shards which are still valid, and forget all others
+    completed = load_manifest(shard_dir)
+    manifest = {name: completed[name] for name, fingerprint, _ in shards
+                if name in completed and completed[name]['fingerprint'] == fingerprint
+                and os.path.exists(os.path.join(shard_dir, name))}
+    _save_manifest(shard_dir, manifest)
+
+    tasks = [(os.path.join(shard_dir, name), fingerprint,
+              (shard_records, batch_size, verbose, use_bert, max_window_chars, overlap))
+             for name, fingerprint, shard_records in shards if name not in manifest]
+    if verbose and len(tasks) < len(shards):
+        print("Resuming: {} of {} shards already extracted".format(len(shards) - len(tasks), len(shards)))
+
+    progress = tqdm(desc='Shards Extracted', unit='', total=len(tasks), disable=not verbose)
+
+    def complete(path, entry, metrics):
+        # Shards are only recorded once written, by the parent process alone
+        manifest[os.path.basename(path)] = entry
+        _save_manifest(shard_dir, manifest)
+        instrument.merge(metrics)
+        progress.update(1)
+
+    if n_process > 1 and len(tasks) > 1:
+        # Fork workers after loading the pipeline, so that model weights are shared
+        if 'fork' in multiprocessing.get_all_start_methods():
+            prepare_fork()
+            ctx = multiprocessing.get_context('fork')
+        else:
+            ctx = multiprocessing.get_context()
+        with ctx.Pool(n_process, initializer=_init_worker, initargs=(nlp, global_ents_list, cache, True)) as pool:
+            for result in pool.imap_unordered(_extract_shard, tasks):
+                complete(*result)
+    else:
+        _init_worker(nlp, global_ents_list, cache)
+        for task in tasks:
+            complete(*_extract_shard(task))
+    progress.close()
+
+    return [os.path.join(shard_dir, name) for name, _, _ in shards]
+
+
+def _shard_fingerprint(records, settings):
+    """Helper function to fingerprint the pages of a shard and the extraction settings
+    """
+    digest = hashlib.sha1(json.dumps(settings, default=str).encode('utf-8'))
+    for page, text in records:
+        digest.update(json.dumps([page, text]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _extract_shard(task):
+    """Helper function to extract the triplets of a shard and write them to Parquet
+    """
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    path, fingerprint, chunk = task
+    sro_triplets, n_pages, metrics = _extract_triplets_chunk(chunk)
+    triplets = pd.DataFrame(sro_triplets, columns=list(TripletStore.COLUMNS))
+    table = TripletStore.from_dataframe(triplets).to_arrow()
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path, {'fingerprint': fingerprint, 'n_pages': n_pages, 'n_triplets': len(triplets)}, metrics
+
+
+def load_manifest(shard_dir):
+    """Method to load the manifest of completed shards of a shard directory
+
+    Returns
+    -------
+    manifest : dict
+        Shard file name -> dict with entries ('fingerprint', 'n_pages', 'n_triplets')
+    """
+    try:
+        with open(os.path.join(shard_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_manifest(shard_dir, manifest):
+    """Helper function to atomically replace the manifest of a shard directory
+    """
+    path = os.path.join(shard_dir, MANIFEST)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def reduce_shards(shard_paths, path=None, merge=True, fuzzy=False, min_subj=2, min_obj=2,
+                  drop_self_loops=True, iterate_to_fixpoint=False):
+    """Method to merge Parquet shards into one set of triplets, then merge subjects and prune (reduce step)
+
+    Shards are read as dictionary-encoded Arrow tables and encoded into a single
+    `store_utils.TripletStore`, so strings are only looked up once per shard.
+    Duplicate subjects are merged (see `kg_utils.merge_duplicate_subjs`) across all
+    shards, and infrequent subjects/objects and self-loops are then pruned
+    (see `kg_utils.prune_triplets`).
+
+    Parameters
+    ----------
+    shard_paths : list or str
+        Paths of Parquet shards (as returned by `extract_triplets_sharded`),
+        or directory of shards listed in its manifest
+    path : str, optional
+        Path for also saving the triplets as an Arrow IPC file (see `load_triplets`)
+    merge : bool, optional
+        Flag for merging duplicate subjects
+    fuzzy : bool, optional
+        Flag for also merging near-duplicate subjects
+    min_subj : int, optional
+        Frequency threshold for pruning subjects
+    min_obj : int, optional
+        Frequency threshold for pruning objects
+    drop_self_loops : bool, optional
+        Flag for pruning triplets where subject is the same as object
+    iterate_to_fixpoint : bool, optional
+        Flag for repeating pruning until no more triplets are removed
+
+    Returns
+    -------
+    store : store_utils.TripletStore
+        Merged and pruned triplets, with page and sentence index provenance
+    """
+    import pyarrow.parquet as pq
+
+    if isinstance(shard_paths, str):
+        shard_paths = [os.path.join(shard_paths, name) for name in sorted(load_manifest(shard_paths))]
+
+    store = TripletStore()
+    with instrument.timer('reduce.read'):
+        for shard_path in shard_paths:
+            store.append_arrow(pq.read_table(shard_path))
+    with instrument.timer('reduce.merge'):
+        if merge:
+            store = merge_duplicate_subjs(store, fuzzy=fuzzy)
+    with instrument.timer('reduce.prune'):
+        store = prune_triplets(store, min_subj, min_obj, drop_self_loops, iterate_to_fixpoint)
+    if path is not None:
+        save_triplets(store, path)
+    return store
+
+
+def save_triplets(triplets, path):
+    """Method to save triplets as an Arrow IPC file, written to a temporary path and then renamed
+
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore
+        S-R-O triplets dataframe
+    path : str
+        Path of Arrow IPC file
+    """
+    import pyarrow as pa
+
+    if not isinstance(triplets, TripletStore):
+        triplets = TripletStore.from_dataframe(triplets)
+    table = triplets.to_arrow()
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def load_triplets(path, as_store=False):
+    """Method to load triplets saved with `save_triplets` (or `reduce_shards`), memory-mapped
+
+    The file is memory-mapped, so columns are only paged in from disk as they are accessed,
+    and strings are not converted into Python objects until needed (e.g. by `to_pandas`).
+
+    Parameters
+    ----------
+    path : str
+        Path of Arrow IPC file
+    as_store : bool, optional
+        Flag for returning a `store_utils.TripletStore`, whose id columns
+        are views of the memory-mapped file, instead of an Arrow table
+
+    Returns
+    -------
+    triplets : pyarrow.Table or store_utils.TripletStore
+        Triplets with dictionary-encoded columns ('subject', 'relation', 'object', 'page', 'sent')
+    """
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    if as_store:
+        return TripletStore.from_arrow(table)
+    return table
@@ -0,0 +1,350 @@
+import numpy as np
+import pandas as pd
+
+
+class Vocab:
+    """Interned vocabulary of strings, mapping each string to a contiguous integer id
+
+    Parameters
+    ----------
+    strings : iterable, optional
+        Initial strings, interned in order
+    """
+    def __init__(self, strings=()):
+        self.strings = []
+        self.ids = {}
+        self._index = None
+        for string in strings:
+            self.add(string)
+
+    def add(self, string):
+        """Method to intern a string, returning its id
+        """
+        idx = self.ids.get(string)
+        if idx is None:
+            idx = len(self.strings)
+            self.ids[string] = idx
+            self.strings.append(string)
+            self._index = None
+        return idx
+
+    def encode(self, strings):
+        """Method to intern an array of strings, returning an int32 array of ids
+
+        Each distinct string is only looked up once, and missing values are encoded as -1.
+        """
+        codes, uniques = pd.factorize(np.asarray(strings, dtype=object))
+        ids = np.array([self.add(string) for string in uniques], dtype=np.int32)
+        if len(uniques) == 0:
+            return np.full(len(codes), -1, dtype=np.int32)
+        return np.where(codes >= 0, ids.take(codes, mode='clip'), -1).astype(np.int32)
+
+    def encode_categories(self, categories):
+        """Method to intern categories (e.g. of a pd.Categorical), returning their ids
+        """
+        return np.array([self.add(string) for string in categories], dtype=np.int32)
+
+    @property
+    def index(self):
+        """pd.Index of all strings, positioned by id (cached until new strings are added)
+        """
+        if self._index is None:
+            self._index = pd.Index(self.strings, dtype=object)
+        return self._index
+
+    def __getitem__(self, idx):
+        return self.strings[idx]
+
+    def __contains__(self, string):
+        return string in self.ids
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class TripletStore:
+    """Compact store of Subject-Relation-Object triplets
+
+    Entities (subjects and objects, sharing one vocabulary) and relations are
+    interned, and triplets are stored as int32 arrays of ids, along with
+    provenance columns: the page (id in the page vocabulary) and the index of
+    the sentence each triplet was extracted from (-1 where unknown).
+
+    Parameters
+    ----------
+    entities : Vocab, optional
+        Vocabulary of subjects and objects
+    relations : Vocab, optional
+        Vocabulary of relations
+    pages : Vocab, optional
+        Vocabulary of source pages
+    """
+    COLUMNS = ('subject', 'relation', 'object', 'page', 'sent')
+
+    def __init__(self, entities=None, relations=None, pages=None):
+        self.entities = entities if entities is not None else Vocab()
+        self.relations = relations if relations is not None else Vocab()
+        self.pages = pages if pages is not None else Vocab()
+        self._chunks = []
+        self._columns = {col: np.zeros(0, dtype=np.int32) for col in self.COLUMNS}
+
+    @classmethod
+    def from_dataframe(cls, triplets):
+        """Method to build a store from an S-R-O triplets dataframe
+
+        Categorical columns are converted through their codes, so only
+        their categories (not every row) are looked up in the vocabularies.
+        Optional 'page' and 'sent' columns are kept as provenance.
+        """
+        store = cls()
+        store.append_dataframe(triplets)
+        return store
+
+    @classmethod
+    def from_arrow(cls, table):
+        """Method to build a store from an Arrow table (see `TripletStore.to_arrow`)
+
+        Dictionary-encoded columns are converted through their dictionaries, so 
+        only dictionary entries (not every row) are looked up in the vocabularies, 
+        and their indices are used without copying when they already are vocabulary 
+        ids (e.g. for a single table written by `to_arrow`, possibly memory-mapped).
+        """
+        store = cls()
+        store.append_arrow(table)
+        return store
+
+    def append_arrow(self, table):
+        """Method to add the triplets of an Arrow table (see `from_arrow`)
+        """
+        n = table.num_rows
+        if n == 0:
+            return
+        self._chunks.append({
+            'subject': self._encode_arrow(table.column('subject'), self.entities),
+            'relation': self._encode_arrow(table.column('relation'), self.relations),
+            'object': self._encode_arrow(table.column('object'), self.entities),
+            'page': (self._encode_arrow(table.column('page'), self.pages)
+                     if 'page' in table.column_names else np.full(n, -1, dtype=np.int32)),
+            'sent': (table.column('sent').to_numpy().astype(np.int32, copy=False)
+                     if 'sent' in table.column_names else np.full(n, -1, dtype=np.int32)),
+        })
+
+    def append_dataframe(self, triplets):
+        """Method to add the triplets of an S-R-O triplets dataframe (see `from_dataframe`)
+        """
+        n = len(triplets)
+        if n == 0:
+            return
+        self._chunks.append({
+            'subject': self._encode(triplets['subject'], self.entities),
+            'relation': self._encode(triplets['relation'], self.relations),
+            'object': self._encode(triplets['object'], self.entities),
+            'page': (self._encode(triplets['page'], self.pages) if 'page' in triplets
+                     else np.full(n, -1, dtype=np.int32)),
+            'sent': (triplets['sent'].to_numpy(dtype=np.int32) if 'sent' in triplets
+                     else np.full(n, -1, dtype=np.int32)),
+        })
+
+    @staticmethod
+    def _encode(column, vocab):
+        """Helper function to encode a (possibly categorical) column into vocabulary ids
+        """
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            ids = vocab.encode_categories(column.cat.categories)
+            codes = column.cat.codes.to_numpy()
+            # Missing values (code -1) are kept as -1
+            return np.where(codes >= 0, ids.take(codes, mode='clip'), -1).astype(np.int32)
+        return vocab.encode(column.to_numpy(dtype=object))
+
+    @staticmethod
+    def _encode_arrow(column, vocab):
+        """Helper function to encode an Arrow (possibly dictionary-encoded) column into vocabulary ids
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        chunks = []
+        for chunk in column.chunks:
+            if not pa.types.is_dictionary(chunk.type):
+                chunks.append(vocab.encode(chunk.to_numpy(zero_copy_only=False)))
+                continue
+            ids = vocab.encode_categories(chunk.dictionary.to_pylist())
+            # Missing values are kept as -1
+            indices = chunk.indices
+            if chunk.null_count:
+                indices = pc.fill_null(indices, -1)
+            indices = indices.to_numpy()
+            if np.array_equal(ids, np.arange(len(ids))):
+                chunks.append(indices.astype(np.int32, copy=False))
+            else:
+                chunks.append(np.where(indices >= 0, ids.take(indices, mode='clip'), -1).astype(np.int32))
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+
+    def append(self, sro_triplets, page=None, sent=None):
+        """Method to add (subject, relation, object) triplets
+
+        Parameters
+        ----------
+        sro_triplets : list
+            List of (subject, relation, object) tuples
+        page : str, optional
+            Source page of triplets
+        sent : list, optional
+            Index of the sentence each triplet was extracted from
+        """
+        n = len(sro_triplets)
+        if n == 0:
+            return
+        subjects, relations, objects = zip(*sro_triplets)
+        page_id = self.pages.add(page) if page is not None else -1
+        self._chunks.append({
+            'subject': self.entities.encode(subjects),
+            'relation': self.relations.encode(relations),
+            'object': self.entities.encode(objects),
+            'page': np.full(n, page_id, dtype=np.int32),
+            'sent': np.asarray(sent if sent is not None else [-1] * n, dtype=np.int32),
+        })
+
+    def _consolidate(self):
+        """Helper function to concatenate appended chunks into contiguous arrays
+        """
+        if self._chunks:
+            if len(self._chunks) == 1 and len(self._columns['subject']) == 0:
+                # Single chunk (e.g. from an Arrow table) is used as is, without copying
+                self._columns = dict(self._chunks[0])
+            else:
+                self._columns = {col: np.concatenate([self._columns[col]] + [chunk[col] for chunk in self._chunks])
+                                 for col in self.COLUMNS}
+            self._chunks = []
+        return self._columns
+
+    @property
+    def subject(self):
+        return self._consolidate()['subject']
+
+    @property
+    def relation(self):
+        return self._consolidate()['relation']
+
+    @property
+    def object(self):
+        return self._consolidate()['object']
+
+    @property
+    def page(self):
+        return self._consolidate()['page']
+
+    @property
+    def sent(self):
+        return self._consolidate()['sent']
+
+    def __len__(self):
+        return len(self._consolidate()['subject'])
+
+    def with_columns(self, **columns):
+        """Helper function to build a store with the same vocabularies and some columns replaced
+        """
+        store = TripletStore(self.entities, self.relations, self.pages)
+        store._columns = dict(self._consolidate(), **columns)
+        return store
+
+    def filter(self, mask):
+        """Method to select triplets with a boolean mask (or integer indices)
+
+        The returned store shares vocabularies with this store.
+        """
+        return self.with_columns(**{col: values[mask] for col, values in self._consolidate().items()})
+
+    def subject_counts(self):
+        """Method to count triplets per subject, indexed by entity id
+        """
+        return np.bincount(self.subject, minlength=len(self.entities))
+
+    def object_counts(self):
+        """Method to count triplets per object, indexed by entity id
+        """
+        return np.bincount(self.object, minlength=len(self.entities))
+
+    def relation_counts(self):
+        """Method to count triplets per relation, indexed by relation id
+        """
+        return np.bincount(self.relation, minlength=len(self.relations))
+
+    def to_dataframe(self, categorical=True, provenance=False):
+        """Method to convert the store to an S-R-O triplets dataframe
+
+        Parameters
+        ----------
+        categorical : bool, optional
+            Flag for returning categorical columns, built directly from the
+            stored codes and vocabularies, instead of string columns
+        provenance : bool, optional
+            Flag for including 'page' and 'sent' columns
+
+        Returns
+        -------
+        triplets : pd.DataFrame
+            S-R-O triplets dataframe
+        """
+        columns = self._consolidate()
+        vocabs = {'subject': self.entities, 'relation': self.relations,
+                  'object': self.entities, 'page': self.pages}
+        names = ['subject', 'relation', 'object'] + (['page', 'sent'] if provenance else [])
+        data = {}
+        for col in names:
+            if col == 'sent':
+                data[col] = columns[col]
+                continue
+            # Codes of -1 (e.g. unknown page) become missing values
+            data[col] = pd.Categorical.from_codes(columns[col], categories=vocabs[col].index)
+            if not categorical:
+                data[col] = np.asarray(data[col], dtype=object)
+        return pd.DataFrame(data)
+
+    def to_arrow(self):
+        """Method to convert the store to an Arrow table, with dictionary-encoded string columns
+
+        Dictionary indices are the stored ids, and missing pages are nulls.
+
+        Returns
+        -------
+        table : pyarrow.Table
+            Table with columns ('subject', 'relation', 'object', 'page', 'sent')
+        """
+        import pyarrow as pa
+
+        columns = self._consolidate()
+        entities = pa.array(self.entities.strings, type=pa.string())
+        dictionaries = {'subject': entities, 'relation': pa.array(self.relations.strings, type=pa.string()),
+                        'object': entities, 'page': pa.array(self.pages.strings, type=pa.string())}
+        data = {}
+        for col in ('subject', 'relation', 'object', 'page'):
+            codes = columns[col]
+            missing = codes < 0
+            indices = pa.array(codes, type=pa.int32(), mask=missing if missing.any() else None)
+            data[col] = pa.DictionaryArray.from_arrays(indices, dictionaries[col])
+        data['sent'] = pa.array(columns['sent'], type=pa.int32())
+        return pa.table(data)
+
+    def to_networkx(self):
+        """Method to build a networkx graph, with relations as edge attributes
+        """
+        import networkx as nx
+
+        columns = self._consolidate()
+        k_graph = nx.MultiDiGraph()
+        k_graph.add_edges_from(
+            (self.entities[s], self.entities[o], {'relation': self.relations[r]})
+            for s, r, o in zip(columns['subject'].tolist(), columns['relation'].tolist(),
+                               columns['object'].tolist()))
+        return k_graph
+
+    @classmethod
+    def from_networkx(cls, k_graph):
+        """Method to build a store from a networkx graph with 'relation' edge attributes
+        """
+        store = cls()
+        store.append([(s, data.get('relation', ''), o) for s, o, data in k_graph.edges(data=True)])
+        return store
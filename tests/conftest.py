@@ -0,0 +1,83 @@
+import os
+import random
+import sys
+
+import pytest
+
+# Modules are flat files at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Vocabulary of synthetic articles, and verbs tagged by the fake pipeline
+WORDS = ['Bayer', 'Bayer AG', 'Germany', '1999', 'Hans', 'aspirin', 'the', 'drug', 'company', 'makes',
+         'bought', 'sells', 'owns', 'is', 'founded', 'acquired', 'monoclonal antibody', 'in', 'of', ',']
+VERBS = {'makes', 'bought', 'sells', 'owns', 'is', 'founded', 'acquired'}
+ENTITIES = ['aspirin', 'monoclonal antibody', 'drug']
+
+
+def _fake_tagger(doc):
+    """Rule-based stand-in for a trained tagger and parser: tags verbs, and attaches every
+    other token of a sentence to its first verb
+    """
+    for sent in doc.sents:
+        verbs = [tok.i for tok in sent if tok.text.lower() in VERBS]
+        root = verbs[0] if verbs else sent.start
+        for tok in sent:
+            if tok.i in verbs:
+                tok.pos_, tok.dep_ = 'VERB', 'ROOT' if tok.i == root else 'conj'
+            elif tok.is_punct:
+                tok.pos_, tok.dep_ = 'PUNCT', 'punct'
+            else:
+                tok.pos_ = 'PROPN' if tok.text[0].isupper() else 'NOUN'
+                tok.dep_ = 'nsubj' if tok.i < root else 'dobj'
+            tok.head = doc[root]
+            tok.lemma_ = tok.text.lower().rstrip('s')
+    return doc
+
+
+def make_nlp():
+    """Helper function to build a small pipeline without trained models: 
+    sentencizer, entity ruler and rule-based tagger
+    """
+    import spacy
+
+    nlp = spacy.blank('en')
+    patterns = [{'label': 'ORG', 'pattern': 'Bayer'},
+                {'label': 'ORG', 'pattern': [{'LOWER': 'bayer'}, {'LOWER': 'ag'}]},
+                {'label': 'GPE', 'pattern': 'Germany'}, {'label': 'DATE', 'pattern': '1999'},
+                {'label': 'PERSON', 'pattern': 'Hans'}]
+    if int(spacy.__version__.split('.')[0]) < 3:
+        from spacy.pipeline import EntityRuler
+
+        nlp.add_pipe(nlp.create_pipe('sentencizer'))
+        ruler = EntityRuler(nlp)
+        ruler.add_patterns(patterns)
+        nlp.add_pipe(ruler)
+        nlp.add_pipe(_fake_tagger, name='fake_tagger')
+    else:
+        from spacy.language import Language
+
+        if not Language.has_factory('fake_tagger'):
+            Language.component('fake_tagger', func=_fake_tagger)
+        nlp.add_pipe('sentencizer')
+        nlp.add_pipe('entity_ruler').add_patterns(patterns)
+        nlp.add_pipe('fake_tagger')
+    nlp.meta['name'] = 'fake'
+    return nlp
+
+
+@pytest.fixture(scope='session')
+def nlp():
+    return make_nlp()
+
+
+def make_text(rng, n_sents=6):
+    """Helper function to generate a synthetic article of up to `n_sents` sentences
+    """
+    return ' '.join(' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 10))) + '.'
+                    for _ in range(rng.randint(1, n_sents)))
+
+
+@pytest.fixture
+def texts():
+    rng = random.Random(0)
+    return [make_text(rng) + ' ' + make_text(rng) for _ in range(40)]
@@ -0,0 +1,32 @@
+import json
+import os
+
+import bench_utils
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'bench_pages.json')
+
+
+def test_fixture_round_trip(tmp_path):
+    pages, entities = bench_utils.load_fixture(FIXTURE)
+    assert len(pages) == 12 and len(entities) > 0
+    path = str(tmp_path / 'pages.json.gz')
+    bench_utils.save_fixture(pages, path, entities)
+    assert bench_utils.load_fixture(path) == (pages, entities)
+
+
+def test_benchmark_runs_every_stage_on_fixture(nlp):
+    pages, entities = bench_utils.load_fixture(FIXTURE)
+    results = bench_utils.run_benchmark(pages, entities, nlp=nlp, layout_iterations=5, verbose=False)
+    assert list(results) == list(bench_utils.STAGES)
+    assert all(result['seconds'] >= 0 for result in results.values())
+    assert results['scrape']['items'] == len(pages)
+    assert results['extract']['triplets'] == results['merge']['items']
+    # The graph has one edge per distinct (subject, object) pair of pruned triplets
+    assert 0 < results['graph']['edges'] <= results['graph']['items']
+    json.dumps(results)
+
+
+def test_compare_reports_regressions():
+    baseline = {'merge': {'seconds': 1.0}, 'prune': {'seconds': 1.0}}
+    results = {'merge': {'seconds': 1.05}, 'prune': {'seconds': 2.0}, 'graph': {'seconds': 1.0}}
+    assert bench_utils.compare(results, baseline, tolerance=0.1) == [('prune', 1.0, 2.0, 2.0)]
@@ -0,0 +1,73 @@
+import pytest
+import spacy
+
+from kg_utils import BERT_LABEL_LIST, _char_spans_to_ents, extract_ner_bert_spans
+
+
+def test_char_spans_are_expanded_to_token_boundaries():
+    nlp = spacy.blank('en')
+    doc = nlp("Bayer AG bought Monsanto in 2018.")
+    ents = _char_spans_to_ents(doc, [(0, 8, 'ORG'), (18, 20, 'ORG'), (28, 33, 'DATE')])
+    assert [(ent.text, ent.label_) for ent in ents] == [('Bayer AG', 'ORG'), ('Monsanto', 'ORG'), 
+                                                        ('2018.', 'DATE')]
+
+
+class _FakeTokenizer:
+    """Whitespace tokenizer with the overflowing-window interface of a fast tokenizer
+    """
+    def __init__(self):
+        self.vocab = {}
+
+    def __call__(self, texts, truncation, max_length, stride, return_overflowing_tokens,
+                 return_offsets_mapping):
+        import re
+
+        encoded = {'input_ids': [], 'attention_mask': [], 'offset_mapping': [],
+                   'overflow_to_sample_mapping': []}
+        for sample, text in enumerate(texts):
+            offsets = [match.span() for match in re.finditer(r'\S+', text)]
+            ids = [self.vocab.setdefault(text[start:end], len(self.vocab) + 1) for start, end in offsets]
+            start = 0
+            while True:
+                encoded['input_ids'].append(ids[start:start+max_length])
+                encoded['attention_mask'].append([1] * len(ids[start:start+max_length]))
+                encoded['offset_mapping'].append(offsets[start:start+max_length])
+                encoded['overflow_to_sample_mapping'].append(sample)
+                if start + max_length >= len(ids):
+                    break
+                start += max_length - stride
+        return encoded
+
+    def pad(self, features, return_tensors):
+        import torch
+
+        length = max(len(feature['input_ids']) for feature in features)
+        return {key: torch.tensor([feature[key] + [0] * (length - len(feature[key])) for feature in features])
+                for key in features[0]}
+
+
+class _FakeModel:
+    """Token classifier tagging capitalized words as organisations
+    """
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+
+        words = {i: word for word, i in self.tokenizer.vocab.items()}
+        labels = [[BERT_LABEL_LIST.index('I-ORG') if words.get(i, 'x')[0].isupper() else 0 for i in ids]
+                  for ids in input_ids.tolist()]
+        return (torch.nn.functional.one_hot(torch.tensor(labels), len(BERT_LABEL_LIST)).float(),)
+
+
+def test_windows_are_stitched_back_together():
+    pytest.importorskip('torch')
+    tokenizer = _FakeTokenizer()
+    words = ['Bayer' if i % 7 == 0 else 'sells' for i in range(48)] + ['Bayer', 'Monsanto']
+    texts = [' '.join(words), 'no entities here', 'Hans']
+    spans = extract_ner_bert_spans(texts, _FakeModel(tokenizer), tokenizer, batch_size=2,
+                                   max_length=8, stride=4)
+    # Each entity is found once, whichever windows it falls in
+    assert [texts[0][start:end] for start, end, _ in spans[0]] == ['Bayer'] * 7 + ['Bayer Monsanto']
+    assert spans[1:] == [[], [(0, 4, 'ORG')]]
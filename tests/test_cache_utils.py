@@ -0,0 +1,104 @@
+import json
+import pickle
+import zlib
+
+import pandas as pd
+
+import kg_utils
+from cache_utils import SentenceCache
+from conftest import ENTITIES
+
+
+def test_cache_round_trip_on_disk(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = SentenceCache(path)
+    cache.put_many([('a', {'x': 1}), ('b', [1, 2])])
+    assert cache.get_many(['a', 'c', 'a']) == [{'x': 1}, None, {'x': 1}]
+    cache.close()
+
+    cache = SentenceCache(path)
+    assert cache.get('b') == [1, 2]
+    assert cache.stats()['disk_hits'] == 1
+    assert len(cache) == 2
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    # Room for two entries on disk
+    size = len(zlib.compress(json.dumps('a' * 20).encode('utf-8')))
+    cache = SentenceCache(str(tmp_path / 'cache.sqlite'), max_bytes=2 * size)
+    cache.put('a', 'a' * 20)
+    cache.put('b', 'b' * 20)
+    cache.put('c', 'c' * 20)
+    cache._memory.clear()
+    assert cache.get('a') is None
+    assert cache.get('c') == 'c' * 20
+
+
+def _counting(nlp):
+    """Helper function to count the documents run through `nlp.pipe`
+    """
+    calls = []
+    pipe = nlp.pipe
+
+    def counting_pipe(texts, **kwargs):
+        for doc in pipe(texts, **kwargs):
+            calls.append(doc)
+            yield doc
+    return counting_pipe, calls
+
+
+def test_cached_extraction_is_identical_and_skips_parsing(nlp, texts, tmp_path, monkeypatch):
+    matcher = kg_utils.EntityMatcher(ENTITIES, nlp)
+    records = [('Bayer', text) for text in texts] + [('Aspirin', texts[0])]
+    counting_pipe, calls = _counting(nlp)
+    monkeypatch.setattr(nlp, 'pipe', counting_pipe)
+    for max_window_chars in (None, 100):
+        path = str(tmp_path / 'cache{}.sqlite'.format(max_window_chars))
+        expected = list(kg_utils.extract_triplets_stream(records, matcher, nlp=nlp, with_sent=True,
+                                                         max_window_chars=max_window_chars))
+        cache = SentenceCache(path)
+        cold = list(kg_utils.extract_triplets_stream(records, matcher, nlp=nlp, with_sent=True, cache=cache,
+                                                     max_window_chars=max_window_chars))
+        cache.close()
+
+        del calls[:]
+        cache = SentenceCache(path)
+        warm = list(kg_utils.extract_triplets_stream(records, matcher, nlp=nlp, with_sent=True, cache=cache,
+                                                     max_window_chars=max_window_chars))
+        assert cold == expected
+        assert warm == expected
+        assert calls == []
+        assert cache.stats()['misses'] == 0
+        cache.close()
+
+
+def test_cache_keys_depend_on_entities(nlp, texts):
+    cache = SentenceCache(None)
+    records = [('Bayer', text) for text in texts[:5]]
+    list(kg_utils.extract_triplets_stream(records, ENTITIES, nlp=nlp, cache=cache))
+    misses = cache.misses
+    triplets = list(kg_utils.extract_triplets_stream(records, ['bayer ag'], nlp=nlp, cache=cache))
+    assert cache.misses == 2 * misses
+    assert triplets == list(kg_utils.extract_triplets_stream(records, ['bayer ag'], nlp=nlp))
+
+
+def test_cache_is_picklable(tmp_path):
+    cache = SentenceCache(str(tmp_path / 'cache.sqlite'), max_items=5)
+    cache.put('a', [1])
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.max_items == 5
+    assert copy.get('a') == [1]
+    assert copy.stats()['disk_hits'] == 1
+
+
+def test_corpus_extraction_with_cache_in_workers(nlp, texts, tmp_path):
+    wiki_data = pd.DataFrame({'page': ['Bayer'] * len(texts), 'text': texts})
+    expected = kg_utils.extract_triplets_corpus(wiki_data, ENTITIES, nlp=nlp)
+    path = str(tmp_path / 'cache.sqlite')
+    for _ in range(2):
+        # Cold, then warm cache, shared by workers through the database
+        triplets = kg_utils.extract_triplets_corpus(wiki_data, ENTITIES, n_process=2, nlp=nlp,
+                                                    cache=SentenceCache(path))
+        assert triplets.values.tolist() == expected.values.tolist()
+    assert len(SentenceCache(path)) > 0
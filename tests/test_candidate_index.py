@@ -0,0 +1,211 @@
+"""Regression test of indexed subject/object candidate search (`kg_utils._CandidateIndex`)
+
+Triplets formed from the sentence features of the fixture corpus must be byte-identical
+to those formed by the original nested loops over candidate spans (`_reference_triplets`).
+The corpus holds randomly laid out sentences, including overlapping (unsorted) spans,
+global entities matching their verb, empty and repeated span words, and spans shared
+between tiers, along with the triplets of the original loops.
+
+Regenerate the fixture with: PYTHONPATH=. python tests/test_candidate_index.py
+"""
+import json
+import os
+import random
+
+from kg_utils import _Span, _extract_triplets_features
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'candidate_corpus.json')
+_TIERS = ('main_ents', 'global_ents', 'noun_chunks', 'addn_ents')
+
+
+def _reference_triplets(features, default_subj):
+    """Original nested loops over candidate spans, before `_CandidateIndex`
+    """
+    sro_triplets = []
+    prev_subj = _Span(0, 0, 0, 0, "", "")
+    prev_obj = _Span(0, 0, 0, 0, "", "")
+    for sent_idx, sent in enumerate(features):
+        prev_obj_end = 0
+        main_ents, global_ents = sent['main_ents'], sent['global_ents']
+        noun_chunks, addn_ents = sent['noun_chunks'], sent['addn_ents']
+        lemmas, keep = sent['lemmas'], sent['keep']
+        for verb_i, verb_text in sent['verbs']:
+            # Identify Subject
+            subj = None
+            # Find leftmost Main Ent to verb
+            for ent in main_ents:
+                if ent.end > verb_i:
+                    break
+                elif ent.end > prev_obj_end:
+                    subj = ent
+                    rel_start = subj.end
+            if subj is None:
+                # Find leftmost Global Ent to verb
+                for ent in global_ents:
+                    if ent.end > verb_i:
+                        break
+                    elif ent.end > prev_obj_end:
+                        subj = ent
+                        rel_start = subj.end
+            if subj is None:
+                # Find leftmost noun chunk to verb
+                for noun_chunk in noun_chunks:
+                    if noun_chunk.end > verb_i:
+                        break
+                    elif noun_chunk.end > prev_obj_end:
+                        subj = noun_chunk
+                        rel_start = subj.end
+            if subj is None:
+                # Find leftmost Additional Ent to verb
+                for ent in addn_ents:
+                    if ent.end > verb_i:
+                        break
+                    elif ent.end > prev_obj_end:
+                        subj = ent
+                        rel_start = subj.end
+            if subj is None:
+                subj = default_subj
+                rel_start = verb_i
+
+            # Identify Object
+            obj = None
+            # Find rightmost Main Ent to verb
+            for ent in main_ents[::-1]:
+                if ent.end <= verb_i:
+                    break
+                else:
+                    obj = ent
+                    rel_end = obj.start
+            if obj is None:
+                # Find rightmost Global Ent to verb
+                for ent in global_ents[::-1]:
+                    if ent.end <= verb_i:
+                        break
+                    elif ent.text.lower() != verb_text:
+                        obj = ent
+                        rel_end = obj.start
+            if obj is None:
+                # Find rightmost noun chunk to verb
+                for noun_chunk in noun_chunks[::-1]:
+                    if noun_chunk.end <= verb_i:
+                        break
+                    else:
+                        obj = noun_chunk
+                        rel_end = obj.start
+            if obj is None:
+                # Find rightmost Additional Ent to verb
+                for ent in addn_ents[::-1]:
+                    if ent.end <= verb_i:
+                        break
+                    else:
+                        obj = ent
+                        rel_end = obj.start
+            if obj is None:
+                obj = prev_obj
+                rel_end = verb_i + 1
+
+            triplet = (
+                subj.words,
+                " ".join(lemmas[i] for i in range(rel_start, rel_end) if (i == verb_i or keep[i])).strip(),
+                obj.words,
+                sent_idx,
+            )
+            if triplet[0] != "" and triplet[1] != "" and triplet[2] != "" and triplet[0] != triplet[2]:
+                if (subj.start_char, subj.end_char) == (prev_subj.start_char, prev_subj.end_char) and \
+                   (obj.start_char, obj.end_char) == (prev_obj.start_char, prev_obj.end_char):
+                    prev_triplet = sro_triplets.pop()
+                    if len(prev_triplet[1]) > len(triplet[1]):
+                        triplet = prev_triplet
+                sro_triplets.append(triplet)
+            prev_subj = subj
+            prev_obj = obj
+            prev_obj_end = obj.end
+    return sro_triplets
+
+
+def _load_document(document):
+    """Helper function to convert a fixture document into sentence features and a default subject
+    """
+    features = [dict(sent, **{name: [_Span(*span) for span in sent[name]] for name in _TIERS})
+                for sent in document['sentences']]
+    return features, _Span(*document['default_subj'])
+
+
+def test_candidate_corpus_is_byte_identical():
+    with open(FIXTURE) as f:
+        corpus = json.load(f)
+    assert len(corpus) >= 100
+    for document in corpus:
+        features, default_subj = _load_document(document)
+        triplets = _extract_triplets_features(features, default_subj, with_sent=True)
+        assert json.dumps(triplets) == json.dumps(document['triplets'])
+
+
+def test_reference_matches_fixture():
+    with open(FIXTURE) as f:
+        corpus = json.load(f)
+    for document in corpus:
+        features, default_subj = _load_document(document)
+        assert json.dumps(_reference_triplets(features, default_subj)) == json.dumps(document['triplets'])
+
+
+def _random_spans(rng, n_tokens, words, overlapping):
+    """Helper function to lay out random candidate spans of a sentence, in order of start
+    """
+    spans = []
+    start = rng.randint(0, 2)
+    while start < n_tokens:
+        end = min(n_tokens, start + rng.randint(1, 4))
+        if overlapping and rng.random() < 0.3:
+            # Nested or overlapping spans, whose ends are not sorted
+            end = min(n_tokens, end + rng.randint(1, 6))
+        text = " ".join(words[start:end])
+        spans.append([start, end, start * 6, end * 6, text, rng.choice(['', text.lower(), rng.choice(words)])])
+        start = end + rng.randint(0, 4) if not overlapping else start + rng.randint(1, 3)
+    return spans
+
+
+def _random_document(rng):
+    vocabulary = ['acquire', 'make', 'bayer', 'aspirin', 'drug', 'company', 'own', 'sell', 'germany', 'the']
+    sentences = []
+    for _ in range(rng.randint(1, 5)):
+        n_tokens = rng.randint(3, 30)
+        words = [rng.choice(vocabulary) for _ in range(n_tokens)]
+        verbs = sorted(rng.sample(range(n_tokens), rng.randint(0, min(6, n_tokens))))
+        sent = {
+            'text': " ".join(words),
+            'lemmas': words,
+            'keep': [rng.random() < 0.7 for _ in range(n_tokens)],
+            'verbs': [[i, words[i]] for i in verbs],
+        }
+        for name in _TIERS:
+            sent[name] = _random_spans(rng, n_tokens, words, overlapping=rng.random() < 0.25) \
+                if rng.random() < 0.8 else []
+        # Spans shared between tiers (e.g. an entity which is also a noun chunk)
+        if sent['main_ents'] and rng.random() < 0.3:
+            sent['noun_chunks'] = sorted(sent['noun_chunks'] + [rng.choice(sent['main_ents'])])
+        sentences.append(sent)
+    return {'default_subj': [0, 1, 0, 5, 'Bayer', 'bayer'], 'sentences': sentences}
+
+
+def make_fixture(path=FIXTURE, n_documents=200, seed=0):
+    """Method to regenerate the fixture corpus, with the triplets of the original loops
+    """
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < n_documents:
+        document = _random_document(rng)
+        features, default_subj = _load_document(document)
+        try:
+            document['triplets'] = _reference_triplets(features, default_subj)
+        except IndexError:
+            # Duplicate of a dropped triplet with no triplet before it (fails in both implementations)
+            continue
+        corpus.append(document)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(corpus, f, separators=(',', ':'))
+
+
+if __name__ == '__main__':
+    make_fixture()
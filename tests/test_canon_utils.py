@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import spacy
+
+from canon_utils import canonicalize_triplets, connected_components, embed_strings, similar_pairs
+from store_utils import TripletStore
+
+VECTORS = {'acquire': [1, 0, 0, 0], 'buy': [0.95, 0.1, 0, 0], 'purchase': [0.9, 0.2, 0, 0],
+           'sell': [0, 1, 0, 0], 'stake': [0, 0, 1, 0],
+           'aspirin': [0, 0, 0, 1], 'acetylsalicylic': [0, 0.05, 0, 1], 'bayer': [0, 0, 1, 0.1]}
+
+
+def _vectors_nlp():
+    nlp = spacy.blank('en')
+    nlp.vocab.reset_vectors(width=4)
+    for word, vector in VECTORS.items():
+        nlp.vocab.set_vector(word, np.asarray(vector, dtype=np.float32))
+    return nlp
+
+
+def _triplets():
+    return pd.DataFrame({
+        'subject': ['bayer', 'bayer', 'bayer', 'bayer', 'monsanto', 'bayer'],
+        'relation': ['acquire', 'acquire', 'buy', 'purchase', 'sell', 'sell'],
+        'object': ['aspirin', 'aspirin', 'acetylsalicylic', 'monsanto', 'aspirin', 'acetylsalicylic']})
+
+
+def test_embeddings_are_mean_word_vectors():
+    vectors, has_vector = embed_strings(['acquire stake', 'unknown', 'acquire'], _vectors_nlp())
+    assert has_vector.tolist() == [True, False, True]
+    assert np.allclose(vectors[0], np.array([1, 0, 1, 0]) / np.sqrt(2))
+    assert not vectors[1].any()
+
+
+def test_triplets_are_rewritten_to_most_frequent_near_duplicate():
+    nlp = _vectors_nlp()
+    canonical = canonicalize_triplets(_triplets(), nlp, entity_threshold=0.95, relation_threshold=0.9)
+    assert canonical.relation.tolist() == ['acquire', 'acquire', 'acquire', 'acquire', 'sell', 'sell']
+    # Entities without vectors are kept as is
+    assert canonical.subject.tolist() == _triplets().subject.tolist()
+    assert canonical.object.tolist() == ['aspirin', 'aspirin', 'aspirin', 'monsanto', 'aspirin', 'aspirin']
+
+    store = canonicalize_triplets(TripletStore.from_dataframe(_triplets()), nlp, entity_threshold=0.95,
+                                  relation_threshold=0.9)
+    assert (store.to_dataframe(categorical=False)[['subject', 'relation', 'object']].values.tolist()
+            == canonical.values.tolist())
+    unchanged = canonicalize_triplets(_triplets(), nlp, entities=False, relations=False)
+    assert unchanged.values.tolist() == _triplets().values.tolist()
+
+
+def test_similar_pairs_and_components():
+    rng = np.random.RandomState(0)
+    vectors = rng.standard_normal((200, 16)).astype(np.float32)
+    vectors[100:110] = vectors[0] + 0.01 * rng.standard_normal((10, 16))
+    vectors /= np.linalg.norm(vectors, axis=1)[:, None]
+    pairs = similar_pairs(vectors, threshold=0.95)
+    sims = vectors @ vectors.T
+    assert all(sims[a, b] >= 0.95 for a, b in pairs)
+    assert set(map(tuple, pairs)) >= {(0, i) for i in range(100, 110)}
+
+    labels = connected_components(6, np.array([[1, 4], [4, 5], [2, 3]]))
+    assert labels.tolist() == [0, 1, 2, 2, 1, 1]
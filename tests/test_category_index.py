@@ -0,0 +1,60 @@
+import random
+
+import pandas as pd
+import pytest
+
+from scraper_utils import CategoryIndex, build_category_whitelist, filter_pages_by_categories
+
+
+def _reference_whitelist(wiki_data, page_whitelist, cat_blacklist):
+    """Original loops of `build_category_whitelist`
+    """
+    cat_whitelist = []
+    for page_name in page_whitelist:
+        categories = list(wiki_data[wiki_data.page==page_name].categories)[0]
+        for cat in categories:
+            if not any(unwanted in cat for unwanted in cat_blacklist):
+                cat_whitelist.append(cat)
+    return set(cat_whitelist)
+
+
+def _wiki_data(n_pages=200, seed=0):
+    rng = random.Random(seed)
+    topics = ['Bayer', 'Pharmaceutical companies', 'Drugs', 'Articles with short description',
+              'Wikipedia articles needing clarification', 'Companies of Germany', 'CS1 errors', 'Aspirin']
+    return pd.DataFrame({'page': ['Page {}'.format(i) for i in range(n_pages)],
+                         'categories': [rng.sample(topics, rng.randint(0, 4)) for _ in range(n_pages)]})
+
+
+def test_whitelist_matches_original_loops():
+    wiki_data = _wiki_data()
+    blacklist = ['Articles', 'Wikipedia', 'CS1', 'Bayer']
+    for pages in (['Page 0'], ['Page {}'.format(i) for i in range(0, 200, 7)]):
+        assert (build_category_whitelist(wiki_data, pages, blacklist) 
+                == _reference_whitelist(wiki_data, pages, blacklist))
+    assert build_category_whitelist(wiki_data, ['Page 3'], []) == set(wiki_data.categories[3])
+    with pytest.raises(KeyError):
+        build_category_whitelist(wiki_data, ['Unknown page'], blacklist)
+
+
+def test_filter_pages_by_whitelist_and_blacklist():
+    wiki_data = _wiki_data()
+    index = CategoryIndex(wiki_data)
+    whitelist, blacklist = {'Drugs', 'Aspirin'}, ['CS1', 'clarification']
+    kept = filter_pages_by_categories(wiki_data, whitelist, index=index)
+    assert kept.page.tolist() == [page for page, cats in zip(wiki_data.page, wiki_data.categories)
+                                  if set(cats) & whitelist]
+    kept = filter_pages_by_categories(wiki_data, whitelist, blacklist, index=index)
+    assert kept.page.tolist() == [page for page, cats in zip(wiki_data.page, wiki_data.categories)
+                                  if set(cats) & whitelist 
+                                  and not any(term in cat for cat in cats for term in blacklist)]
+    assert len(filter_pages_by_categories(wiki_data, set())) == 0
+
+
+def test_index_lookups():
+    wiki_data = pd.DataFrame({'page': ['A', 'B', 'C'], 'categories': [['x', 'y'], [], ['y']]})
+    index = CategoryIndex(wiki_data)
+    assert index.page_categories('A') == ['x', 'y']
+    assert index.page_categories('B') == []
+    assert index.category_pages('y') == ['A', 'C']
+    assert index.category_pages('z') == []
@@ -0,0 +1,31 @@
+import spacy
+
+import kg_utils
+from kg_utils import EntityMatcher
+
+
+def _match(entities, text):
+    nlp = spacy.blank('en')
+    return [(span.start, span.end, span.text) for span in EntityMatcher(entities, nlp)(nlp(text))]
+
+
+def test_single_token_matches_nested_in_phrases_are_kept():
+    spans = _match(['antibody', 'Monoclonal antibody', 'aspirin'],
+                   "A monoclonal antibody is not aspirin, nor an antibody.")
+    assert spans == [(1, 3, 'monoclonal antibody'), (2, 3, 'antibody'),
+                     (5, 6, 'aspirin'), (9, 10, 'antibody')]
+
+
+def test_overlapping_phrases_are_deoverlapped_longest_first():
+    spans = _match(['monoclonal antibody', 'antibody drug conjugate'],
+                   "The monoclonal antibody drug conjugate works.")
+    assert spans == [(2, 5, 'antibody drug conjugate')]
+
+
+def test_fingerprint_depends_on_matching_version(monkeypatch):
+    nlp = spacy.blank('en')
+    fingerprint = EntityMatcher(['aspirin', 'monoclonal antibody'], nlp).fingerprint()
+    assert EntityMatcher(['Aspirin', 'monoclonal antibody'], nlp).fingerprint() == fingerprint
+    assert EntityMatcher(['aspirin'], nlp).fingerprint() != fingerprint
+    monkeypatch.setattr(kg_utils, 'MATCHER_VERSION', kg_utils.MATCHER_VERSION + 1)
+    assert EntityMatcher(['aspirin', 'monoclonal antibody'], nlp).fingerprint() != fingerprint
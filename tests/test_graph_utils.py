@@ -0,0 +1,82 @@
+import collections
+
+import numpy as np
+import pandas as pd
+
+import graph_utils
+from graph_utils import GraphIndex, force_layout
+from store_utils import TripletStore
+
+
+def test_index_of_filtered_store_has_only_used_nodes():
+    triplets = pd.DataFrame({'subject': ['a', 'x', 'b'], 'relation': ['r', 'q', 's'],
+                             'object': ['b', 'y', 'c']})
+    store = TripletStore.from_dataframe(triplets)
+    filtered = store.filter(store.subject != store.entities.ids['x'])
+    index = GraphIndex(filtered)
+    assert sorted(index.nodes) == ['a', 'b', 'c']
+    assert sorted(index.relation_names) == ['r', 's']
+    assert index.fingerprint() == GraphIndex(filtered.to_dataframe(categorical=False)).fingerprint()
+    assert sorted(zip(index.nodes, index.degrees())) == [('a', 1), ('b', 2), ('c', 1)]
+
+
+def _chain(n, offset=0):
+    nodes = ['n{}'.format(offset + i) for i in range(n)]
+    return pd.DataFrame({'subject': nodes[:-1], 'relation': ['r'] * (n - 1), 'object': nodes[1:]})
+
+
+def test_layouts_are_cached_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_utils, '_LAYOUTS', collections.OrderedDict())
+    monkeypatch.setattr(graph_utils, '_MAX_LAYOUTS', 2)
+    indexes = [GraphIndex(_chain(5, offset=10 * i)) for i in range(3)]
+    first = force_layout(indexes[0], iterations=5, cache_dir=str(tmp_path))
+    assert first.shape == (5, 2) and np.isfinite(first).all()
+    assert force_layout(indexes[0], iterations=5) is first
+    force_layout(indexes[1], iterations=5)
+    force_layout(indexes[0], iterations=5)
+    force_layout(indexes[2], iterations=5)
+    assert len(graph_utils._LAYOUTS) == 2
+    # The least recently used layout was evicted, and is still found on disk
+    assert not any(key.startswith(indexes[1].fingerprint()) for key in graph_utils._LAYOUTS)
+    assert force_layout(indexes[0], iterations=5) is first
+    monkeypatch.setattr(graph_utils, '_LAYOUTS', collections.OrderedDict())
+    assert np.array_equal(force_layout(indexes[0], iterations=5, cache_dir=str(tmp_path)), first)
+
+
+def _reference_edges(triplets):
+    """Edges aggregated row by row, with distinct values most frequent first, then in order of triplets
+    """
+    edges = collections.OrderedDict()
+    for row in triplets.itertuples(index=False):
+        edge = edges.setdefault((row.subject, row.object), {'weight': 0, 'relations': [], 'pages': []})
+        edge['weight'] += 1
+        edge['relations'].append(row.relation)
+        if isinstance(row.page, str):
+            edge['pages'].append(row.page)
+
+    def distinct(values):
+        counts = collections.Counter(values)
+        return sorted(counts, key=lambda value: (-counts[value], values.index(value)))
+    return {key: (edge['weight'], distinct(edge['relations']), distinct(edge['pages']))
+            for key, edge in edges.items()}
+
+
+def test_aggregate_edges_matches_row_by_row_aggregation():
+    rng = np.random.RandomState(0)
+    n = 500
+    entities = np.array(['e{}'.format(i) for i in range(15)], dtype=object)
+    triplets = pd.DataFrame({'subject': entities[rng.randint(0, 15, n)],
+                             'relation': np.array(['r0', 'r1', 'r2'], dtype=object)[rng.randint(0, 3, n)],
+                             'object': entities[rng.randint(0, 15, n)],
+                             'page': np.array(['p0', 'p1', None], dtype=object)[rng.randint(0, 3, n)]})
+    expected = _reference_edges(triplets)
+    for source in (triplets, TripletStore.from_dataframe(triplets)):
+        edges = graph_utils.aggregate_edges(source, sep='|')
+        assert len(edges) == len(expected)
+        assert {(row.subject, row.object): (row.weight, row.relations, row.pages) 
+                for row in edges.itertuples()} == expected
+        assert (edges.relation == edges.relations.str.join('|')).all()
+
+    k_graph = graph_utils.aggregated_graph(triplets)
+    assert k_graph.number_of_edges() == len(expected)
+    assert sum(weight for _, _, weight in k_graph.edges(data='weight')) == n
@@ -0,0 +1,62 @@
+import pytest
+import spacy
+
+import incremental_utils
+from incremental_utils import IncrementalKG
+
+PAGES = {
+    'Aspirin': [('bayer', 'make', 'aspirin', 0), ('bayer', 'sell', 'aspirin', 1)],
+    'Bayer': [('bayer', 'own', 'aspirin', 0), ('bayer ag', 'acquire', 'monsanto', 1)],
+}
+
+
+def _fake_stream(records, global_ents_list, batch_size, nlp=None, with_sent=False):
+    for page, text in records:
+        if text == 'fail':
+            raise IndexError("pop from empty list")
+        yield page, [tuple(triplet) for triplet in PAGES[page] if text != 'empty']
+
+
+def _kg(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental_utils, 'extract_triplets_stream', _fake_stream)
+    return IncrementalKG(str(tmp_path / 'kg.sqlite'))
+
+
+def test_triplets_cached_until_change(tmp_path, monkeypatch):
+    kg = _kg(tmp_path, monkeypatch)
+    nlp = spacy.blank('en')
+    kg.refresh([{'page': page, 'text': page} for page in PAGES], [], nlp=nlp)
+    triplets = kg.triplets()
+    assert len(triplets) == 3
+    assert kg.triplets() is triplets
+    assert kg.triplets(min_subj=1, min_obj=1) is not triplets
+
+    # Unchanged snapshot keeps the cached dataframe
+    kg.refresh([{'page': page, 'text': page} for page in PAGES], [], nlp=nlp)
+    assert kg.triplets() is triplets
+
+    # Changed page invalidates it
+    kg.refresh([{'page': 'Aspirin', 'text': 'empty'}, {'page': 'Bayer', 'text': 'Bayer'}], [], nlp=nlp)
+    assert set(kg.triplets().relation) == set()
+    assert set(kg.triplets(min_subj=1, min_obj=1).relation) == {'own', 'ag acquire'}
+    kg.close()
+
+
+def test_failed_refresh_leaves_state_unchanged(tmp_path, monkeypatch):
+    kg = _kg(tmp_path, monkeypatch)
+    nlp = spacy.blank('en')
+    kg.refresh([{'page': page, 'text': page} for page in PAGES], [], nlp=nlp)
+    triplets = kg.triplets(min_subj=1, min_obj=1)
+    state = (dict(kg.subj_counts), dict(kg.obj_counts), list(kg.subjects), dict(kg.merge_map))
+
+    # Extraction fails after retracting the changed page and extracting another one
+    with pytest.raises(IndexError):
+        kg.refresh([{'page': 'Bayer', 'text': 'empty'}, {'page': 'Aspirin', 'text': 'fail'}], [], nlp=nlp)
+    assert (dict(kg.subj_counts), dict(kg.obj_counts), list(kg.subjects), dict(kg.merge_map)) == state
+    assert kg.triplets(min_subj=1, min_obj=1).values.tolist() == triplets.values.tolist()
+    kg.close()
+
+    # Counts in memory are the same as persisted ones
+    kg = IncrementalKG(str(tmp_path / 'kg.sqlite'))
+    assert (dict(kg.subj_counts), dict(kg.obj_counts), list(kg.subjects), dict(kg.merge_map)) == state
+    kg.close()
@@ -0,0 +1,77 @@
+import json
+import time
+
+import pandas as pd
+import pytest
+
+import instrument_utils as instrument
+import kg_utils
+from conftest import ENTITIES
+
+
+@pytest.fixture
+def metrics():
+    instrument.reset()
+    instrument.enable()
+    yield instrument
+    instrument.disable()
+    instrument.reset()
+
+
+def test_nothing_is_recorded_when_disabled():
+    instrument.reset()
+    instrument.count('a')
+    with instrument.timer('b'):
+        pass
+    items = [1, 2]
+    assert instrument.timed_iter('c', items) is items
+    assert instrument.snapshot() == {'counters': {}, 'timers': {}}
+
+
+def test_nested_timers_exclude_nested_time(metrics):
+    with metrics.timer('outer'):
+        time.sleep(0.02)
+        for _ in range(2):
+            with metrics.timer('inner'):
+                time.sleep(0.02)
+    timers = metrics.snapshot()['timers']
+    assert timers['inner']['count'] == 2
+    assert timers['outer']['seconds'] >= timers['inner']['seconds'] + 0.02
+    assert timers['outer']['self_seconds'] == pytest.approx(
+        timers['outer']['seconds'] - timers['inner']['seconds'], abs=1e-6)
+
+
+def test_timed_iter_excludes_consumer_time(metrics):
+    def produce():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+    for _ in metrics.timed_iter('produce', produce()):
+        time.sleep(0.05)
+    stats = metrics.snapshot()['timers']['produce']
+    assert stats['count'] == 4
+    assert 0.03 <= stats['seconds'] < 0.15
+
+
+def test_merge_and_sinks(metrics, tmp_path):
+    metrics.count('scrape.pages_fetched', 2)
+    metrics.merge({'counters': {'scrape.pages_fetched': 3},
+                   'timers': {'scrape.http': {'count': 1, 'seconds': 0.5, 'self_seconds': 0.5,
+                                              'max_seconds': 0.5}}})
+    jsonl, prom = str(tmp_path / 'metrics.jsonl'), str(tmp_path / 'metrics.prom')
+    metrics.enable(metrics.JSONLinesSink(jsonl), metrics.PrometheusSink(prom))
+    metrics.flush()
+    with open(jsonl) as f:
+        assert json.loads(f.readline())['counters'] == {'scrape.pages_fetched': 5}
+    with open(prom) as f:
+        lines = f.read().splitlines()
+    assert 'kg_scrape_pages_fetched_total 5' in lines
+    assert 'kg_scrape_http_calls_total 1' in lines
+
+
+def test_worker_metrics_are_merged(metrics, nlp, texts):
+    wiki_data = pd.DataFrame({'page': ['Bayer'] * len(texts), 'text': texts})
+    kg_utils.extract_triplets_corpus(wiki_data, ENTITIES, n_process=2, nlp=nlp)
+    counters = metrics.snapshot()['counters']
+    assert counters['extract.pages'] == len(texts)
+    assert counters['extract.triplets_emitted'] > 0
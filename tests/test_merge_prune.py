@@ -0,0 +1,88 @@
+import random
+
+import pandas as pd
+
+from kg_utils import merge_duplicate_subjs, prune_triplets
+from store_utils import TripletStore
+
+
+def _reference_merge(triplets):
+    """Original loop of `merge_duplicate_subjs`, updating rows of each merged subject in turn
+    """
+    subjects = sorted(list(triplets.subject.unique()))
+    prev_subj = subjects[0]
+    for subj in subjects[1:]:
+        if prev_subj in subj:
+            triplets.loc[triplets.subject==subj, 'relation'] = \
+                subj.replace(prev_subj, '').strip() + ' ' + triplets[triplets.subject==subj].relation
+            triplets.loc[triplets.subject==subj, 'subject'] = prev_subj
+        else:
+            prev_subj = subj
+    return triplets
+
+
+def _random_triplets(n=300, seed=0):
+    rng = random.Random(seed)
+    words = ['bayer', 'ag', 'healthcare', 'monsanto', 'crop', 'science', 'aspirin', 'drug', 'bay']
+    phrase = lambda: ' '.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+    return pd.DataFrame({'subject': [phrase() for _ in range(n)],
+                         'relation': [rng.choice(['makes', 'owns', 'sells']) for _ in range(n)],
+                         'object': [phrase() for _ in range(n)]})
+
+
+def test_merge_matches_original_loop():
+    for seed in range(3):
+        triplets = _random_triplets(seed=seed)
+        expected = _reference_merge(triplets.copy())
+        merged = merge_duplicate_subjs(triplets.copy())
+        assert merged.values.tolist() == expected.values.tolist()
+
+
+def test_merge_store_matches_dataframe():
+    triplets = _random_triplets()
+    merged = merge_duplicate_subjs(TripletStore.from_dataframe(triplets))
+    expected = merge_duplicate_subjs(triplets.copy())
+    assert (merged.to_dataframe(categorical=False)[['subject', 'relation', 'object']].values.tolist()
+            == expected.values.tolist())
+
+
+def test_merge_changes_subjects():
+    triplets = _random_triplets()
+    merged = merge_duplicate_subjs(triplets.copy())
+    assert merged.subject.nunique() < triplets.subject.nunique()
+
+
+def test_fuzzy_merge_keeps_most_frequent_spelling():
+    triplets = pd.DataFrame({'subject': ['monsanto', 'monsanto', 'monsnato', 'aspirin'],
+                             'relation': ['r'] * 4, 'object': ['o'] * 4})
+    merged = merge_duplicate_subjs(triplets, fuzzy=True, fuzzy_threshold=0.8)
+    assert merged.subject.tolist() == ['monsanto', 'monsanto', 'monsanto', 'aspirin']
+
+
+def _is_fixpoint(triplets, min_subj, min_obj):
+    return ((triplets.subject.value_counts() >= min_subj).all()
+            and (triplets.object.value_counts() >= min_obj).all()
+            and not (triplets.subject == triplets.object).any())
+
+
+def test_prune_single_pass_counts_before_pruning():
+    triplets = _random_triplets()
+    pruned = prune_triplets(triplets, min_subj=3, min_obj=3)
+    subj_counts, obj_counts = triplets.subject.value_counts(), triplets.object.value_counts()
+    keep = ((triplets.subject.map(subj_counts) >= 3) & (triplets.object.map(obj_counts) >= 3)
+            & (triplets.subject != triplets.object))
+    assert pruned.index.tolist() == triplets.index[keep].tolist()
+
+
+def test_prune_reaches_fixpoint():
+    triplets = _random_triplets(n=500)
+    pruned = prune_triplets(triplets, min_subj=3, min_obj=3)
+    assert not _is_fixpoint(pruned, 3, 3)
+    pruned = prune_triplets(triplets, min_subj=3, min_obj=3, iterate_to_fixpoint=True)
+    assert len(pruned) > 0 and _is_fixpoint(pruned, 3, 3)
+    # Pruning again removes nothing
+    assert len(prune_triplets(pruned, min_subj=3, min_obj=3, iterate_to_fixpoint=True)) == len(pruned)
+
+    store = prune_triplets(TripletStore.from_dataframe(triplets), min_subj=3, min_obj=3, iterate_to_fixpoint=True)
+    assert (store.to_dataframe(categorical=False)[['subject', 'relation', 'object']].values.tolist()
+            == pruned.values.tolist())
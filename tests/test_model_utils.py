@@ -0,0 +1,32 @@
+import spacy
+
+import kg_utils
+import model_utils
+
+
+def test_pipelines_are_loaded_once_per_configuration(monkeypatch):
+    loaded = []
+
+    def load(name, disable=()):
+        loaded.append((name, tuple(disable)))
+        return spacy.blank('en')
+    monkeypatch.setattr(spacy, 'load', load)
+    monkeypatch.setattr(model_utils, '_PIPELINES', {})
+
+    nlp = model_utils.get_nlp('en_fake', coref=False)
+    assert model_utils.get_nlp('en_fake', coref=False) is nlp
+    assert model_utils.get_nlp('en_fake', coref=False, disable=('ner',)) is not nlp
+    assert model_utils.get_nlp('en_fake', coref=False, disable=['ner']) is not nlp
+    assert loaded == [('en_fake', ()), ('en_fake', ('ner',))]
+
+    model_utils.clear_cache()
+    assert model_utils.get_nlp('en_fake', coref=False) is not nlp
+    assert len(loaded) == 3
+
+
+def test_default_pipeline_is_loaded_on_first_use(monkeypatch):
+    calls = []
+    monkeypatch.setattr(kg_utils, 'get_nlp', lambda: calls.append(1) or 'pipeline')
+    assert calls == []
+    assert kg_utils.nlp == 'pipeline'
+    assert calls == [1]
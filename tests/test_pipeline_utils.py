@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from pipeline_utils import background
+
+
+def _producer(produced, closed, n=1000, fail_at=None):
+    try:
+        for i in range(n):
+            if i == fail_at:
+                raise ValueError("Producer failed")
+            produced.append(i)
+            yield i
+    finally:
+        closed.set()
+
+
+def test_background_applies_backpressure():
+    produced, closed = [], threading.Event()
+    items = background(_producer(produced, closed), maxsize=4)
+    assert next(items) == 0
+    time.sleep(0.2)
+    # One item consumed, `maxsize` buffered, and one waiting to be buffered
+    assert len(produced) <= 6
+    assert list(items) == list(range(1, 1000))
+
+
+def test_background_producer_stops_when_consumer_stops():
+    produced, closed = [], threading.Event()
+    items = background(_producer(produced, closed), maxsize=4)
+    assert next(items) == 0
+    time.sleep(0.2)
+    items.close()
+    assert closed.wait(timeout=2)
+    assert len(produced) <= 6
+
+
+def test_background_producer_exits_when_consumer_stops_on_full_queue():
+    # The producer is done while its queue is full, and the consumer stops
+    threads = set(threading.enumerate())
+    produced, closed = [], threading.Event()
+    items = background(_producer(produced, closed, n=5), maxsize=4)
+    assert next(items) == 0
+    assert closed.wait(timeout=2)
+    items.close()
+    producer, = set(threading.enumerate()) - threads
+    producer.join(timeout=2)
+    assert not producer.is_alive()
+
+
+def test_background_reraises_producer_errors():
+    produced, closed = [], threading.Event()
+    items = background(_producer(produced, closed, fail_at=10), maxsize=4)
+    with pytest.raises(ValueError):
+        list(items)
@@ -0,0 +1,97 @@
+import itertools
+import random
+
+import pandas as pd
+import pytest
+
+from query_utils import TripletQueryEngine
+from store_utils import TripletStore
+
+
+def _random_triplets(n=400, seed=0):
+    rng = random.Random(seed)
+    entities = ['e{}'.format(i) for i in range(20)]
+    relations = ['r{}'.format(i) for i in range(4)]
+    return pd.DataFrame([(rng.choice(entities), rng.choice(relations), rng.choice(entities)) for _ in range(n)],
+                        columns=['subject', 'relation', 'object'])
+
+
+def _reference_query(triplets, patterns):
+    """Brute-force join of patterns over all combinations of triplets
+    """
+    rows = list(triplets.itertuples(index=False, name=None))
+    solutions = []
+    for combination in itertools.product(rows, repeat=len(patterns)):
+        binding = {}
+        for pattern, triplet in zip(patterns, combination):
+            for term, value in zip(pattern, triplet):
+                if term is None or term == '?':
+                    continue
+                if term.startswith('?'):
+                    if binding.setdefault(term, value) != value:
+                        break
+                elif term != value:
+                    break
+            else:
+                continue
+            break
+        else:
+            solutions.append(binding)
+    return solutions
+
+
+def _key(solution):
+    return tuple(sorted(solution.items()))
+
+
+QUERIES = [
+    [('e1', '?', '?x')],
+    [('?x', 'r0', '?y'), ('?y', 'r1', '?z')],
+    [('?x', '?r', 'e2'), ('?x', '?r', 'e3')],
+    [('?x', 'r2', '?x')],
+    [('e4', '?r', '?y'), ('?y', None, 'e5')],
+    [('unknown', '?', '?x')],
+]
+
+
+@pytest.mark.parametrize('patterns', QUERIES)
+def test_joins_match_brute_force(patterns):
+    triplets = _random_triplets(n=120)
+    engine = TripletQueryEngine(triplets)
+    solutions = list(engine.query(*patterns))
+    expected = _reference_query(triplets, patterns)
+    assert sorted(map(_key, solutions)) == sorted(map(_key, expected))
+    assert (sorted(map(_key, engine.query(*patterns, distinct=True)))
+            == sorted(set(map(_key, expected))))
+
+
+def test_distinct_and_limit():
+    triplets = pd.DataFrame({'subject': ['a', 'a', 'a', 'b'], 'relation': ['r', 'r', 's', 'r'],
+                             'object': ['b', 'b', 'c', 'c']})
+    engine = TripletQueryEngine(TripletStore.from_dataframe(triplets))
+    assert len(list(engine.query(('a', '?', '?x')))) == 3
+    assert sorted(solution['?x'] for solution in engine.query(('a', '?', '?x'), distinct=True)) == ['b', 'c']
+    assert len(list(engine.query(('?s', '?', '?x'), limit=2))) == 2
+    assert len(list(engine.query(('a', '?', '?x'), distinct=True, limit=1))) == 1
+    assert engine.query_dataframe(('?s', 'r', 'c')).values.tolist() == [['b']]
+
+
+def test_counts_and_triplets():
+    triplets = _random_triplets()
+    engine = TripletQueryEngine(triplets)
+    assert len(engine) == len(triplets)
+    for subject, relation, object in [('e1', None, None), (None, 'r2', 'e3'), ('e1', 'r0', 'e2'), 
+                                      (None, None, None), ('e1', None, 'e1'), ('x', None, None)]:
+        mask = pd.Series(True, index=triplets.index)
+        for column, term in zip(['subject', 'relation', 'object'], [subject, relation, object]):
+            if term is not None:
+                mask &= triplets[column] == term
+        assert engine.count(subject, relation, object) == mask.sum()
+        assert (sorted(engine.triplets(subject, relation, object))
+                == sorted(triplets[mask].itertuples(index=False, name=None)))
+
+
+def test_variable_cannot_be_relation_and_entity():
+    engine = TripletQueryEngine(_random_triplets(n=10))
+    with pytest.raises(ValueError):
+        list(engine.query(('?x', '?x', '?y')))
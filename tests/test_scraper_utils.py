@@ -0,0 +1,182 @@
+import math
+import threading
+
+import pytest
+
+import bench_utils
+from scraper_utils import MAX_TITLES_PER_QUERY, PageCache, wiki_crawl, wiki_scrape, wiki_scrape_async
+
+
+@pytest.fixture
+def fake_api():
+    pages, _ = bench_utils.synthetic_corpus(120, n_sentences=3)
+    api = bench_utils.FakeWikiAPI(pages)
+    url = api.serve()
+    yield api, url, pages
+    api.stop()
+
+
+def _rows(df):
+    return sorted((row.page, row.text, row.link, tuple(row.categories)) for row in df.itertuples())
+
+
+def test_fake_api_returns_one_full_extract_per_query():
+    pages, _ = bench_utils.synthetic_corpus(3, n_sentences=2)
+    api = bench_utils.FakeWikiAPI(pages)
+    response = api.query({'titles': '|'.join(page['page'] for page in pages), 'prop': 'extracts|info'})
+    assert ['extract' in page for page in response['query']['pages']] == [True, False, False]
+    assert response['continue'] == {'excontinue': 1, 'continue': '||info'}
+    response = api.query(dict({'titles': '|'.join(page['page'] for page in pages), 'prop': 'extracts|info'},
+                              **response['continue']))
+    assert ['extract' in page for page in response['query']['pages']] == [False, True, False]
+    assert 'lastrevid' not in response['query']['pages'][0]
+
+
+def test_async_scrape_matches_wiki_scrape(fake_api):
+    pytest.importorskip('aiohttp')
+    api, url, pages = fake_api
+    sources = wiki_scrape_async(pages[0]['page'], verbose=False, api_url=url, rate=10000)
+    expected = wiki_scrape(pages[0]['page'], verbose=False, wiki_api=bench_utils.FakeWikiAPI(pages))
+    assert _rows(sources) == _rows(expected)
+    # One info/categories query per batch of titles, and one extract query per page
+    n_links = len(pages) - 1
+    assert api.n_requests <= len(pages) + 2 + math.ceil(n_links / MAX_TITLES_PER_QUERY)
+
+
+def test_async_scrape_follows_category_continuations():
+    pytest.importorskip('aiohttp')
+    pages, _ = bench_utils.synthetic_corpus(60, n_sentences=2)
+    for i, page in enumerate(pages):
+        page['categories'] = ['Category:Topic {} {}'.format(i, j) for j in range(20)]
+    api = bench_utils.FakeWikiAPI(pages)
+    url = api.serve()
+    try:
+        sources = wiki_scrape_async(pages[0]['page'], verbose=False, api_url=url, rate=10000)
+    finally:
+        api.stop()
+    assert sorted(map(len, sources.categories)) == [20] * len(pages)
+
+
+def test_async_scrape_keeps_other_batches_when_a_batch_fails(fake_api, monkeypatch):
+    pytest.importorskip('aiohttp')
+    api, url, pages = fake_api
+    query = api.query
+    failing = pages[-1]['page']
+
+    def failing_query(params):
+        if failing in params['titles'].split('|'):
+            raise RuntimeError("Service unavailable")
+        return query(params)
+    monkeypatch.setattr(api, 'query', failing_query)
+    sources = wiki_scrape_async(pages[0]['page'], verbose=False, api_url=url, rate=10000,
+                                max_retries=1, backoff=0.01)
+    # Only the batch of the failing page is lost
+    links = sorted(page['page'] for page in pages[1:])
+    lost = next(links[i:i+MAX_TITLES_PER_QUERY] for i in range(0, len(links), MAX_TITLES_PER_QUERY)
+                if failing in links[i:i+MAX_TITLES_PER_QUERY])
+    assert sorted(sources.page) == sorted(set(page['page'] for page in pages) - set(lost))
+
+
+def test_page_cache_serves_unchanged_pages_without_refetching(tmp_path):
+    pages, _ = bench_utils.synthetic_corpus(30, n_sentences=3)
+    api = bench_utils.FakeWikiAPI(pages)
+    path = str(tmp_path / 'pages.sqlite')
+    expected = wiki_scrape(pages[0]['page'], verbose=False, cache=PageCache(path), wiki_api=api)
+    assert api.n_requests == len(pages)
+
+    # Fresh entries are served without any call
+    api.n_requests = 0
+    cache = PageCache(path)
+    assert _rows(wiki_scrape(pages[0]['page'], verbose=False, cache=cache, wiki_api=api)) == _rows(expected)
+    assert api.n_requests == 0
+
+    # Stale entries are revalidated, and only changed pages are stored again
+    api.pages[pages[1]['page']] = dict(pages[1], text='Edited text of the page.', revid=pages[1]['revid'] + 1)
+    cache = PageCache(path, ttl=None)
+    sources = wiki_scrape(pages[0]['page'], verbose=False, cache=cache, wiki_api=api)
+    assert sources.set_index('page').text[pages[1]['page']] == 'Edited text of the page.'
+    assert cache.get(pages[1]['page'], revid=pages[1]['revid']) is None
+    assert cache.get(pages[1]['page'], revid=pages[1]['revid'] + 1)['data']['text'] == 'Edited text of the page.'
+    assert len(cache) == len(pages)
+
+    # Offline mode serves entirely from cache
+    sources = wiki_scrape(pages[0]['page'], verbose=False, cache=PageCache(path, offline=True), wiki_api=None)
+    assert len(sources) == len(expected)
+
+
+def test_page_cache_lookups_do_not_commit(tmp_path):
+    path = str(tmp_path / 'pages.sqlite')
+    cache = PageCache(path)
+    cache.put_many([('A', 1, {'page': 'A'}), ('B', None, None)])
+    accessed_at = cache._conn.execute("SELECT accessed_at FROM page_revisions WHERE title='A'").fetchone()[0]
+    assert [entry and entry['data'] for entry in cache.get_many(['A', 'B', 'C'])] == [{'page': 'A'}, None, None]
+    assert not cache._conn.in_transaction
+    cache.close()
+    cache = PageCache(path)
+    assert cache._conn.execute("SELECT accessed_at FROM page_revisions WHERE title='A'").fetchone()[0] > accessed_at
+
+
+def test_async_scrape_revalidates_stale_pages_in_batches(fake_api, tmp_path):
+    pytest.importorskip('aiohttp')
+    api, url, pages = fake_api
+    path = str(tmp_path / 'pages.sqlite')
+    expected = wiki_scrape_async(pages[0]['page'], verbose=False, cache=PageCache(path), api_url=url, rate=10000)
+    api.n_requests = 0
+    api.pages[pages[1]['page']] = dict(pages[1], text='Edited text of the page.', revid=pages[1]['revid'] + 1)
+    sources = wiki_scrape_async(pages[0]['page'], verbose=False, cache=PageCache(path, ttl=None),
+                                api_url=url, rate=10000)
+    # Info of the start page, and of linked pages in batches, plus the text of the edited page
+    assert api.n_requests == 1 + math.ceil((len(pages) - 1) / MAX_TITLES_PER_QUERY) + 1
+    assert sources.set_index('page').text[pages[1]['page']] == 'Edited text of the page.'
+    assert len(sources) == len(expected)
+
+
+def _link_graph():
+    links = {'A': ['B', 'C', 'Category:Things'], 'B': ['C', 'D'], 'C': ['A', 'D'], 'D': ['E'], 'E': []}
+    return [{'page': page, 'text': 'Text of page {}.'.format(page), 'links': page_links,
+             'categories': ['Category:' + ('Kept' if page != 'C' else 'Other')], 'revid': 1}
+            for page, page_links in links.items()]
+
+
+def test_crawl_follows_links_up_to_depth_once_per_page():
+    api = bench_utils.FakeWikiAPI(_link_graph())
+    crawled = [data['page'] for data in wiki_crawl('A', depth=2, wiki_api=api, verbose=False)]
+    assert sorted(crawled) == ['A', 'B', 'C', 'D']
+    # Linked blacklisted pages are not fetched, and every page is fetched once
+    assert api.n_requests == 4
+
+
+def test_crawl_only_follows_links_from_whitelisted_categories():
+    api = bench_utils.FakeWikiAPI(_link_graph())
+    crawled = [data['page'] for data in wiki_crawl('A', depth=3, cat_whitelist={'Kept'}, wiki_api=api,
+                                                    verbose=False)]
+    # Links from C are not followed, but D is still reached from B
+    assert sorted(crawled) == ['A', 'B', 'C', 'D', 'E']
+    crawled = [data['page'] for data in wiki_crawl('A', depth=3, cat_whitelist=set(), wiki_api=api,
+                                                    verbose=False)]
+    assert sorted(crawled) == ['A', 'B', 'C']
+
+
+def test_crawl_bounds_requests_in_flight_and_skips_failures():
+    pages, _ = bench_utils.synthetic_corpus(30, n_sentences=2)
+    api = bench_utils.FakeWikiAPI(pages, latency=0.01)
+    page = api.page
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def counting_page(title):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        try:
+            if title == pages[5]['page']:
+                raise IOError("Connection reset")
+            return page(title)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+    api.page = counting_page
+    crawled = list(wiki_crawl(pages[0]['page'], max_in_flight=3, max_retries=1, backoff=0.01,
+                              wiki_api=api, verbose=False))
+    assert in_flight[1] == 3
+    assert sorted(data['page'] for data in crawled) == sorted(page['page'] for page in pages if page != pages[5])
@@ -0,0 +1,66 @@
+import math
+
+import pytest
+
+import kg_utils
+from conftest import ENTITIES
+from server_utils import ExtractionServer, extract_triplets_remote, server_metrics
+
+
+@pytest.fixture
+def server(nlp):
+    server = ExtractionServer(nlp, max_batch_size=8, max_latency=0.2).start()
+    yield server
+    server.stop()
+
+
+def _expected(nlp, texts, entities=ENTITIES):
+    records = [('Bayer', text) for text in texts]
+    return [triplets for _, triplets in kg_utils.extract_triplets_stream(records, entities, nlp=nlp)]
+
+
+def test_concurrent_requests_are_batched(server, nlp, texts):
+    futures = [server.submit(text, 'Bayer', ENTITIES) for text in texts[:20]]
+    # Entity lists are compared case-insensitively
+    futures += [server.submit(texts[0], 'Bayer', [ent.upper() for ent in ENTITIES])]
+    futures += [server.submit(texts[0], 'Bayer', ['bayer ag'])]
+    results = [future.result(timeout=30) for future in futures]
+    assert results[:21] == _expected(nlp, texts[:20] + texts[:1])
+    assert results[21] == _expected(nlp, texts[:1], ['bayer ag'])[0]
+    metrics = server.metrics()
+    assert metrics['requests'] == 22 and metrics['errors'] == 0
+    assert metrics['batches'] <= math.ceil(22 / 8) + 1
+    assert len(server._matchers) == 2
+
+
+def test_failed_group_does_not_fail_other_requests(server, nlp, texts, monkeypatch):
+    stream = kg_utils.extract_triplets_stream
+
+    def failing_stream(records, matcher, **kwargs):
+        if 'bayer ag' in matcher:
+            raise ValueError("Extraction failed")
+        return stream(records, matcher, **kwargs)
+    monkeypatch.setattr('server_utils.extract_triplets_stream', failing_stream)
+    ok, failed = server.submit(texts[0], 'Bayer', ENTITIES), server.submit(texts[0], 'Bayer', ['bayer ag'])
+    assert ok.result(timeout=30) == _expected(nlp, texts[:1])[0]
+    with pytest.raises(ValueError):
+        failed.result(timeout=30)
+    assert server.metrics()['errors'] == 1
+
+
+@pytest.mark.parametrize('arrow', [False, True])
+def test_round_trip_over_http(nlp, texts, tmp_path, arrow):
+    if arrow:
+        pytest.importorskip('pyarrow')
+    expected = kg_utils.extract_triplets(texts[1], 'Bayer', ENTITIES, nlp=nlp)
+    assert len(expected) > 0
+    for kwargs in ({'port': 0}, {'socket_path': str(tmp_path / 'kg.sock')}):
+        server = ExtractionServer(nlp, max_latency=0.01).serve(block=False, **kwargs)
+        try:
+            triplets = extract_triplets_remote(texts[1], 'Bayer', ENTITIES, url=server.url, arrow=arrow, 
+                                               timeout=30)
+            assert triplets.values.tolist() == expected.values.tolist()
+            assert list(triplets.columns) == ['subject', 'relation', 'object']
+            assert server_metrics(server.url)['requests'] == 1
+        finally:
+            server.stop()
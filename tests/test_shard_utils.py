@@ -0,0 +1,44 @@
+import pandas as pd
+
+import kg_utils
+from cache_utils import SentenceCache
+from conftest import ENTITIES
+from shard_utils import extract_triplets_sharded, load_manifest, reduce_shards
+
+
+def _wiki_data(texts):
+    return pd.DataFrame({'page': ['Bayer'] * len(texts), 'text': texts})
+
+
+def test_sharded_extraction_with_cache_in_workers(nlp, texts, tmp_path):
+    wiki_data = _wiki_data(texts)
+    expected = kg_utils.extract_triplets_corpus(wiki_data, ENTITIES, nlp=nlp, as_store=True)
+    cache_path = str(tmp_path / 'cache.sqlite')
+    for run in range(2):
+        # Cold, then warm cache, shared by workers through the database
+        shard_dir = str(tmp_path / 'shards{}'.format(run))
+        paths = extract_triplets_sharded(wiki_data, ENTITIES, shard_dir, shard_size=10, n_process=2,
+                                         nlp=nlp, cache=SentenceCache(cache_path))
+        assert len(paths) == 4
+        triplets = reduce_shards(paths, merge=False, min_subj=1, min_obj=1, drop_self_loops=False)
+        assert (triplets.to_dataframe(categorical=False).values.tolist()
+                == expected.to_dataframe(categorical=False).values.tolist())
+    assert len(SentenceCache(cache_path)) > 0
+
+
+def test_sharded_extraction_resumes(nlp, texts, tmp_path, monkeypatch):
+    wiki_data = _wiki_data(texts)
+    shard_dir = str(tmp_path / 'shards')
+    paths = extract_triplets_sharded(wiki_data[:20], ENTITIES, shard_dir, shard_size=10, nlp=nlp)
+    manifest = load_manifest(shard_dir)
+    assert sorted(manifest) == ['shard-00000.parquet', 'shard-00001.parquet']
+
+    # Completed shards are kept, and only new ones are extracted
+    calls = []
+    pipe = nlp.pipe
+    monkeypatch.setattr(nlp, 'pipe', lambda texts, **kwargs: (calls.append(doc) or doc
+                                                              for doc in pipe(texts, **kwargs)))
+    paths = extract_triplets_sharded(wiki_data, ENTITIES, shard_dir, shard_size=10, nlp=nlp)
+    assert len(paths) == 4
+    assert 0 < len(calls) <= 20
+    assert load_manifest(shard_dir)['shard-00000.parquet'] == manifest['shard-00000.parquet']
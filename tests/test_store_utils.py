@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from store_utils import TripletStore, Vocab
+
+
+def test_encode_missing_values():
+    vocab = Vocab(['p0'])
+    ids = vocab.encode(['p1', None, 'p0', np.nan, 'p1'])
+    assert ids.tolist() == [1, -1, 0, -1, 1]
+    assert vocab.strings == ['p0', 'p1']
+
+
+def test_encode_only_missing_values():
+    vocab = Vocab()
+    assert vocab.encode([None, None]).tolist() == [-1, -1]
+    assert len(vocab) == 0
+
+
+def test_missing_pages_round_trip():
+    triplets = pd.DataFrame({'subject': ['a', 'a', 'b'], 'relation': ['r', 'r', 's'],
+                             'object': ['b', 'c', 'c'], 'page': ['p1', None, 'p2']})
+    store = TripletStore.from_dataframe(triplets)
+    assert store.page.tolist() == [0, -1, 1]
+    pages = store.to_dataframe(categorical=False, provenance=True).page
+    assert pages[0] == 'p1' and pd.isna(pages[1]) and pages[2] == 'p2'
+
+
+def test_missing_pages_categorical():
+    triplets = pd.DataFrame({'subject': ['a', 'b'], 'relation': ['r', 'r'], 'object': ['b', 'c'],
+                             'page': pd.Categorical(['p1', None])})
+    assert TripletStore.from_dataframe(triplets).page.tolist() == [0, -1]
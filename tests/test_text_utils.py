@@ -0,0 +1,46 @@
+import random
+import re
+
+from kg_utils import clean_text, split_windows
+
+
+def _reference_clean(text):
+    """Original sequential cleaning passes of `extract_triplets`
+    """
+    text = re.sub(r'\n+', '. ', text)
+    text = re.sub(r'\[\d+\]', ' ', text)
+    text = re.sub(r'\([^()]*\)', ' ', text)
+    text = re.sub(r'(?<=[.,])(?=[^\s0-9])', r' ', text)
+    return text
+
+
+def _random_markup(rng, n=200):
+    pieces = ['Bayer', ' ', 'AG', '.', ',', '\n', '\n\n', '[1]', '[23]', '[a]', '(', ')', '(since 1863)',
+              '3', '.5', 'x']
+    return ''.join(rng.choice(pieces) for _ in range(n))
+
+
+def test_clean_text_matches_sequential_passes():
+    rng = random.Random(0)
+    for _ in range(500):
+        text = _random_markup(rng)
+        assert clean_text(text) == _reference_clean(text)
+
+
+def test_windows_partition_text():
+    rng = random.Random(0)
+    words = ['Bayer', 'makes', 'aspirin.', 'It', 'is', 'a', 'company.', 'Hans', 'founded', 'it!', 'Why?']
+    for max_chars in (20, 50, 200):
+        for _ in range(50):
+            text = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 150)))
+            text += ' ' + 'x' * rng.randint(0, 3 * max_chars)
+            windows = split_windows(text, max_chars=max_chars, overlap=2)
+            assert ''.join(window[start:] for window, start in windows) == text
+            assert all(len(window) <= max_chars for window, _ in windows)
+
+
+def test_windows_start_with_context_sentences():
+    text = 'One two. Three four. Five six. Seven eight.'
+    windows = split_windows(text, max_chars=32, overlap=1)
+    assert windows == [('One two. Three four. Five six. ', 0), ('Five six. Seven eight.', 10)]
+    assert split_windows(text, max_chars=100) == [(text, 0)]
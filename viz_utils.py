@@ -1,29 +1,52 @@
 import networkx as nx
 import matplotlib.pyplot as plt
 import itertools
+import numpy as np
 
+import instrument_utils as instrument
+from graph_utils import GraphIndex, aggregated_graph, export_graph, force_layout
+from store_utils import TripletStore
 
-def draw_kg(triplets, save_fig=False):
+
+# Graphs with more nodes than this are drawn with `draw_kg_large` by `draw_kg`
+LARGE_GRAPH_NODES = 1000
+
+
+def draw_kg(triplets, save_fig=False, large=None, **kwargs):
     """Method to plot and save full KG using networkx
     
     Parameters
     ----------
-    triplets : pd.DataFrame
+    triplets : pd.DataFrame or store_utils.TripletStore or graph_utils.GraphIndex
         S-R-O triplets dataframe
     save_fig : bool, optional
         Flag for saving figure to /img directory
+    large : bool, optional
+        Flag for using the large graph rendering mode (see `draw_kg_large`), 
+        used for graphs of more than `LARGE_GRAPH_NODES` nodes if None
+    **kwargs
+        Options passed to `draw_kg_large`
     
     References
     ----------
     Adapted from: https://towardsdatascience.com/auto-generated-knowledge-graphs-92ca99a81121
     """
-    # Build networkx graph
-    k_graph = nx.from_pandas_edgelist(triplets, source='subject', target='object', 
-                                      create_using=nx.MultiDiGraph())
-    # Compute node degrees, for resizing highly connected nodes in plot
-    node_deg = nx.degree(k_graph)
+    if isinstance(triplets, GraphIndex):
+        large = True
+    if isinstance(triplets, TripletStore):
+        triplets = triplets.to_dataframe(categorical=False)
+    if large is None:
+        large = len(set(triplets.subject) | set(triplets.object)) > LARGE_GRAPH_NODES
+    if large:
+        return draw_kg_large(triplets, save_fig=save_fig, **kwargs)
+    # Build networkx graph, with one edge per (subject, object) pair weighted by its number of triplets
+    with instrument.timer('viz.graph'):
+        k_graph = aggregated_graph(triplets)
+    # Compute node degrees (counting all triplets), for resizing highly connected nodes in plot
+    node_deg = k_graph.degree(weight='weight')
     # Plot graph
-    layout = nx.spring_layout(k_graph, k=0.15, iterations=20)
+    with instrument.timer('viz.layout'):
+        layout = nx.spring_layout(k_graph, k=0.15, iterations=20)
     plt.figure(num=None, figsize=(120, 90), dpi=80)
     nx.draw_networkx(
         k_graph,
@@ -35,11 +58,8 @@ def draw_kg(triplets, save_fig=False):
         edgecolors='black',
         node_color='white',
     )
-    # Build edge/relationship labels
-    labels = dict(zip(
-        list(zip(triplets.subject, triplets.object)),
-        triplets['relation'].tolist()
-    ))
+    # Build edge/relationship labels (all relations of each edge)
+    labels = nx.get_edge_attributes(k_graph, 'relation')
     # Add edge labels to plot
     nx.draw_networkx_edge_labels(
         k_graph, 
@@ -51,44 +71,110 @@ def draw_kg(triplets, save_fig=False):
     if save_fig:
         plt.savefig("img/kg_full.png", format='png', bbox_inches='tight')
     plt.show()
+
+
+def draw_kg_large(triplets, save_fig=False, max_labels=100, max_edge_labels=50, iterations=50, 
+                  layout_cache=None, figsize=(30, 30), dpi=80, export=None):
+    """Method to plot and save a large KG, with tens of thousands of nodes
+    
+    Nodes are laid out with an approximate force-directed layout (see 
+    `graph_utils.force_layout`), cached by graph fingerprint. All edges are 
+    drawn as a single `LineCollection` and all nodes as a single scatter plot, 
+    and only the `max_labels` highest degree nodes and the `max_edge_labels` 
+    edges with most triplets are labelled. Relations of multi-edges are joined.
+    
+    Parameters
+    ----------
+    triplets : pd.DataFrame or store_utils.TripletStore or graph_utils.GraphIndex
+        S-R-O triplets dataframe
+    save_fig : bool, optional
+        Flag for saving figure to /img directory
+    max_labels : int, optional
+        Number of highest degree nodes labelled
+    max_edge_labels : int, optional
+        Number of edges (with most triplets) labelled with their relations
+    iterations : int, optional
+        Number of layout iterations
+    layout_cache : str, optional
+        Directory of cached layouts, layouts are only cached in memory if None
+    figsize : tuple, optional
+        Size of figure (in inches)
+    dpi : int, optional
+        Resolution of figure
+    export : str, optional
+        Path for also exporting the graph as GraphML, GEXF or self-contained HTML, 
+        depending on its extension (see `graph_utils.export_graph`)
+    """
+    from matplotlib.collections import LineCollection
+    
+    with instrument.timer('viz.graph'):
+        index = triplets if isinstance(triplets, GraphIndex) else GraphIndex(triplets)
+    with instrument.timer('viz.layout'):
+        pos = force_layout(index, iterations=iterations, cache_dir=layout_cache)
+    src, dst = index.edge_sources, index.out_indices
+    degrees = index.degrees()
+    
+    with instrument.timer('viz.draw'):
+        fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
+        # Draw all edges at once
+        ax.add_collection(LineCollection(np.stack([pos[src], pos[dst]], axis=1), 
+                                         colors='red', linewidths=0.3, alpha=0.3))
+        # Draw all nodes at once, resizing highly connected nodes
+        ax.scatter(pos[:, 0], pos[:, 1], s=5 + 5 * np.sqrt(degrees), 
+                   c='white', edgecolors='black', linewidths=0.5, zorder=2)
+        # Label highest degree nodes and edges with most triplets only
+        for i in np.argsort(-degrees, kind='stable')[:max_labels]:
+            ax.annotate(str(index.nodes[i]), pos[i], fontsize=8, zorder=3)
+        weights = index.edge_weights()
+        top_edges = np.argsort(-weights, kind='stable')[:max_edge_labels]
+        for e, label in zip(top_edges, index.edge_labels(top_edges)):
+            ax.annotate(label, (pos[src[e]] + pos[dst[e]]) / 2, fontsize=6, color='red', zorder=3)
+        ax.autoscale()
+    ax.axis('off')
+    if save_fig:
+        plt.savefig("img/kg_full.png", format='png', bbox_inches='tight')
+    if export is not None:
+        with instrument.timer('viz.export'):
+            export_graph(index, export, pos=pos, max_labels=max_labels)
+    plt.show()
     
 
-def draw_kg_subgraph(triplets, node, n_hops=2, verbose=True, save_fig=False):
+def draw_kg_subgraph(triplets, node, n_hops=2, verbose=True, save_fig=False, direction='out'):
     """Method to plot and save KG subgraph centered around a given node
     
     The subgraph around the node is build using all relationships 
-    that are at `n_hop` hops around the node in a DFS tree, 
-    i.e., those nodes that are reachable from given node in `n_hop` hops.
+    between the nodes that are within `n_hops` hops of the node, 
+    i.e., those nodes that are reachable from given node in `n_hop` hops
+    (see `graph_utils.GraphIndex.ego`).
     
     Parameters
     ----------
-    triplets : pd.DataFrame
-        S-R-O triplets dataframe
+    triplets : pd.DataFrame or store_utils.TripletStore or graph_utils.GraphIndex
+        S-R-O triplets dataframe, or an index built from it once 
+        (recommended when drawing several subgraphs)
     node : str
         Node for which subgraph is computed
     n_hops : int, optional
-        Number of hops for DFS neighborhood construction
+        Number of hops for BFS neighborhood construction
     verbose : bool, optional
         Flag to print S-R-O triplets associated with node
     save_fig : bool, optional
         Flag for saving figure to /img directory
+    direction : str, optional
+        Edges followed from node: 'out' (to objects), 'in' (to subjects), or 'both'
     
     References
     ----------
     Adapted from: https://towardsdatascience.com/auto-generated-knowledge-graphs-92ca99a81121
     """
-    # Build networkx graph
-    k_graph = nx.from_pandas_edgelist(triplets, source='subject', target='object', 
-                                      create_using=nx.MultiDiGraph())
-    # Build subgraph nodes list
-    nodes = [node]
-    # Add n-hop DFS successors
-    dfs_suc = list(nx.dfs_successors(k_graph, node).values())
-    if len(dfs_suc) > 0:
-        for hop in range(n_hops):
-            nodes += dfs_suc[hop]
-    # Build subgraph
-    subgraph = k_graph.subgraph(nodes)
+    with instrument.timer('viz.graph'):
+        index = triplets if isinstance(triplets, GraphIndex) else GraphIndex(triplets)
+        # Build subgraph nodes list: n-hop BFS neighbourhood
+        nodes = list(index.ego(node, n_hops, direction))
+        # Build subgraph from the triplets between these nodes
+        subtriplets = index.subgraph_triplets(nodes)
+        subgraph = aggregated_graph(subtriplets)
+        subgraph.add_nodes_from(nodes)
     # Plot subgraph
     layout = nx.circular_layout(subgraph)
     plt.figure(num=None, figsize=(10, 10), dpi=80)
@@ -102,13 +188,8 @@ def draw_kg_subgraph(triplets, node, n_hops=2, verbose=True, save_fig=False):
         edgecolors='black',
         node_color='white'
     )
-    # Build edge/relationship labels
-    labels = dict(zip(
-        (list(zip(triplets.subject, triplets.object))),
-        triplets['relation'].tolist()
-    ))
-    edges = tuple(subgraph.out_edges(data=False))
-    sublabels = {k: labels[k] for k in edges}
+    # Build edge/relationship labels (all relations of each edge)
+    sublabels = nx.get_edge_attributes(subgraph, 'relation')
     if verbose:
         for pair in sublabels.keys():
             print("\nS-R-O:\n", pair[0], "-", sublabels[pair], "-", pair[1])